@@ -0,0 +1,12 @@
+-- CreateTable
+CREATE TABLE "TrackEmbedding" (
+    "trackId" TEXT NOT NULL,
+    "modelVersion" TEXT NOT NULL,
+    "embedding" REAL[],
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "TrackEmbedding_pkey" PRIMARY KEY ("trackId","modelVersion")
+);
+
+-- CreateIndex
+CREATE INDEX "TrackEmbedding_modelVersion_idx" ON "TrackEmbedding"("modelVersion");
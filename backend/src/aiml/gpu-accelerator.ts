@@ -44,6 +44,8 @@ export interface TrainingResults {
   accuracy: number[];
   memory_usage_mb?: number | null;
   gpu_utilization?: number | null;
+  // Exported TorchScript model of this run (jobs/<id>/model.pt); pass it to --action infer
+  model_path?: string | null;
   gpu_stats?: Array<{
     epoch: number;
     memory_allocated_mb: number;
@@ -51,9 +53,56 @@ export interface TrainingResults {
     gpu_utilization: number | null;
     epoch_time_seconds: number;
   }> | null;
+  memory_profile?: {
+    pid: number;
+    budgets_mb: Record<string, number>;
+    peak_rss_mb: number | null;
+    stages: Array<{
+      stage: string;
+      budget_mb: number | null;
+      rss_start_mb: number | null;
+      rss_end_mb: number | null;
+      peak_rss_mb: number;
+      seconds: number;
+      exceeded_budget: boolean;
+      tracemalloc_peak_mb?: number;
+      top_allocations?: Array<{ location: string; size_mb: number; count: number }>;
+    }>;
+  } | null;
   error?: string;
 }
 
+export type TrainingJobStatus = 'queued' | 'running' | 'done' | 'failed' | 'cancelled';
+
+export interface TrainingJob {
+  id: number;
+  kind: 'train' | 'bench';
+  status: TrainingJobStatus;
+  config: any;
+  data_path: string | null;
+  threads: number | null;
+  memory_mb: number | null;
+  submitted_at: number;
+  started_at: number | null;
+  finished_at: number | null;
+  cancel_requested: boolean;
+  result: TrainingResults | null;
+  error: string | null;
+  deduplicated?: boolean;
+}
+
+export interface TrainingJobOptions {
+  threads?: number;     // Thread budget of the job (default: CPUs / worker limit)
+  memoryMb?: number;    // Memory budget; the job is killed above it
+}
+
+// Shared Python training utilities (backend/tools)
+const TOOLS_DIR = path.join(__dirname, '..', '..', 'tools');
+
+// Training requests go through the job scheduler, which limits concurrent runs
+// and returns cached results of identical requests
+const JOB_SCHEDULER_PATH = path.join(TOOLS_DIR, 'job_scheduler.py');
+
 // Helper function to run Python command and return JSON result
 async function runPythonCommand(
   scriptPath: string, 
@@ -87,19 +136,24 @@ async function runPythonCommand(
 
     // Run the Python process
     console.log(`Running: ${pythonPath} ${gpuScriptPath} ${args.join(' ')}`);
-    const process = spawn(pythonPath, [gpuScriptPath, ...args]);
+    // gpu_accelerator.py imports the shared training utilities in backend/tools
+    const env = {
+      ...process.env,
+      PYTHONPATH: [TOOLS_DIR, process.env.PYTHONPATH].filter(Boolean).join(path.delimiter)
+    };
+    const child = spawn(pythonPath, [gpuScriptPath, ...args], { env });
     let stdout = '';
     let stderr = '';
 
-    process.stdout.on('data', (data) => {
+    child.stdout.on('data', (data) => {
       stdout += data.toString();
     });
 
-    process.stderr.on('data', (data) => {
+    child.stderr.on('data', (data) => {
       stderr += data.toString();
     });
 
-    process.on('close', (code) => {
+    child.on('close', (code) => {
       // Clean up temporary file if created
       if (tempFilePath && fs.existsSync(tempFilePath)) {
         try {
@@ -127,7 +181,7 @@ async function runPythonCommand(
       }
     });
 
-    process.on('error', (error) => {
+    child.on('error', (error) => {
       // Try with alternative Python commands if available
       if (pythonBinaries.length > 1) {
         const alternative = pythonBinaries.shift();
@@ -183,36 +237,63 @@ export async function testGPU(): Promise<any> {
   }
 }
 
+/**
+ * Scheduler arguments for job budgets
+ */
+function jobOptionArgs(options: TrainingJobOptions): string[] {
+  const args: string[] = [];
+  if (options.threads) {
+    args.push('--threads', String(options.threads));
+  }
+  if (options.memoryMb) {
+    args.push('--memory-mb', String(options.memoryMb));
+  }
+  return args;
+}
+
+/**
+ * Enhanced configuration with mixed precision support
+ */
+function enhanceTrainingConfig(config: any): any {
+  return {
+    ...config,
+    use_mixed_precision: true,  // Enable mixed precision training by default
+    optimize_memory: true       // Enable memory optimization
+  };
+}
+
 /**
  * Train a model using GPU acceleration
+ *
+ * The run is queued in the local job scheduler, so concurrent calls wait for a
+ * free worker instead of oversubscribing the machine, and an identical earlier
+ * request (same config and data) returns its cached result.
  * @param config Configuration for the training
  * @param trainingData Optional training data
  * @param modelOutputPath Optional path to save the model
+ * @param options Optional thread/memory budgets
  */
 export async function trainWithGPU(
   config: any,
   trainingData?: any,
-  modelOutputPath?: string
+  modelOutputPath?: string,
+  options: TrainingJobOptions = {}
 ): Promise<TrainingResults> {
   try {
-    const scriptPath = path.join(__dirname, 'python', 'gpu_accelerator.py');
-    const args = ['--action', 'train'];
+    const args = ['submit', '--kind', 'train', '--wait', ...jobOptionArgs(options)];
     
     if (modelOutputPath) {
       args.push('--output', modelOutputPath);
     }
 
-    // Enhanced configuration with mixed precision support
-    const enhancedConfig = {
-      ...config,
-      use_mixed_precision: true,  // Enable mixed precision training by default
-      optimize_memory: true       // Enable memory optimization
-    };
-
-    const result = await runPythonCommand(scriptPath, args, {
-      config: enhancedConfig,
+    const job: TrainingJob = await runPythonCommand(JOB_SCHEDULER_PATH, args, {
+      config: enhanceTrainingConfig(config),
       training_data: trainingData || null
     });
+    if (job.deduplicated) {
+      console.log(`Training job ${job.id} matched an earlier identical request`);
+    }
+    const result: TrainingResults = job.result || { error: job.error || `Training job ${job.status}` } as TrainingResults;
     
     // Log detailed GPU performance metrics if available
     if (result.gpu_stats && result.gpu_stats.length > 0) {
@@ -230,6 +311,51 @@ export async function trainWithGPU(
   }
 }
 
+/**
+ * Queue a training run without waiting for it; poll it with getTrainingJobStatus
+ *
+ * Unless a worker is already alive, the scheduler starts a detached one that
+ * runs queued jobs under the concurrency limit and exits once the queue is empty.
+ * @param config Configuration for the training
+ * @param trainingData Optional training data
+ * @param options Optional thread/memory budgets
+ */
+export async function submitTrainingJob(
+  config: any,
+  trainingData?: any,
+  options: TrainingJobOptions = {}
+): Promise<TrainingJob> {
+  const args = ['submit', '--kind', 'train', '--detach', ...jobOptionArgs(options)];
+  return await runPythonCommand(JOB_SCHEDULER_PATH, args, {
+    config: enhanceTrainingConfig(config),
+    training_data: trainingData || null
+  });
+}
+
+/**
+ * Set how many training jobs may run at once on this machine
+ *
+ * The limit is stored in the scheduler's queue, so it applies to every caller
+ * and worker process, including workers that are already running.
+ */
+export async function setTrainingWorkerLimit(workers: number): Promise<{ workers: number; live_workers: number[] }> {
+  return await runPythonCommand(JOB_SCHEDULER_PATH, ['config', '--workers', String(workers)]);
+}
+
+/**
+ * Current state of a queued training job, including its result once done
+ */
+export async function getTrainingJobStatus(jobId: number): Promise<TrainingJob> {
+  return await runPythonCommand(JOB_SCHEDULER_PATH, ['status', '--job', String(jobId)]);
+}
+
+/**
+ * Cancel a queued training job, or stop it if it is already running
+ */
+export async function cancelTrainingJob(jobId: number): Promise<TrainingJob> {
+  return await runPythonCommand(JOB_SCHEDULER_PATH, ['cancel', '--job', String(jobId)]);
+}
+
 /**
  * Calculate average GPU utilization from epoch stats
  */
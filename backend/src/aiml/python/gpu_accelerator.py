@@ -4,7 +4,8 @@ GPU Accelerator Script for Audotics
 
 This script provides GPU acceleration for the Audotics project.
 It interfaces with TypeScript through JSON and provides functionality
-for checking GPU info, testing GPU performance, and accelerating model training.
+for checking GPU info, testing GPU performance, accelerating model training
+and batched inference with the exported (TorchScript) model.
 """
 
 import os
@@ -12,6 +13,7 @@ import sys
 import json
 import time
 import math
+import random
 import argparse
 import traceback
 import platform
@@ -30,6 +32,36 @@ try:
 except ImportError:
     HAS_PYNVML = False
 
+BACKEND_DIR = Path(__file__).resolve().parents[3]
+
+# Shared training utilities live in backend/tools. Callers put it on PYTHONPATH
+# (gpu-accelerator.ts and job_scheduler.py do), so nothing depends on sys.path edits.
+TOOLS_DIR = BACKEND_DIR / 'tools'
+try:
+    from memory_profiling import MemoryProfiler, current_rss_mb, parse_budgets
+    from autotune import (
+        autotune,
+        default_thread_counts,
+        geometric_range,
+        is_out_of_memory,
+        scale_learning_rate,
+        total_memory_mb,
+        warmup_factor
+    )
+    from training_state import latest_snapshot, prune_snapshots, snapshot_path, write_atomically
+except ModuleNotFoundError as e:
+    raise ModuleNotFoundError(
+        f"{e}; gpu_accelerator.py needs the training tools on PYTHONPATH (PYTHONPATH={TOOLS_DIR})"
+    ) from e
+
+# Untimed steps before each autotune probe (cuDNN autotuning, allocator warmup)
+AUTOTUNE_WARMUP_STEPS = 3
+
+# Where a trained model is exported without model_path, independent of the working directory.
+# Jobs run by job_scheduler.py always export to their own jobs/<id>/model.pt instead,
+# so infer on a scheduled job's model needs the job's result.model_path.
+DEFAULT_MODEL_PATH = str(BACKEND_DIR / 'data' / 'models' / 'gpu_model.pt')
+
 def init_nvml():
     """Initialize NVML for GPU monitoring"""
     if HAS_PYNVML:
@@ -244,9 +276,281 @@ class SimpleDataset:
         
         return batch_x, batch_y
 
+def make_torch_probe(build_model, data, targets, device, criterion, learning_rate, steps,
+                     use_mixed_precision=False):
+    """
+    Probe function for autotune() that times training steps of a fresh model
+    
+    Peak memory is peak CUDA memory on the GPU and peak process RSS on the CPU
+    (as in the TensorFlow probes).
+    
+    Args:
+        build_model: Callable returning a new model
+        data: Training inputs
+        targets: Training labels
+        device: torch.device to train on
+        criterion: Loss function
+        learning_rate: Probe optimizer learning rate
+        steps: Timed steps per probe
+        use_mixed_precision: Use autocast and gradient scaling (CUDA only)
+    """
+    import torch
+    import torch.optim as optim
+    
+    use_cuda = device.type == 'cuda'
+    
+    def probe(threads, batch_sizes):
+        torch.set_num_threads(threads)
+        for batch_size in batch_sizes:
+            model = optimizer = None
+            profiler = MemoryProfiler(enabled=not use_cuda, trace_allocations=False)
+            try:
+                if use_cuda:
+                    torch.cuda.empty_cache()
+                    torch.cuda.reset_peak_memory_stats()
+                dataset = SimpleDataset(data, targets, batch_size)
+                model = build_model().to(device)
+                optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+                scaler = torch.cuda.amp.GradScaler() if use_mixed_precision and use_cuda else None
+                
+                with profiler.stage(f'autotune_batch_{batch_size}'):
+                    for step in range(AUTOTUNE_WARMUP_STEPS + steps):
+                        if step == AUTOTUNE_WARMUP_STEPS:
+                            if use_cuda:
+                                torch.cuda.synchronize()
+                            start_time = time.perf_counter()
+                        inputs, labels = dataset.get_batch(step % len(dataset))
+                        inputs, labels = inputs.to(device), labels.to(device)
+                        optimizer.zero_grad()
+                        if scaler is not None:
+                            with torch.cuda.amp.autocast():
+                                loss = criterion(model(inputs), labels)
+                            scaler.scale(loss).backward()
+                            scaler.step(optimizer)
+                            scaler.update()
+                        else:
+                            loss = criterion(model(inputs), labels)
+                            loss.backward()
+                            optimizer.step()
+                    if use_cuda:
+                        torch.cuda.synchronize()
+                    seconds = time.perf_counter() - start_time
+            except Exception as e:
+                if not is_out_of_memory(e):
+                    raise
+                yield {'batch_size': batch_size, 'error': f'out of memory: {type(e).__name__}'}
+                return
+            finally:
+                del model, optimizer
+            
+            yield {
+                'batch_size': batch_size,
+                'samples_per_second': steps * min(batch_size, len(data)) / seconds,
+                'peak_memory_mb': round(torch.cuda.max_memory_allocated() / (1024 * 1024) if use_cuda
+                                        else profiler.stages[-1]['peak_rss_mb'], 1)
+            }
+    
+    return probe
+
+def fold_batch_norm(model):
+    """
+    CPU copy of a model in eval mode with each BatchNorm1d folded into the Linear before it
+    
+    Children must be registered in forward order, as in NeuralNet. Every folded
+    BatchNorm is replaced by an identity.
+    """
+    import copy
+    import torch
+    import torch.nn as nn
+    
+    folded = copy.deepcopy(model).cpu().eval()
+    previous = None
+    for name, module in list(folded.named_children()):
+        if isinstance(module, nn.BatchNorm1d) and isinstance(previous, nn.Linear):
+            with torch.no_grad():
+                # bn(x W^T + b) == x (s W)^T + (b - mean) * s + beta, s = gamma / sqrt(var + eps)
+                gamma = module.weight if module.affine else torch.ones_like(module.running_var)
+                beta = module.bias if module.affine else torch.zeros_like(module.running_mean)
+                scale = gamma / torch.sqrt(module.running_var + module.eps)
+                bias = previous.bias if previous.bias is not None else torch.zeros_like(module.running_mean)
+                previous.weight.mul_(scale[:, None])
+                previous.bias = nn.Parameter((bias - module.running_mean) * scale + beta)
+            setattr(folded, name, nn.Identity())
+        previous = module
+    return folded
+
+def export_torchscript(model, path, metadata, check_rows=256):
+    """
+    Save a trained model as a frozen TorchScript module for inference
+    
+    BatchNorm is folded into the Linear layers and Dropout is dropped (eval mode),
+    so the saved graph is a chain of matmuls and activations. The metadata is
+    stored inside the file, so load_torchscript() needs no model class.
+    
+    Args:
+        model: Trained model (any device, any mode; it is not modified)
+        path: Output .pt path, written atomically
+        metadata: JSON-serializable dictionary; must contain input_size
+        check_rows: Random rows on which the export is compared with the model
+    
+    Returns:
+        Maximum absolute difference between export and eval-mode model outputs
+    """
+    import copy
+    import torch
+    
+    exported = torch.jit.freeze(torch.jit.script(fold_batch_norm(model)))
+    
+    reference = copy.deepcopy(model).cpu().eval()
+    inputs = torch.randn(check_rows, metadata['input_size'])
+    with torch.inference_mode():
+        max_error = float((exported(inputs) - reference(inputs)).abs().max())
+    
+    extra_files = {'metadata.json': json.dumps(metadata)}
+    write_atomically(path, lambda f: torch.jit.save(exported, f, _extra_files=extra_files))
+    return max_error
+
+def load_torchscript(path):
+    """
+    Load a model written by export_torchscript onto the CPU
+    
+    Returns:
+        Tuple of (TorchScript module, metadata dictionary)
+    """
+    import torch
+    
+    extra_files = {'metadata.json': ''}
+    model = torch.jit.load(str(path), map_location='cpu', _extra_files=extra_files)
+    return model, json.loads(extra_files['metadata.json'] or '{}')
+
+def load_inference_inputs(path):
+    """Feature rows from a .npy matrix (memory-mapped) or a JSON file ({"data": rows} or rows)"""
+    import numpy as np
+    
+    if str(path).endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    with open(path, 'r') as f:
+        payload = json.load(f)
+    rows = payload.get('data', []) if isinstance(payload, dict) else payload
+    return np.asarray(rows, dtype=np.float32)
+
+class PredictionWriter:
+    """Streams score batches to a .npy file (preallocated, written in place) or JSON lines"""
+    def __init__(self, path, rows, columns):
+        import numpy as np
+        
+        self.path = path
+        self.array = None
+        self.file = None
+        if path is None:
+            return
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        if str(path).endswith('.npy'):
+            self.array = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(rows, columns))
+        else:
+            self.file = open(path, 'w')
+    
+    def write(self, start, scores):
+        """Write the scores of rows start .. start + len(scores); JSON lines must come in order"""
+        if self.array is not None:
+            self.array[start:start + len(scores)] = scores
+        elif self.file is not None:
+            labels = scores.argmax(axis=1)
+            self.file.writelines(
+                json.dumps({'label': int(label), 'scores': row.tolist()}) + '\n'
+                for label, row in zip(labels, scores)
+            )
+    
+    def close(self):
+        if self.array is not None:
+            self.array.flush()
+            del self.array
+            self.array = None
+        elif self.file is not None:
+            self.file.close()
+            self.file = None
+
+def run_inference(config, data_path, predictions_path=None):
+    """
+    Score feature rows with an exported TorchScript model
+    
+    Batches run in a pool of worker threads (TorchScript releases the GIL), each
+    under torch.inference_mode. Cores are split between the workers, so they do
+    not oversubscribe the CPU. At most 2 * workers batches are in flight, and
+    finished batches are written in input order, so memory stays bounded for
+    any input size.
+    
+    Args:
+        config: Configuration with model_path, inference_batch_size and inference_workers
+        data_path: .npy matrix or JSON file of feature rows
+        predictions_path: Optional .npy or .jsonl output for the scores
+    
+    Returns:
+        Dictionary with row count, throughput and settings, or an error
+    """
+    import numpy as np
+    import torch
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    
+    model_path = config.get("model_path", DEFAULT_MODEL_PATH)
+    batch_size = config.get("inference_batch_size", 4096)
+    workers = config.get("inference_workers") or min(4, os.cpu_count() or 1)
+    
+    if not data_path:
+        return {"error": "Inference needs --data (a .npy matrix or a JSON file of rows)"}
+    if not Path(model_path).exists():
+        return {"error": f"No exported model at {model_path}; pass the model_path of the training result"}
+    
+    start_time = time.perf_counter()
+    model, metadata = load_torchscript(model_path)
+    load_ms = (time.perf_counter() - start_time) * 1000
+    
+    try:
+        features = load_inference_inputs(data_path)
+    except Exception as e:
+        return {"error": f"Could not read inference input {data_path}: {e}"}
+    if features.ndim != 2 or features.shape[1] != metadata.get('input_size', features.shape[-1]):
+        return {"error": f"Expected rows of {metadata.get('input_size')} features, got shape {list(features.shape)}"}
+    
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    torch.set_num_threads(threads_per_worker)
+    
+    def score(start):
+        batch = torch.from_numpy(np.ascontiguousarray(features[start:start + batch_size], dtype=np.float32))
+        with torch.inference_mode():
+            return start, model(batch).numpy()
+    
+    writer = PredictionWriter(predictions_path, len(features), metadata.get('output_size', 1))
+    start_time = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for start in range(0, len(features), batch_size):
+                pending.append(executor.submit(score, start))
+                if len(pending) >= 2 * workers:
+                    writer.write(*pending.popleft().result())
+            while pending:
+                writer.write(*pending.popleft().result())
+    finally:
+        writer.close()
+    seconds = time.perf_counter() - start_time
+    
+    return {
+        "model_path": str(model_path),
+        "rows": len(features),
+        "batch_size": batch_size,
+        "workers": workers,
+        "threads_per_worker": threads_per_worker,
+        "load_ms": round(load_ms, 3),
+        "inference_seconds": round(seconds, 3),
+        "rows_per_second": round(len(features) / seconds) if seconds > 0 else None,
+        "predictions": predictions_path
+    }
+
 def accelerate_training(config, training_data=None):
     """
-    Accelerate model training using GPU
+    Accelerate model training using GPU, or train on the CPU when CUDA is missing
     
     Args:
         config: Training configuration with parameters
@@ -257,17 +561,15 @@ def accelerate_training(config, training_data=None):
     """
     import torch
     import torch.nn as nn
-    import torch.optim as optim
     
-    # Check if GPU is available
-    if not torch.cuda.is_available():
-        return {
-            "device": "cpu",
-            "error": "CUDA not available for PyTorch"
-        }
+    # Train on the GPU if there is one; AMP, cuDNN and CUDA memory stats are GPU-only
+    use_cuda = torch.cuda.is_available()
+    device_name = "cuda" if use_cuda else "cpu"
+    if not use_cuda:
+        print("CUDA not available for PyTorch, training on the CPU", file=sys.stderr)
         
     # Initialize GPU monitoring if available
-    has_monitoring = init_nvml()
+    has_monitoring = use_cuda and init_nvml()
     
     # Get configuration parameters with defaults
     input_size = config.get("input_size", 784)  # Default for MNIST
@@ -276,8 +578,35 @@ def accelerate_training(config, training_data=None):
     batch_size = config.get("batch_size", 32)
     epochs = config.get("epochs", 5)
     learning_rate = config.get("learning_rate", 0.001)
-    use_mixed_precision = config.get("use_mixed_precision", True)
+    use_mixed_precision = config.get("use_mixed_precision", True) and use_cuda
     optimize_memory = config.get("optimize_memory", True)
+    model_path = config.get("model_path", DEFAULT_MODEL_PATH)
+    
+    # Optional large-batch mode: accumulated gradients and a layer-wise adaptive optimizer
+    accumulation_steps = max(1, config.get("accumulation_steps", 1))
+    optimizer_name = config.get("optimizer", "adam")
+    weight_decay = config.get("weight_decay", 0.0)
+    large_batch = accumulation_steps > 1 or optimizer_name != "adam"
+    
+    # Optional batch size / thread count autotuning with learning rate scaling
+    use_autotune = config.get("autotune", False)
+    warmup_epochs = config.get("warmup_epochs", 1.0 if use_autotune or large_batch else 0.0)
+    autotune_result = None
+    
+    # Optional crash-safe training state snapshots and exact resume
+    snapshot_every = config.get("snapshot_every", 0)
+    snapshot_dir = config.get("snapshot_dir", "../data/models/training_state_gpu")
+    resume = config.get("resume", False)
+    seed = config.get("seed", 42)
+    exact = bool(snapshot_every or resume)
+    
+    # Optional per-stage memory profiling and budgets (MB, matched by stage prefix)
+    memory_budgets = config.get("memory_budgets", {})
+    profiler = MemoryProfiler(
+        enabled=bool(config.get("profile_memory", False) or memory_budgets),
+        budgets=memory_budgets,
+        trace_allocations=config.get("profile_memory", False)
+    )
     
     # Define a simple neural network model
     class NeuralNet(nn.Module):
@@ -343,126 +672,298 @@ def accelerate_training(config, training_data=None):
     gpu_stats = []
     
     try:
-        # Generate dummy data if no training data is provided
-        if training_data is None:
+        if exact:
+            # A reproducible run: seeded data, initialization and dropout
             import numpy as np
-            # Create dummy training data (as a simplified MNIST-like dataset)
-            num_samples = 10000
-            data = np.random.randn(num_samples, input_size).astype(np.float32)
-            targets = np.random.randint(0, output_size, size=num_samples).astype(np.int64)
-        else:
-            data = training_data.get("data", [])
-            targets = training_data.get("targets", [])
+            random.seed(seed)
+            np.random.seed(seed)
+            torch.manual_seed(seed)
+        
+        with profiler.stage('dataset_build'):
+            # Generate dummy data if no training data is provided
+            if training_data is None:
+                import numpy as np
+                # Create dummy training data (as a simplified MNIST-like dataset)
+                num_samples = 10000
+                data = np.random.randn(num_samples, input_size).astype(np.float32)
+                targets = np.random.randint(0, output_size, size=num_samples).astype(np.int64)
+            else:
+                data = training_data.get("data", [])
+                targets = training_data.get("targets", [])
+                
+            # Create dataset
+            dataset = SimpleDataset(data, targets, batch_size)
+        
+        with profiler.stage('model_setup'):
+            # Move model to the training device
+            device = torch.device(device_name)
+            model = NeuralNet().to(device)
+            criterion = nn.CrossEntropyLoss()
+        
+        resume_state = None
+        if resume:
+            resume_path = latest_snapshot(snapshot_dir)
+            if resume_path is None:
+                print(f"No training state in {snapshot_dir}, starting from scratch", file=sys.stderr)
+            else:
+                resume_state = torch.load(resume_path, map_location=device, weights_only=False)
+                print(f"Resuming from {resume_path} (epoch {resume_state['epoch'] + 1}, "
+                      f"batch {resume_state['cursor']}, step {resume_state['step']})", file=sys.stderr)
+                # The cursor counts batches, so the run continues with the snapshot's settings
+                batch_size = resume_state['batch_size']
+                learning_rate = resume_state['learning_rate']
+                warmup_epochs = resume_state['warmup_epochs']
+                accumulation_steps = resume_state.get('accumulation_steps', 1)
+                optimizer_name = resume_state.get('optimizer_name', 'adam')
+                weight_decay = resume_state.get('weight_decay', 0.0)
+                dataset = SimpleDataset(data, targets, batch_size)
+        
+        if use_autotune and resume_state is None:
+            with profiler.stage('autotune'):
+                memory_budget = config.get("autotune_memory_mb")
+                if memory_budget is None and use_cuda:
+                    memory_budget = 0.9 * torch.cuda.get_device_properties(0).total_memory / (1024 * 1024)
+                elif memory_budget is None:
+                    # CPU probes measure peak RSS, budgeted like the TensorFlow probes
+                    memory_budget = (total_memory_mb() or 0) * 0.8 or None
+                probe = make_torch_probe(
+                    NeuralNet, data, targets, device, criterion, learning_rate,
+                    steps=config.get("autotune_steps", 20),
+                    use_mixed_precision=use_mixed_precision
+                )
+                batch_sizes = geometric_range(batch_size, min(config.get("autotune_max_batch_size", 8192), len(data)))
+                autotune_result = autotune(probe, batch_sizes, default_thread_counts(),
+                                           memory_budget_mb=memory_budget)
             
-        # Create dataset
-        dataset = SimpleDataset(data, targets, batch_size)
+            base_batch_size, base_learning_rate = batch_size, learning_rate
+            batch_size = autotune_result["batch_size"]
+            learning_rate = scale_learning_rate(
+                base_learning_rate, base_batch_size, batch_size, config.get("lr_scaling", "sqrt")
+            )
+            torch.set_num_threads(autotune_result["threads"])
+            dataset = SimpleDataset(data, targets, batch_size)
+            autotune_result.update({
+                "base_batch_size": base_batch_size,
+                "base_learning_rate": base_learning_rate,
+                "learning_rate": learning_rate,
+                "lr_scaling": config.get("lr_scaling", "sqrt"),
+                "warmup_epochs": warmup_epochs
+            })
+            print(f"Autotuned batch_size={batch_size}, threads={autotune_result['threads']}, "
+                  f"learning_rate={learning_rate:.6g}", file=sys.stderr)
+        
+        if accumulation_steps > 1 and resume_state is None:
+            learning_rate = scale_learning_rate(
+                learning_rate, batch_size, batch_size * accumulation_steps, config.get("lr_scaling", "sqrt")
+            )
+            print(f"Effective batch size {batch_size * accumulation_steps} ({accumulation_steps} x {batch_size}), "
+                  f"learning_rate={learning_rate:.6g}", file=sys.stderr)
         
-        # Move model to GPU
-        device = torch.device("cuda")
-        model = NeuralNet().to(device)
-        criterion = nn.CrossEntropyLoss()
-        optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+        from torch_large_batch import build_torch_optimizer, window_loss_weight
+        optimizer = build_torch_optimizer(optimizer_name, model.parameters(), learning_rate, weight_decay)
+        # Warmup and snapshots count optimizer steps, one per accumulation window
+        warmup_steps = math.ceil(warmup_epochs * len(dataset) / accumulation_steps)
+        global_step = 0
         
         # Setup mixed precision training if requested
         scaler = torch.cuda.amp.GradScaler() if use_mixed_precision else None
         
         # Optimize memory usage
-        if optimize_memory:
-            # Enable cuDNN benchmark for optimized kernels
-            torch.backends.cudnn.benchmark = True
+        if optimize_memory and use_cuda:
+            # Enable cuDNN benchmark for optimized kernels (autotuned kernels are not reproducible)
+            torch.backends.cudnn.benchmark = not exact
             
             # Clear GPU cache
             torch.cuda.empty_cache()
+        if exact and use_cuda:
+            torch.backends.cudnn.deterministic = True
+        
+        start_epoch, cursor = 0, 0
+        if resume_state is not None:
+            model.load_state_dict(resume_state['model'])
+            optimizer.load_state_dict(resume_state['optimizer'])
+            if scaler is not None and resume_state['scaler'] is not None:
+                scaler.load_state_dict(resume_state['scaler'])
+            global_step, start_epoch, cursor = resume_state['step'], resume_state['epoch'], resume_state['cursor']
+            loss_history = resume_state['loss_history']
+            accuracy_history = resume_state['accuracy_history']
+            gpu_stats = resume_state['gpu_stats']
+            dataset.indices = resume_state['indices']
+            random.setstate(resume_state['python_rng'])
+            torch.set_rng_state(resume_state['torch_rng'].cpu())
+            if use_cuda and resume_state['cuda_rng'] is not None:
+                torch.cuda.set_rng_state_all([state.cpu() for state in resume_state['cuda_rng']])
+        
+        def save_snapshot(epoch, cursor, metrics):
+            """Atomically save everything needed to continue after global_step steps"""
+            state = {
+                'model': model.state_dict(),
+                'optimizer': optimizer.state_dict(),
+                'scaler': scaler.state_dict() if scaler is not None else None,
+                'step': global_step,
+                'epoch': epoch,
+                'cursor': cursor,
+                'metrics': metrics,
+                'indices': list(dataset.indices),
+                'loss_history': loss_history,
+                'accuracy_history': accuracy_history,
+                'gpu_stats': gpu_stats,
+                'batch_size': batch_size,
+                'learning_rate': learning_rate,
+                'warmup_epochs': warmup_epochs,
+                'accumulation_steps': accumulation_steps,
+                'optimizer_name': optimizer_name,
+                'weight_decay': weight_decay,
+                'python_rng': random.getstate(),
+                'torch_rng': torch.get_rng_state(),
+                'cuda_rng': torch.cuda.get_rng_state_all() if use_cuda else None
+            }
+            write_atomically(snapshot_path(snapshot_dir, global_step, '.pt'), lambda f: torch.save(state, f))
+            prune_snapshots(snapshot_dir)
         
         # Main training loop
         start_time = time.time()
         
-        for epoch in range(epochs):
-            epoch_start = time.time()
-            dataset.shuffle()
-            running_loss = 0.0
-            correct = 0
-            total = 0
-            
-            # Record GPU stats at the beginning of the epoch
-            if has_monitoring:
-                gpu_utilization = get_gpu_utilization()
-                memory_allocated = torch.cuda.memory_allocated() / (1024 * 1024)
-                memory_reserved = torch.cuda.memory_reserved() / (1024 * 1024)
-            else:
-                gpu_utilization = None
-                memory_allocated = torch.cuda.memory_allocated() / (1024 * 1024)
-                memory_reserved = torch.cuda.memory_reserved() / (1024 * 1024)
-            
-            # Train through batches
-            for i in range(len(dataset)):
-                # Get batch and move to GPU
-                inputs, labels = dataset.get_batch(i)
-                inputs, labels = inputs.to(device), labels.to(device)
+        for epoch in range(start_epoch, epochs):
+            with profiler.stage(f'epoch_{epoch + 1}'):
+                epoch_start = time.time()
+                if epoch == start_epoch and cursor:
+                    # Resumed mid-epoch: the data order and running sums come from the snapshot
+                    running_loss, correct, total = resume_state['metrics']
+                    first_batch = cursor
+                else:
+                    dataset.shuffle()
+                    running_loss = 0.0
+                    correct = 0
+                    total = 0
+                    first_batch = 0
                 
-                # Zero gradients
-                optimizer.zero_grad()
+                # Record GPU stats at the beginning of the epoch (process RSS on the CPU)
+                if has_monitoring:
+                    gpu_utilization = get_gpu_utilization()
+                    memory_allocated = torch.cuda.memory_allocated() / (1024 * 1024)
+                    memory_reserved = torch.cuda.memory_reserved() / (1024 * 1024)
+                elif use_cuda:
+                    gpu_utilization = None
+                    memory_allocated = torch.cuda.memory_allocated() / (1024 * 1024)
+                    memory_reserved = torch.cuda.memory_reserved() / (1024 * 1024)
+                else:
+                    gpu_utilization = None
+                    memory_allocated = memory_reserved = current_rss_mb() or 0
                 
-                # Forward pass - use mixed precision if enabled
-                if use_mixed_precision:
-                    with torch.cuda.amp.autocast():
+                # Train through batches; every window of accumulation_steps batches is one step
+                for i in range(first_batch, len(dataset)):
+                    # Get batch and move to GPU
+                    inputs, labels = dataset.get_batch(i)
+                    inputs, labels = inputs.to(device), labels.to(device)
+                    
+                    window_start = i - i % accumulation_steps
+                    window_end = min(window_start + accumulation_steps, len(dataset))
+                    window_rows = min(window_end * batch_size, dataset.n_samples) - window_start * batch_size
+                    step_now = i + 1 == window_end
+                    
+                    # Zero gradients at the start of a window
+                    if i == window_start:
+                        optimizer.zero_grad()
+                    
+                    # Forward pass - use mixed precision if enabled
+                    if use_mixed_precision:
+                        with torch.cuda.amp.autocast():
+                            outputs = model(inputs)
+                            loss = criterion(outputs, labels)
+                    else:
                         outputs = model(inputs)
                         loss = criterion(outputs, labels)
                     
-                    # Backward and optimize with scaled gradients
-                    scaler.scale(loss).backward()
-                    scaler.step(optimizer)
-                    scaler.update()
-                else:
-                    outputs = model(inputs)
-                    loss = criterion(outputs, labels)
-                    loss.backward()
-                    optimizer.step()
+                    # Weight the batch mean by its share of the window, so the summed
+                    # gradients are those of the mean loss over the whole window
+                    window_loss = loss * window_loss_weight(labels.size(0), window_rows)
+                    if use_mixed_precision:
+                        scaler.scale(window_loss).backward()
+                    else:
+                        window_loss.backward()
+                    
+                    if step_now:
+                        # Linear learning rate warmup
+                        if warmup_steps:
+                            for group in optimizer.param_groups:
+                                group['lr'] = learning_rate * warmup_factor(global_step, warmup_steps)
+                        global_step += 1
+                        
+                        # Optimize (with scaled gradients under mixed precision)
+                        if use_mixed_precision:
+                            scaler.step(optimizer)
+                            scaler.update()
+                        else:
+                            optimizer.step()
+                    
+                    # Update metrics
+                    running_loss += loss.item()
+                    _, predicted = torch.max(outputs.data, 1)
+                    total += labels.size(0)
+                    correct += (predicted == labels).sum().item()
+                    
+                    profiler.check()
+                    
+                    if step_now and snapshot_every and global_step % snapshot_every == 0:
+                        save_snapshot(epoch, i + 1, (running_loss, correct, total))
+                    
+                    # Free memory for testing with small GPUs
+                    if optimize_memory and use_cuda:
+                        del inputs, labels, outputs
+                        torch.cuda.empty_cache()
                 
-                # Update metrics
-                running_loss += loss.item()
-                _, predicted = torch.max(outputs.data, 1)
-                total += labels.size(0)
-                correct += (predicted == labels).sum().item()
+                # Calculate epoch metrics
+                epoch_loss = running_loss / len(dataset)
+                epoch_acc = 100 * correct / total
+                epoch_time = time.time() - epoch_start
                 
-                # Free memory for testing with small GPUs
-                if optimize_memory:
-                    del inputs, labels, outputs
-                    torch.cuda.empty_cache()
-            
-            # Calculate epoch metrics
-            epoch_loss = running_loss / len(dataset)
-            epoch_acc = 100 * correct / total
-            epoch_time = time.time() - epoch_start
-            
-            # Record metrics
-            loss_history.append(float(epoch_loss))
-            accuracy_history.append(float(epoch_acc))
-            
-            # Record GPU stats at the end of the epoch
-            if has_monitoring:
-                gpu_utilization_end = get_gpu_utilization()
-                # Use the maximum utilization observed during the epoch
-                if gpu_utilization is not None and gpu_utilization_end is not None:
-                    gpu_utilization = max(gpu_utilization, gpu_utilization_end)
-            
-            # Add stats to gpu_stats list
-            gpu_stats.append({
-                "epoch": epoch + 1,
-                "memory_allocated_mb": round(memory_allocated),
-                "memory_reserved_mb": round(memory_reserved),
-                "gpu_utilization": gpu_utilization,
-                "epoch_time_seconds": round(epoch_time, 3)
-            })
-            
-            print(f"Epoch {epoch+1}/{epochs} - Loss: {epoch_loss:.4f}, Accuracy: {epoch_acc:.2f}%, "
-                  f"Time: {epoch_time:.2f}s, GPU Util: {gpu_utilization or 'N/A'}%")
+                # Record metrics
+                loss_history.append(float(epoch_loss))
+                accuracy_history.append(float(epoch_acc))
+                
+                # Record GPU stats at the end of the epoch
+                if has_monitoring:
+                    gpu_utilization_end = get_gpu_utilization()
+                    # Use the maximum utilization observed during the epoch
+                    if gpu_utilization is not None and gpu_utilization_end is not None:
+                        gpu_utilization = max(gpu_utilization, gpu_utilization_end)
+                
+                # Add stats to gpu_stats list
+                gpu_stats.append({
+                    "epoch": epoch + 1,
+                    "memory_allocated_mb": round(memory_allocated),
+                    "memory_reserved_mb": round(memory_reserved),
+                    "gpu_utilization": gpu_utilization,
+                    "epoch_time_seconds": round(epoch_time, 3)
+                })
+                
+                print(f"Epoch {epoch+1}/{epochs} - Loss: {epoch_loss:.4f}, Accuracy: {epoch_acc:.2f}%, "
+                      f"Time: {epoch_time:.2f}s, GPU Util: {gpu_utilization or 'N/A'}%")
+                
+                if snapshot_every:
+                    save_snapshot(epoch + 1, 0, (0.0, 0, 0))
         
         # Total training time
         total_time = time.time() - start_time
         
+        # Export for --action infer (TorchScript, BatchNorm folded, eval mode)
+        export_error = None
+        if model_path:
+            with profiler.stage('export'):
+                export_error = export_torchscript(model, model_path, {
+                    "format": "torchscript",
+                    "input_size": input_size,
+                    "hidden_size": hidden_size,
+                    "output_size": output_size,
+                    "epochs": epochs,
+                    "final_loss": loss_history[-1] if loss_history else None,
+                    "date_trained": time.strftime("%Y-%m-%dT%H:%M:%S")
+                })
+            print(f"Model exported to {model_path} (max abs error {export_error:.2e})", file=sys.stderr)
+        
         # Final memory usage
-        memory_usage = torch.cuda.memory_allocated() / (1024 * 1024)
+        memory_usage = torch.cuda.memory_allocated() / (1024 * 1024) if use_cuda else (current_rss_mb() or 0)
         
         # Calculate average GPU utilization
         if has_monitoring and any(s["gpu_utilization"] is not None for s in gpu_stats):
@@ -472,28 +973,37 @@ def accelerate_training(config, training_data=None):
             avg_utilization = None
         
         return {
-            "device": "cuda",
+            "device": device_name,
             "epochs": epochs,
             "batch_size": batch_size,
+            "accumulation_steps": accumulation_steps,
+            "effective_batch_size": batch_size * accumulation_steps,
+            "optimizer": optimizer_name,
+            "learning_rate": learning_rate,
+            "autotune": autotune_result,
             "training_time_seconds": round(total_time, 3),
             "loss": loss_history,
             "accuracy": accuracy_history,
             "memory_usage_mb": round(memory_usage),
             "gpu_utilization": avg_utilization,
-            "gpu_stats": gpu_stats
+            "gpu_stats": gpu_stats,
+            "model_path": model_path,
+            "export_max_abs_error": export_error,
+            "memory_profile": profiler.report() if profiler.enabled else None
         }
         
     except Exception as e:
         print(f"Error during GPU training: {e}", file=sys.stderr)
         traceback.print_exc()
         return {
-            "device": "cuda" if torch.cuda.is_available() else "cpu",
+            "device": device_name,
             "error": str(e),
             "training_time_seconds": 0,
             "loss": [],
             "accuracy": [],
             "memory_usage_mb": 0,
-            "gpu_utilization": None
+            "gpu_utilization": None,
+            "memory_profile": profiler.report() if profiler.enabled else None
         }
     finally:
         # Clean up NVML
@@ -526,11 +1036,34 @@ def is_gpu_available():
 
 def main():
     parser = argparse.ArgumentParser(description='GPU Accelerator for Audotics')
-    parser.add_argument('--action', choices=['info', 'test', 'train'], 
+    parser.add_argument('--action', choices=['info', 'test', 'train', 'infer'], 
                        default='info', help='Action to perform')
     parser.add_argument('--config', type=str, help='Configuration JSON file path')
-    parser.add_argument('--data', type=str, help='Training data JSON file path')
+    parser.add_argument('--data', type=str,
+                       help='Training data JSON file path (infer: a .npy matrix or JSON file of rows)')
     parser.add_argument('--output', type=str, help='Output file path')
+    parser.add_argument('--profile-memory', action='store_true',
+                       help='Record per-stage peak RSS and top allocators during training')
+    parser.add_argument('--memory-budget', action='append', default=[], metavar='STAGE=MB',
+                       help='Abort training when a stage exceeds this much RSS')
+    parser.add_argument('--autotune', action='store_true',
+                       help='Probe batch sizes and thread counts and train with the fastest configuration')
+    parser.add_argument('--snapshot-every', type=int, metavar='STEPS',
+                       help='Save the full training state every STEPS steps and after every epoch')
+    parser.add_argument('--snapshot-dir', type=str, help='Directory of training state snapshots')
+    parser.add_argument('--resume', action='store_true',
+                       help='Continue exactly from the newest snapshot in the snapshot directory')
+    parser.add_argument('--accumulation-steps', type=int, metavar='K',
+                       help='Sum the gradients of K batches per optimizer step (effective batch K * batch_size)')
+    parser.add_argument('--optimizer', choices=['adam', 'lamb', 'lars'],
+                       help='Training optimizer; lamb and lars adapt the step per layer for large batches')
+    parser.add_argument('--model-path', type=str,
+                       help='TorchScript model written by train and read by infer; for a scheduled job, '
+                            f'its result.model_path (default {DEFAULT_MODEL_PATH})')
+    parser.add_argument('--predictions', type=str,
+                       help='Stream inference scores to this .npy or .jsonl file')
+    parser.add_argument('--inference-batch-size', type=int, help='Rows per inference batch (default 4096)')
+    parser.add_argument('--workers', type=int, help='Inference worker threads (default: up to 4)')
     
     args = parser.parse_args()
     
@@ -550,9 +1083,36 @@ def main():
         except Exception as e:
             print(f"Error loading config from environment: {e}", file=sys.stderr)
     
-    # Load data if provided
+    # Command line memory options override the configuration
+    if args.profile_memory:
+        config['profile_memory'] = True
+    if args.autotune:
+        config['autotune'] = True
+    if args.snapshot_every is not None:
+        config['snapshot_every'] = args.snapshot_every
+    if args.snapshot_dir:
+        config['snapshot_dir'] = args.snapshot_dir
+    if args.resume:
+        config['resume'] = True
+    if args.accumulation_steps:
+        config['accumulation_steps'] = args.accumulation_steps
+    if args.optimizer:
+        config['optimizer'] = args.optimizer
+    if args.model_path:
+        config['model_path'] = args.model_path
+    if args.inference_batch_size:
+        config['inference_batch_size'] = args.inference_batch_size
+    if args.workers:
+        config['inference_workers'] = args.workers
+    if args.memory_budget:
+        try:
+            config['memory_budgets'] = {**config.get('memory_budgets', {}), **parse_budgets(args.memory_budget)}
+        except ValueError as e:
+            print(f"Error parsing memory budgets: {e}", file=sys.stderr)
+    
+    # Load data if provided (inference reads its own, possibly binary, input)
     training_data = None
-    if args.data:
+    if args.data and args.action == 'train':
         try:
             with open(args.data, 'r') as f:
                 training_data = json.load(f)
@@ -592,6 +1152,10 @@ def main():
         # Run accelerated training
         result = accelerate_training(config, training_data)
     
+    elif args.action == 'infer':
+        # Score rows with the exported model, without retraining
+        result = run_inference(config, args.data, args.predictions)
+    
     # Write results to output file if specified
     if args.output:
         try:
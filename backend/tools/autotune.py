@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Batch-Size and Thread-Count Autotuning
+
+This module picks a training configuration by measurement instead of by hardware
+guesswork. A probe function runs a few training steps for one (batch size, thread
+count) pair and reports samples/sec and peak memory. autotune() sweeps a geometric
+range of batch sizes for every thread count. It stops growing the batch once a
+probe runs out of memory or exceeds the memory budget. It then picks the fastest
+configuration within the budget. Among configurations within `tolerance` of the
+best throughput, the smallest batch wins, because larger batches cost
+generalization for no speed gain.
+
+The learning rate is scaled with the chosen batch size (linear or square-root
+rule) and ramped up linearly over a warmup period. That keeps large-batch
+training stable.
+
+The sweep is framework-agnostic: train_content_model.py probes TensorFlow in
+child processes (its thread pools are fixed once the runtime starts), and
+gpu_accelerator.py probes PyTorch in-process.
+"""
+
+import os
+import sys
+
+LR_SCALING_RULES = ['linear', 'sqrt']
+
+def geometric_range(low, high, factor=2):
+    """low, low * factor, ... up to and including high"""
+    values = []
+    value = max(1, int(low))
+    while value <= high:
+        values.append(value)
+        value *= factor
+    return values
+
+def default_thread_counts(max_threads=None):
+    """Powers of two up to the number of CPUs, plus the CPU count itself"""
+    max_threads = max_threads or os.cpu_count() or 1
+    counts = geometric_range(1, max_threads)
+    if counts[-1] != max_threads:
+        counts.append(max_threads)
+    return counts
+
+def total_memory_mb():
+    """Physical memory in MB, or None when it cannot be determined"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def scale_learning_rate(base_lr, base_batch_size, batch_size, rule='linear'):
+    """
+    Scale a learning rate tuned at base_batch_size to batch_size
+
+    Args:
+        rule: 'linear' (lr * k) or 'sqrt' (lr * sqrt(k)) for k = batch_size / base_batch_size
+    """
+    ratio = batch_size / base_batch_size
+    if rule == 'linear':
+        return base_lr * ratio
+    if rule == 'sqrt':
+        return base_lr * ratio ** 0.5
+    raise ValueError(f"Unknown learning rate scaling rule '{rule}', expected one of {LR_SCALING_RULES}")
+
+def warmup_factor(step, warmup_steps):
+    """Linear warmup multiplier for a 0-based step"""
+    if warmup_steps <= 0:
+        return 1.0
+    return min(1.0, (step + 1) / warmup_steps)
+
+def is_out_of_memory(error):
+    """Whether an exception from a probe means the configuration does not fit"""
+    if isinstance(error, MemoryError):
+        return True
+    name = type(error).__name__
+    return name in ('OutOfMemoryError', 'ResourceExhaustedError') or 'out of memory' in str(error).lower()
+
+def autotune(probe, batch_sizes, thread_counts, memory_budget_mb=None, tolerance=0.05):
+    """
+    Sweep batch sizes and thread counts and pick the best configuration
+
+    Args:
+        probe: Callable (threads, batch_sizes) yielding one result per batch size in
+            order: {"batch_size", "samples_per_second", "peak_memory_mb"} or
+            {"batch_size", "error"}; the sweep stops early at the first failure
+        batch_sizes: Ascending batch sizes to try
+        thread_counts: Thread counts to try
+        memory_budget_mb: Peak memory limit (None for no limit)
+        tolerance: Relative throughput slack in favour of smaller batches
+
+    Returns:
+        Dictionary with the chosen batch_size and threads, their throughput and
+        peak memory, and every trial
+    """
+    trials = []
+    for threads in thread_counts:
+        for result in probe(threads, batch_sizes):
+            result = {'threads': threads, **result}
+            peak = result.get('peak_memory_mb')
+            if 'error' not in result and memory_budget_mb and peak is not None and peak > memory_budget_mb:
+                result['error'] = f"peak memory {peak:.0f} MB over budget {memory_budget_mb:.0f} MB"
+            trials.append(result)
+            if 'error' in result:
+                outcome = result['error']
+            else:
+                outcome = f"{result['samples_per_second']:.0f} samples/s"
+                if peak is not None:
+                    outcome += f", peak {peak:.0f} MB"
+            print(f"Autotune threads={threads} batch_size={result['batch_size']}: {outcome}", file=sys.stderr)
+            if 'error' in result:
+                break  # Larger batches only need more memory
+
+    valid = [trial for trial in trials if 'error' not in trial]
+    if not valid:
+        raise RuntimeError("Autotuning found no configuration that fits the memory budget")
+    best = max(trial['samples_per_second'] for trial in valid)
+    chosen = min(
+        (trial for trial in valid if trial['samples_per_second'] >= (1 - tolerance) * best),
+        key=lambda trial: (trial['batch_size'], -trial['samples_per_second'])
+    )
+    return {
+        'batch_size': chosen['batch_size'],
+        'threads': chosen['threads'],
+        'samples_per_second': round(chosen['samples_per_second'], 1),
+        'peak_memory_mb': chosen.get('peak_memory_mb'),
+        'memory_budget_mb': memory_budget_mb,
+        'trials': trials
+    }
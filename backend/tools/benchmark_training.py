@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+End-to-End Training Benchmark
+
+This script times the content model training pipeline (ingest -> pair generation ->
+standardization -> dataset build -> epochs) against an offline SQLite database with
+fixed seeds, so performance changes to the trainer can be measured on any machine
+without Postgres. The fixture is generated with synthetic_workload.py when it does
+not exist yet. Results are written as JSON with per-stage wall time and peak RSS.
+The per-epoch validation loss is reported too, so large-batch settings
+(--accumulation-steps, --optimizer) can be compared on convergence as well as throughput.
+
+Usage:
+python benchmark_training.py --fixture ../data/fixtures/bench.db --users 20000 --tracks 5000 --epochs 3
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import numpy as np
+from pathlib import Path
+
+from data_sources import SQLiteDataSource, table_counts
+from memory_profiling import MemoryProfiler
+from synthetic_workload import generate_interactions, generate_track_features, write_sqlite_fixture
+from autotune import LR_SCALING_RULES
+from large_batch import OPTIMIZERS
+from train_content_model import (
+    LOSSES,
+    WEIGHTING_SCHEMES,
+    compute_feature_stats,
+    fetch_training_data,
+    make_pair_dataset,
+    pair_loss,
+    scale_for_accumulation,
+    train_model,
+    tf
+)
+
+def set_seeds(seed):
+    """Seed Python, NumPy and TensorFlow random number generators"""
+    random.seed(seed)
+    np.random.seed(seed)
+    tf.keras.utils.set_random_seed(seed)
+
+def ensure_fixture(path, args):
+    """Generate the offline database unless it already exists"""
+    if Path(path).exists() and not args.regenerate:
+        return False
+    user_idx, track_idx = generate_interactions(
+        args.users,
+        args.tracks,
+        mean_interactions=args.mean_interactions,
+        num_clusters=args.clusters,
+        seed=args.seed
+    )
+    write_sqlite_fixture(path, user_idx, track_idx, generate_track_features(args.tracks, args.seed))
+    return True
+
+def validation_loss(model, features, stats, similar_pairs, pair_weights, args):
+    """
+    Loss on train_model's validation split at a fixed batch size
+
+    The InfoNCE loss depends on the batch size (its in-batch negatives), so runs
+    with different batch sizes are compared at args.eval_batch_size.
+    """
+    pairs = np.asarray(similar_pairs, dtype=np.int64).reshape(-1, 2)
+    weights = np.ones(len(pairs), dtype=np.float32) if pair_weights is None else np.asarray(pair_weights, np.float32)
+    # Same shuffle and split as train_model
+    order = np.random.default_rng(args.seed).permutation(len(pairs))
+    train_size = int(len(pairs) * (1 - args.validation_split))
+    validation = order[train_size:]
+    dataset = make_pair_dataset(
+        features, stats.mean, stats.safe_std(),
+        pairs[validation], weights[validation], args.eval_batch_size
+    )
+    total = count = 0.0
+    for anchor_batch, positive_batch, weight_batch in dataset:
+        if len(weight_batch) < args.eval_batch_size:
+            break
+        loss = pair_loss(model(anchor_batch, training=False), model(positive_batch, training=False),
+                         weight_batch, args.loss, getattr(args, 'temperature', 0.1))
+        total += float(loss)
+        count += 1
+    return total / count if count else None
+
+def run_benchmark(args):
+    """Run the pipeline once and return the timing report"""
+    set_seeds(args.seed)
+    profiler = MemoryProfiler(enabled=True, trace_allocations=False)
+    source = SQLiteDataSource(args.fixture)
+    start_time = time.perf_counter()
+
+    features, similar_pairs, track_ids, pair_weights = fetch_training_data(
+        source,
+        aggregate_pairs=not args.raw_pairs,
+        min_cooccurrence=args.min_cooccurrence,
+        pair_weighting=args.pair_weighting,
+        profiler=profiler
+    )
+    fixture_counts = table_counts(source)
+    source.close()
+    if features is None:
+        raise RuntimeError(f"Could not read training data from {args.fixture}")
+
+    with profiler.stage('standardization'):
+        stats = compute_feature_stats(features)
+
+    scale_for_accumulation(args)
+    if (args.accumulation_steps > 1 or args.optimizer != 'adam') and args.warmup_epochs is None:
+        args.warmup_epochs = 1.0
+
+    model, history = train_model(
+        features, similar_pairs, args,
+        stats=stats, pair_weights=pair_weights, profiler=profiler
+    )
+    total_seconds = time.perf_counter() - start_time
+    eval_val_loss = validation_loss(model, features, stats, similar_pairs, pair_weights, args)
+
+    stages = {
+        stage['stage']: {'seconds': stage['seconds'], 'peak_rss_mb': round(stage['peak_rss_mb'], 1)}
+        for stage in profiler.stages
+    }
+    epoch_seconds = [value['seconds'] for name, value in stages.items() if name.startswith('epoch_')]
+
+    return {
+        'fixture': str(args.fixture),
+        'fixture_rows': fixture_counts,
+        'seed': args.seed,
+        'pairs': int(len(similar_pairs)),
+        'epochs': args.epochs,
+        'batch_size': args.batch_size,
+        'accumulation_steps': args.accumulation_steps,
+        'effective_batch_size': args.batch_size * args.accumulation_steps,
+        'loss': args.loss,
+        'optimizer': args.optimizer,
+        'learning_rate': args.learning_rate,
+        'total_seconds': round(total_seconds, 3),
+        'mean_epoch_seconds': round(float(np.mean(epoch_seconds)), 3) if epoch_seconds else None,
+        'pairs_per_second': round(len(similar_pairs) * (1 - args.validation_split) * len(epoch_seconds) /
+                                  sum(epoch_seconds)) if epoch_seconds else None,
+        'final_loss': float(history['loss'][-1]) if history['loss'] else None,
+        'final_val_loss': float(history['val_loss'][-1]) if history['val_loss'] else None,
+        'val_loss_history': [round(float(loss), 5) for loss in history['val_loss']],
+        'eval_batch_size': args.eval_batch_size,
+        'eval_val_loss': eval_val_loss,
+        'stages': stages,
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'tensorflow': tf.__version__,
+            'machine': platform.machine()
+        }
+    }
+
+def main():
+    """Benchmark the training pipeline on an offline database"""
+    if not tf:
+        print("Cannot run the benchmark because TensorFlow is not available.")
+        sys.exit(1)
+
+    parser = argparse.ArgumentParser(description='Benchmark content model training end to end')
+    parser.add_argument('--fixture', type=str, default='../data/fixtures/bench.db', help='Offline SQLite database')
+    parser.add_argument('--regenerate', action='store_true', help='Regenerate the fixture even if it exists')
+    parser.add_argument('--users', type=int, default=20000, help='Users in a generated fixture')
+    parser.add_argument('--tracks', type=int, default=5000, help='Tracks in a generated fixture')
+    parser.add_argument('--mean-interactions', type=float, default=20, help='Mean interactions per user')
+    parser.add_argument('--clusters', type=int, default=50, help='Co-listening clusters in a generated fixture')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the fixture and training')
+    parser.add_argument('--epochs', type=int, default=3, help='Number of training epochs')
+    parser.add_argument('--batch-size', type=int, default=256, help='Training batch size')
+    parser.add_argument('--validation-split', type=float, default=0.2, help='Validation data split ratio')
+    parser.add_argument('--learning-rate', type=float, default=0.001, help='Learning rate')
+    parser.add_argument('--embedding-size', type=int, default=64, help='Size of track embeddings')
+    parser.add_argument('--loss', choices=LOSSES, default='cosine', help='Training objective')
+    parser.add_argument('--accumulation-steps', type=int, default=1, help='Batches summed per optimizer step')
+    parser.add_argument('--optimizer', choices=OPTIMIZERS, default='adam', help='Optimizer')
+    parser.add_argument('--weight-decay', type=float, default=0.0, help='Weight decay for lamb/lars')
+    parser.add_argument('--lr-scaling', choices=LR_SCALING_RULES, default='sqrt',
+                        help='How --learning-rate is scaled to the accumulated batch')
+    parser.add_argument('--warmup-epochs', type=float, default=None,
+                        help='Linear learning rate warmup (default: 1 in large-batch mode, else none)')
+    parser.add_argument('--raw-pairs', action='store_true', help='Benchmark one pair per user instead of weighted pairs')
+    parser.add_argument('--min-cooccurrence', type=int, default=1, help='Drop pairs shared by fewer users')
+    parser.add_argument('--pair-weighting', choices=WEIGHTING_SCHEMES, default='count',
+                        help='Weighting scheme for co-occurrence pairs')
+    parser.add_argument('--eval-batch-size', type=int, default=256,
+                        help='Batch size of the final validation loss, comparable across batch sizes')
+    parser.add_argument('--output', type=str, help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    if ensure_fixture(args.fixture, args):
+        print(f"Generated offline database {args.fixture}", file=sys.stderr)
+
+    report = run_benchmark(args)
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Track Co-occurrence Aggregation
+
+This module turns user-track interactions into weighted unique track pairs. Instead of
+emitting the same (i, j) pair once per user who played both tracks, pair counts are
+aggregated into a sparse upper-triangular co-occurrence matrix (i < j), optionally
+re-weighted (log, PMI, IDF) and pruned by a minimum count. All steps are vectorized
+and processed in user chunks so heavy users cannot blow up memory.
+
+Usage:
+python cooccurrence.py workload.npz --min-count 2 --weighting pmi --output pairs.npz
+"""
+
+import json
+import time
+import argparse
+import numpy as np
+
+WEIGHTING_SCHEMES = ['count', 'log', 'pmi', 'idf']
+
+def unique_user_tracks(user_idx, track_idx):
+    """Deduplicate (user, track) interactions; result is sorted by user, then track"""
+    keys = np.unique(np.asarray(user_idx, dtype=np.int64) << 32 | np.asarray(track_idx, dtype=np.int64))
+    return keys >> 32, keys & 0xFFFFFFFF
+
+def _user_runs(users):
+    """Start offsets and lengths of each user's run in a user-sorted array"""
+    if not len(users):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    run_starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    run_lengths = np.diff(np.r_[run_starts, len(users)])
+    return run_starts, run_lengths
+
+def _pairs_from_runs(tracks, run_starts, run_lengths):
+    """All (first, second) track pairs within each run, first before second"""
+    if not len(tracks):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    position = np.arange(len(tracks)) - np.repeat(run_starts - run_starts[0], run_lengths)
+    partners = np.repeat(run_lengths, run_lengths) - 1 - position
+
+    num_pairs = int(partners.sum())
+    first = np.repeat(np.arange(len(tracks)), partners)
+    offset = np.arange(num_pairs) - np.repeat(np.cumsum(partners) - partners, partners) + 1
+    return tracks[first], tracks[first + offset]
+
+def interactions_to_pairs(user_idx, track_idx, max_pairs=None):
+    """
+    Build all within-user track pairs, as fetch_training_data did, without Python loops
+
+    Args:
+        user_idx: User index per interaction
+        track_idx: Track index per interaction
+        max_pairs: Raise instead of allocating more than this many pairs
+
+    Returns:
+        Array of shape (num_pairs, 2)
+    """
+    users, tracks = unique_user_tracks(user_idx, track_idx)
+    run_starts, run_lengths = _user_runs(users)
+
+    num_pairs = int((run_lengths * (run_lengths - 1) // 2).sum())
+    if max_pairs is not None and num_pairs > max_pairs:
+        raise ValueError(f"Workload would produce {num_pairs} pairs (limit {max_pairs})")
+
+    first, second = _pairs_from_runs(tracks, run_starts, run_lengths)
+    return np.stack([first, second], axis=1)
+
+def _merge_counts(keys_a, counts_a, keys_b, counts_b):
+    """Merge two sets of (key, count) into unique keys with summed counts"""
+    keys, inverse = np.unique(np.concatenate([keys_a, keys_b]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([counts_a, counts_b]), minlength=len(keys))
+    return keys, counts.astype(np.int64)
+
+def build_cooccurrence(user_idx, track_idx, num_tracks, min_count=1, chunk_pairs=20000000):
+    """
+    Count how many users interacted with each unordered pair of tracks
+
+    Args:
+        user_idx: User index per interaction
+        track_idx: Track index per interaction
+        num_tracks: Number of tracks (pair keys are encoded as i * num_tracks + j)
+        min_count: Drop pairs seen by fewer users than this
+        chunk_pairs: Upper bound on raw pairs materialized at once
+
+    Returns:
+        Dictionary with rows, cols (rows < cols), counts, per-track user counts
+        and the number of users
+    """
+    users, tracks = unique_user_tracks(user_idx, track_idx)
+    run_starts, run_lengths = _user_runs(users)
+    pairs_per_user = run_lengths * (run_lengths - 1) // 2
+
+    # Group whole user runs into chunks of at most chunk_pairs raw pairs (a single
+    # user above the bound gets a chunk of its own)
+    cumulative = np.cumsum(pairs_per_user)
+    chunk_bounds = [0]
+    while chunk_bounds[-1] < len(run_starts):
+        start = chunk_bounds[-1]
+        base = cumulative[start - 1] if start > 0 else 0
+        end = int(np.searchsorted(cumulative, base + chunk_pairs, side='right'))
+        chunk_bounds.append(max(end, start + 1))
+
+    keys = np.zeros(0, dtype=np.int64)
+    counts = np.zeros(0, dtype=np.int64)
+    for start, end in zip(chunk_bounds[:-1], chunk_bounds[1:]):
+        starts = run_starts[start:end]
+        lengths = run_lengths[start:end]
+        if not len(starts):
+            continue
+        chunk_tracks = tracks[starts[0]:starts[-1] + lengths[-1]]
+        first, second = _pairs_from_runs(chunk_tracks, starts, lengths)
+        # Tracks are sorted within each user, so first < second already
+        chunk_keys, chunk_counts = np.unique(first * num_tracks + second, return_counts=True)
+        keys, counts = _merge_counts(keys, counts, chunk_keys, chunk_counts)
+
+    if min_count > 1:
+        keep = counts >= min_count
+        keys, counts = keys[keep], counts[keep]
+
+    return {
+        'rows': (keys // num_tracks).astype(np.int64),
+        'cols': (keys % num_tracks).astype(np.int64),
+        'counts': counts,
+        'item_counts': np.bincount(tracks, minlength=num_tracks),
+        'num_users': len(run_starts)
+    }
+
+def cooccurrence_weights(cooccurrence, weighting='count'):
+    """
+    Turn co-occurrence counts into training weights
+
+    Schemes:
+        count  number of users who played both tracks (same objective as the raw pair list)
+        log    1 + log(count), dampens very popular pairs
+        pmi    positive pointwise mutual information, log(count * users / (n_i * n_j))
+        idf    count scaled by the geometric mean of both tracks' inverse document frequency
+    """
+    rows, cols = cooccurrence['rows'], cooccurrence['cols']
+    counts = cooccurrence['counts'].astype(np.float64)
+    item_counts = np.maximum(cooccurrence['item_counts'], 1).astype(np.float64)
+    num_users = max(cooccurrence['num_users'], 1)
+
+    if weighting == 'count':
+        weights = counts
+    elif weighting == 'log':
+        weights = 1.0 + np.log(counts)
+    elif weighting == 'pmi':
+        weights = np.maximum(np.log(counts * num_users / (item_counts[rows] * item_counts[cols])), 0.0)
+    elif weighting == 'idf':
+        idf = np.log(num_users / item_counts)
+        weights = counts * np.sqrt(np.maximum(idf[rows] * idf[cols], 0.0))
+    else:
+        raise ValueError(f"Unknown weighting scheme '{weighting}', expected one of {WEIGHTING_SCHEMES}")
+
+    return weights.astype(np.float32)
+
+def weighted_pairs(user_idx, track_idx, num_tracks, min_count=1, weighting='count'):
+    """
+    Build weighted unique training pairs from interactions
+
+    Returns:
+        Tuple of (pairs of shape (num_pairs, 2), float32 weights); pairs with zero
+        weight are dropped
+    """
+    cooccurrence = build_cooccurrence(user_idx, track_idx, num_tracks, min_count=min_count)
+    weights = cooccurrence_weights(cooccurrence, weighting)
+    keep = weights > 0
+    pairs = np.stack([cooccurrence['rows'][keep], cooccurrence['cols'][keep]], axis=1)
+    return pairs, weights[keep]
+
+def main():
+    """Aggregate the interactions of a workload file into weighted pairs"""
+    parser = argparse.ArgumentParser(description='Aggregate interactions into weighted co-occurrence pairs')
+    parser.add_argument('workload', type=str, help='.npz with user_idx and track_idx arrays')
+    parser.add_argument('--min-count', type=int, default=1, help='Minimum co-occurrence count')
+    parser.add_argument('--weighting', choices=WEIGHTING_SCHEMES, default='count', help='Pair weighting scheme')
+    parser.add_argument('--output', type=str, help='Write pairs and weights to this .npz file')
+    args = parser.parse_args()
+
+    workload = np.load(args.workload)
+    user_idx, track_idx = workload['user_idx'], workload['track_idx']
+    num_tracks = int(workload['features'].shape[0]) if 'features' in workload else int(track_idx.max()) + 1
+
+    start_time = time.time()
+    pairs, weights = weighted_pairs(user_idx, track_idx, num_tracks, args.min_count, args.weighting)
+    elapsed = time.time() - start_time
+
+    users, _ = unique_user_tracks(user_idx, track_idx)
+    _, run_lengths = _user_runs(users)
+    raw_pairs = int((run_lengths * (run_lengths - 1) // 2).sum())
+
+    if args.output:
+        np.savez(args.output, pairs=pairs, weights=weights)
+
+    print(json.dumps({
+        'raw_pairs': raw_pairs,
+        'unique_pairs': int(len(pairs)),
+        'reduction': round(raw_pairs / len(pairs), 2) if len(pairs) else None,
+        'seconds': round(elapsed, 3)
+    }))
+
+if __name__ == "__main__":
+    main()
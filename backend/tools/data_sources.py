@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Training Data Sources
+
+This module abstracts where fetch_training_data reads tracks and interactions from:
+
+- PostgresDataSource wraps a psycopg2 connection to the production database
+- SQLiteDataSource reads an offline SQLite file with the same Track / TrackFeatures /
+  UserInteraction tables, so the training pipeline runs in CI or on a laptop
+
+Both backends execute the same queries; SQLite accepts the quoted Postgres identifiers.
+iter_tracks streams track rows in chunks (a server-side cursor on Postgres), so a
+catalog never has to be held as Python rows all at once. Offline databases are
+filled by synthetic_workload.py --output-sqlite.
+
+Usage:
+python data_sources.py inspect --sqlite ../data/fixtures/training.db
+"""
+
+import json
+import sqlite3
+import argparse
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+TRACKS_QUERY = """
+    SELECT t.id AS track_id, t.name, t.artists, t.popularity,
+           f.acousticness, f.danceability, f.energy, f.instrumentalness,
+           f.key, f.liveness, f.loudness, f.mode, f.speechiness,
+           f.tempo, f.valence
+    FROM "Track" t
+    JOIN "TrackFeatures" f ON t.id = f."trackId"
+"""
+
+INTERACTIONS_QUERY = """
+    SELECT "userId", "trackId" FROM "UserInteraction"
+    WHERE "action" IN ('play', 'like', 'addToPlaylist')
+"""
+
+# Rows per fetchmany call when streaming track rows
+FETCH_CHUNK_SIZE = 65536
+
+# Audio feature columns in the order the model consumes them
+FEATURE_COLUMNS = [
+    'acousticness',
+    'danceability',
+    'energy',
+    'instrumentalness',
+    'key',
+    'liveness',
+    'loudness',
+    'mode',
+    'speechiness',
+    'tempo',
+    'valence'
+]
+
+# Offline schema: the columns the training queries read, with Prisma's quoted names
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS "Track" (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        artists TEXT NOT NULL DEFAULT '[]',
+        popularity INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS "TrackFeatures" (
+        "trackId" TEXT PRIMARY KEY REFERENCES "Track"(id),
+        acousticness REAL NOT NULL,
+        danceability REAL NOT NULL,
+        energy REAL NOT NULL,
+        instrumentalness REAL NOT NULL,
+        key INTEGER NOT NULL,
+        liveness REAL NOT NULL,
+        loudness REAL NOT NULL,
+        mode INTEGER NOT NULL,
+        speechiness REAL NOT NULL,
+        tempo REAL NOT NULL,
+        valence REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS "UserInteraction" (
+        "userId" TEXT NOT NULL,
+        "trackId" TEXT NOT NULL,
+        "action" TEXT NOT NULL
+    );
+"""
+
+class DataSource(ABC):
+    """Source of track and interaction rows for training"""
+
+    name = 'abstract'
+
+    @abstractmethod
+    def fetch_tracks(self):
+        """Rows with track_id, name, artists, popularity and the audio feature columns"""
+
+    @abstractmethod
+    def iter_tracks(self, chunk_size=FETCH_CHUNK_SIZE):
+        """The rows of fetch_tracks as lists of at most chunk_size rows"""
+
+    @abstractmethod
+    def fetch_interactions(self):
+        """Rows with userId and trackId for positive interactions"""
+
+    def close(self):
+        pass
+
+class PostgresDataSource(DataSource):
+    """Production Postgres database behind a psycopg2 connection"""
+
+    name = 'postgres'
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def _query(self, sql):
+        from psycopg2.extras import RealDictCursor
+
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(sql)
+            return cursor.fetchall()
+
+    def fetch_tracks(self):
+        return self._query(TRACKS_QUERY)
+
+    def iter_tracks(self, chunk_size=FETCH_CHUNK_SIZE):
+        from psycopg2.extras import RealDictCursor
+
+        # A named cursor keeps the result on the server and transfers it chunk by chunk
+        with self.conn.cursor(name='training_tracks', cursor_factory=RealDictCursor) as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(TRACKS_QUERY)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+
+    def fetch_interactions(self):
+        return self._query(INTERACTIONS_QUERY)
+
+    def close(self):
+        self.conn.close()
+
+class SQLiteDataSource(DataSource):
+    """Offline SQLite database with the training tables"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Offline database {path} does not exist")
+        self.path = str(path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+
+    def _query(self, sql):
+        return [dict(row) for row in self.conn.execute(sql)]
+
+    def fetch_tracks(self):
+        return self._query(TRACKS_QUERY)
+
+    def iter_tracks(self, chunk_size=FETCH_CHUNK_SIZE):
+        cursor = self.conn.execute(TRACKS_QUERY)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+
+    def fetch_interactions(self):
+        return self._query(INTERACTIONS_QUERY)
+
+    def close(self):
+        self.conn.close()
+
+def as_data_source(source):
+    """Wrap a raw psycopg2 connection; pass DataSource instances through"""
+    if isinstance(source, DataSource):
+        return source
+    return PostgresDataSource(source)
+
+def create_sqlite_schema(path):
+    """Create (or open) an offline database with the training tables"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path))
+    conn.executescript(SQLITE_SCHEMA)
+    return conn
+
+def table_counts(source):
+    """Row counts of the training tables of a SQLite source"""
+    return {
+        table: source.conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        for table in ['Track', 'TrackFeatures', 'UserInteraction']
+    }
+
+def main():
+    """Inspect an offline training database"""
+    parser = argparse.ArgumentParser(description='Training data sources')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    inspect = subparsers.add_parser('inspect', help='Print table sizes of an offline database')
+    inspect.add_argument('--sqlite', type=str, required=True, help='Offline SQLite database')
+
+    args = parser.parse_args()
+
+    if args.command == 'inspect':
+        source = SQLiteDataSource(args.sqlite)
+        print(json.dumps(table_counts(source)))
+        source.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Knowledge Distillation to a Compact Serving Model
+
+Serving cost of the content model grows with the embedding size: index memory
+and every similarity computation are linear in the dimension, and the teacher
+runs two hidden layers of width 2 * embedding_size. This module trains a
+student with one hidden layer and a smaller embedding (16-32 dims) to keep the
+teacher's neighbor structure, without new interaction data. Only track
+features and the teacher's embeddings of them are needed.
+
+Each step takes a batch of tracks and compares the teacher's and the student's
+B x B cosine similarity matrices:
+
+- listwise: KL divergence between the row-wise softmax of teacher and student
+  similarities, so each track keeps the order of its nearest batch neighbors
+  (rank-preserving; the default)
+- similarity: mean squared error between the two matrices, which keeps the
+  global geometry but weighs far pairs as much as near ones
+
+Both compare rows z-scored over the other tracks of the batch. The teacher's
+cosines can sit in a narrow band (e.g. 0.98-0.997), where raw differences are
+too small to learn from and no fixed temperature would resolve the order.
+
+The report gives neighbor-overlap@k (the fraction of a track's teacher top-k
+neighbors over the full catalog that the student also ranks in its top k),
+inference throughput of the exported NumPy models, and brute-force top-k
+search speed over the catalog, all teacher vs student.
+
+Usage:
+python distill_model.py --offline-db ../data/fixtures/bench.db --npz ../data/models/content-based-model.npz --embedding-size 24 --output ../data/models/content-based-student.npz
+python distill_model.py --workload workload.npz --npz ../data/models/content-based-model.npz --loss similarity
+"""
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+
+from numpy_inference import NumpyEmbeddingModel, export_numpy_model, fold_keras_model
+from retrieval_eval import l2_normalize, load_interactions, top_k_indices
+from streaming_stats import compute_stats, iter_chunks
+from training_state import epoch_order
+
+# Try importing TensorFlow, handle gracefully if not available
+try:
+    import tensorflow as tf
+except ImportError:
+    print("TensorFlow not found, some functionality will be limited")
+    tf = None
+
+DISTILLATION_LOSSES = ['listwise', 'similarity']
+
+DEFAULT_STUDENT_SIZE = 24
+DEFAULT_OVERLAP_KS = (10, 50)
+
+def build_student_model(feature_dim, embedding_size, hidden_units=None):
+    """
+    Build the compact student: one hidden layer instead of the teacher's two
+
+    Args:
+        feature_dim: Number of input features
+        embedding_size: Student embedding size
+        hidden_units: Hidden width (defaults to embedding_size * 2)
+
+    Returns:
+        Keras Sequential model that numpy_inference can export
+    """
+    hidden_units = hidden_units or embedding_size * 2
+    return tf.keras.Sequential([
+        tf.keras.layers.InputLayer(input_shape=(feature_dim,)),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.Dense(hidden_units, activation='relu'),
+        tf.keras.layers.Dense(embedding_size, activation='tanh')
+    ])
+
+def similarity_matrix(embedding):
+    """Cosine similarities between all rows of a batch"""
+    embedding = tf.nn.l2_normalize(embedding, axis=-1)
+    return tf.matmul(embedding, embedding, transpose_b=True)
+
+def _row_scores(similarity, off_diagonal):
+    """Z-score each row over the other tracks; a track's own column is pushed out of the softmax"""
+    count = tf.reduce_sum(off_diagonal, axis=-1, keepdims=True)
+    mean = tf.reduce_sum(similarity * off_diagonal, axis=-1, keepdims=True) / count
+    variance = tf.reduce_sum(tf.square(similarity - mean) * off_diagonal, axis=-1, keepdims=True) / count
+    scores = (similarity - mean) * tf.math.rsqrt(variance + 1e-12)
+    return scores * off_diagonal - (1.0 - off_diagonal) * 1e9
+
+def distillation_loss(teacher_embedding, student_embedding, objective='listwise', temperature=0.3):
+    """
+    Mismatch between teacher and student similarity structure within a batch
+
+    Args:
+        teacher_embedding: Teacher embeddings of the batch tracks
+        student_embedding: Student embeddings of the same tracks
+        objective: One of DISTILLATION_LOSSES
+        temperature: Listwise softmax temperature, in row standard deviations
+    """
+    teacher_similarity = similarity_matrix(teacher_embedding)
+    off_diagonal = 1.0 - tf.eye(tf.shape(teacher_similarity)[0])
+    teacher_scores = _row_scores(teacher_similarity, off_diagonal)
+    student_scores = _row_scores(similarity_matrix(student_embedding), off_diagonal)
+    if objective == 'similarity':
+        squared_error = tf.square(teacher_scores - student_scores) * off_diagonal
+        return tf.reduce_sum(squared_error) / tf.reduce_sum(off_diagonal)
+
+    teacher_log_p = tf.nn.log_softmax(teacher_scores / temperature, axis=-1)
+    student_log_p = tf.nn.log_softmax(student_scores / temperature, axis=-1)
+    kl = tf.reduce_sum(tf.exp(teacher_log_p) * (teacher_log_p - student_log_p), axis=-1)
+    return tf.reduce_mean(kl)
+
+def distill(features, teacher_embeddings, embedding_size=DEFAULT_STUDENT_SIZE, hidden_units=None,
+            epochs=100, batch_size=512, learning_rate=0.003, objective='listwise', temperature=0.3, seed=42):
+    """
+    Train a student on the similarity structure of precomputed teacher embeddings
+
+    Every epoch visits all tracks once in a seeded random order, one batch of
+    batch_size tracks per step.
+
+    Args:
+        features: Standardized feature matrix
+        teacher_embeddings: Teacher embeddings in the same track order
+        embedding_size: Student embedding size
+        hidden_units: Student hidden width (defaults to embedding_size * 2)
+        epochs: Passes over the catalog
+        batch_size: Tracks per similarity matrix
+        learning_rate: Adam learning rate
+        objective: One of DISTILLATION_LOSSES
+        temperature: Listwise softmax temperature, in row standard deviations
+        seed: Seed of the initialization and batch order
+
+    Returns:
+        Tuple of (student model, history with the mean loss per epoch)
+    """
+    if tf is None:
+        raise ImportError("TensorFlow is required to distill the model")
+    if objective not in DISTILLATION_LOSSES:
+        raise ValueError(f"Unknown distillation loss '{objective}', expected one of {DISTILLATION_LOSSES}")
+
+    tf.keras.utils.set_random_seed(seed)
+    features = np.asarray(features, dtype=np.float32)
+    teacher_embeddings = np.asarray(teacher_embeddings, dtype=np.float32)
+    student = build_student_model(features.shape[1], embedding_size, hidden_units)
+    optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate)
+
+    @tf.function
+    def step(feature_batch, teacher_batch):
+        with tf.GradientTape() as tape:
+            student_batch = student(feature_batch, training=True)
+            loss = distillation_loss(teacher_batch, student_batch, objective, temperature)
+        gradients = tape.gradient(loss, student.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, student.trainable_variables))
+        return loss
+
+    # A batch of one has no neighbors; drop a trailing batch that small
+    num_batches = max(1, len(features) // batch_size + (len(features) % batch_size > 1))
+    history = {'loss': []}
+    for epoch in range(epochs):
+        order = epoch_order(seed, epoch, len(features))
+        total_loss = 0.0
+        for batch in range(num_batches):
+            rows = np.sort(order[batch * batch_size:(batch + 1) * batch_size])
+            total_loss += float(step(features[rows], teacher_embeddings[rows]))
+        history['loss'].append(total_loss / num_batches)
+        print(f"Distillation epoch {epoch + 1}/{epochs} - loss: {history['loss'][-1]:.4f}", file=sys.stderr)
+
+    return student, history
+
+def neighbor_overlap(teacher_embeddings, student_embeddings, ks=DEFAULT_OVERLAP_KS, num_queries=1000, seed=0):
+    """
+    Mean fraction of each query's teacher top-k neighbors that the student also returns
+
+    Queries are sampled catalog tracks; neighbors are ranked by cosine similarity
+    over the whole catalog, excluding the query itself.
+
+    Returns:
+        Dictionary {"overlap@k": value} for every k
+    """
+    teacher = l2_normalize(teacher_embeddings)
+    student = l2_normalize(student_embeddings)
+    num_tracks = len(teacher)
+    max_k = min(max(ks), num_tracks - 1)
+    queries = np.random.default_rng(seed).choice(num_tracks, min(num_queries, num_tracks), replace=False)
+
+    neighbors = []
+    for embeddings in (teacher, student):
+        scores = embeddings[queries] @ embeddings.T
+        scores[np.arange(len(queries)), queries] = -np.inf
+        neighbors.append(top_k_indices(scores, max_k))
+    teacher_top, student_top = neighbors
+
+    overlap = {}
+    for k in ks:
+        k = min(k, max_k)
+        hits = (student_top[:, :k, None] == teacher_top[:, None, :k]).any(axis=2).sum(axis=1)
+        overlap[f'overlap@{k}'] = round(float(hits.mean() / k), 4)
+    return overlap
+
+def _best_seconds(function, repeats=3):
+    """Fastest of a few timed calls"""
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+def serving_benchmark(teacher_model, student_model, features, teacher_embeddings, student_embeddings,
+                      num_queries=1000, k=10):
+    """
+    Compare the serving cost of two NumPy embedding models
+
+    Args:
+        teacher_model, student_model: NumpyEmbeddingModel instances taking `features`
+        features: Feature matrix both models embed
+        teacher_embeddings, student_embeddings: Catalog embeddings searched
+        num_queries: Query vectors per search timing
+        k: Neighbors returned per query
+
+    Returns:
+        Dictionary with rows/sec, queries/sec, index sizes and speedups
+    """
+    features = np.asarray(features, dtype=np.float32)
+    teacher_seconds = _best_seconds(lambda: teacher_model.embed(features))
+    student_seconds = _best_seconds(lambda: student_model.embed(features))
+
+    def search(embeddings):
+        index = l2_normalize(embeddings)
+        queries = index[:min(num_queries, len(index))]
+        return _best_seconds(lambda: top_k_indices(queries @ index.T, min(k, len(index))))
+
+    teacher_search = search(teacher_embeddings)
+    student_search = search(student_embeddings)
+    queries = min(num_queries, len(features))
+    return {
+        'teacher_rows_per_second': round(len(features) / teacher_seconds),
+        'student_rows_per_second': round(len(features) / student_seconds),
+        'inference_speedup': round(teacher_seconds / student_seconds, 2),
+        'teacher_queries_per_second': round(queries / teacher_search),
+        'student_queries_per_second': round(queries / student_search),
+        'search_speedup': round(teacher_search / student_search, 2),
+        'teacher_index_mb': round(teacher_embeddings.shape[0] * teacher_embeddings.shape[1] * 4 / (1024 * 1024), 2),
+        'student_index_mb': round(student_embeddings.shape[0] * student_embeddings.shape[1] * 4 / (1024 * 1024), 2),
+        'index_memory_ratio': round(teacher_embeddings.shape[1] / student_embeddings.shape[1], 2)
+    }
+
+def to_numpy_model(model, means=None, stds=None):
+    """In-memory NumpyEmbeddingModel of a Keras model (normalization folded in when given)"""
+    layers = fold_keras_model(model, means, stds)
+    return NumpyEmbeddingModel(
+        [kernel for kernel, _, _ in layers],
+        [bias for _, bias, _ in layers],
+        [activation for _, _, activation in layers],
+        {'raw_features': means is not None and stds is not None}
+    )
+
+def distill_and_report(teacher_model, features, means, stds, embedding_size=DEFAULT_STUDENT_SIZE,
+                       ks=DEFAULT_OVERLAP_KS, num_queries=1000, **distill_kwargs):
+    """
+    Distill a student from a teacher and measure what it keeps and what it saves
+
+    Args:
+        teacher_model: NumpyEmbeddingModel taking raw features
+        features: Raw feature matrix of the catalog
+        means, stds: Feature standardization for the student
+        embedding_size: Student embedding size
+        ks: Cutoffs of the neighbor-overlap report
+        num_queries: Query tracks for overlap and search timing
+        **distill_kwargs: Passed on to distill()
+
+    Returns:
+        Tuple of (student Keras model taking standardized features, report dictionary)
+    """
+    features = np.asarray(features, dtype=np.float32)
+    teacher_embeddings = teacher_model.embed(features)
+    standardized = (features - means) / stds
+
+    start_time = time.perf_counter()
+    student, history = distill(standardized, teacher_embeddings, embedding_size, **distill_kwargs)
+    distill_seconds = time.perf_counter() - start_time
+
+    student_model = to_numpy_model(student, means, stds)
+    student_embeddings = student_model.embed(features)
+
+    report = {
+        'teacher_dim': int(teacher_embeddings.shape[1]),
+        'student_dim': int(student_embeddings.shape[1]),
+        'num_tracks': len(features),
+        'loss': distill_kwargs.get('objective', 'listwise'),
+        'final_loss': round(history['loss'][-1], 6) if history['loss'] else None,
+        'distill_seconds': round(distill_seconds, 1)
+    }
+    report.update(neighbor_overlap(teacher_embeddings, student_embeddings, ks, num_queries))
+    report.update(serving_benchmark(teacher_model, student_model, features, teacher_embeddings,
+                                    student_embeddings, num_queries, min(ks)))
+    return student, report
+
+def main():
+    """Distill an exported content model into a compact student"""
+    parser = argparse.ArgumentParser(description='Distill the content model into a compact serving model')
+    data = parser.add_mutually_exclusive_group(required=True)
+    data.add_argument('--workload', type=str, help='Synthetic workload .npz with features')
+    data.add_argument('--offline-db', type=str, help='Offline SQLite training database')
+    parser.add_argument('--npz', type=str, required=True, help='Exported teacher model (raw-feature input)')
+    parser.add_argument('--embedding-size', type=int, default=DEFAULT_STUDENT_SIZE, help='Student embedding size')
+    parser.add_argument('--hidden-units', type=int, help='Student hidden width (default: 2 * embedding size)')
+    parser.add_argument('--loss', choices=DISTILLATION_LOSSES, default='listwise', help='Distillation loss')
+    parser.add_argument('--temperature', type=float, default=0.3,
+                        help='Listwise softmax temperature (in row standard deviations)')
+    parser.add_argument('--epochs', type=int, default=100, help='Passes over the catalog')
+    parser.add_argument('--batch-size', type=int, default=512, help='Tracks per similarity matrix')
+    parser.add_argument('--learning-rate', type=float, default=0.003, help='Adam learning rate')
+    parser.add_argument('--k', type=int, nargs='+', default=list(DEFAULT_OVERLAP_KS), help='Overlap cutoffs')
+    parser.add_argument('--queries', type=int, default=1000, help='Query tracks for overlap and search timing')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of initialization and batch order')
+    parser.add_argument('--output', type=str, help='Export the student to this .npz (and a .keras next to it)')
+    args = parser.parse_args()
+
+    if tf is None:
+        print("Cannot distill because TensorFlow is not available.", file=sys.stderr)
+        sys.exit(1)
+
+    teacher_model = NumpyEmbeddingModel.load(args.npz)
+    if not teacher_model.metadata.get('raw_features'):
+        parser.error('The teacher must take raw features (export without --no-fold-normalization)')
+    _, _, features = load_interactions(args)
+    stats = compute_stats(iter_chunks(features), features.shape[1])
+    means, stds = stats.mean, stats.safe_std()
+
+    student, report = distill_and_report(
+        teacher_model, features, means, stds,
+        embedding_size=args.embedding_size,
+        ks=args.k,
+        num_queries=args.queries,
+        hidden_units=args.hidden_units,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        learning_rate=args.learning_rate,
+        objective=args.loss,
+        temperature=args.temperature,
+        seed=args.seed
+    )
+
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        export_numpy_model(student, output, means, stds, teacher_model.metadata.get('model_version'))
+        student.save(output.with_suffix('.keras'))
+        report['output'] = str(output)
+        print(f"Student saved to {output} and {output.with_suffix('.keras')}", file=sys.stderr)
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Embedding Cache
+
+This module memoizes track embeddings by a fingerprint of the 11 audio features and
+the model version, so tracks embedded during evaluation, neighbour computation and
+recommendation requests are only run through the model once. It has two tiers:
+
+- an in-process LRU with a bounded number of entries
+- an optional on-disk tier: an open-addressing hash table stored in memory-mapped
+  .npy files, which survives restarts. Every slot has a checksum of its key and
+  embedding, and rows that fail it (torn by a crash during a write) are misses.
+
+get_or_compute() takes a batch of feature rows and runs inference once for all misses.
+
+Usage:
+python embedding_cache.py --npz ../data/models/content-based-model.npz --features features.npy --cache-dir ../data/cache/embeddings
+"""
+
+import json
+import hashlib
+import argparse
+import numpy as np
+from pathlib import Path
+from collections import OrderedDict
+
+# 64-bit mixing constants (splitmix64 finalizer)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+DISK_MAX_LOAD_FACTOR = 0.7
+
+def _mix64(values):
+    """splitmix64 finalizer applied elementwise to a uint64 array"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * _MIX_1
+    values = values ^ (values >> np.uint64(27))
+    values = values * _MIX_2
+    return values ^ (values >> np.uint64(31))
+
+def feature_fingerprints(features, model_version):
+    """
+    Hash each feature row together with the model version into a uint64 key
+
+    Rows are canonicalized to float64 (and -0.0 to 0.0) so the same features give
+    the same key regardless of input dtype. Zero is reserved as the empty-slot
+    marker of the disk tier and never returned.
+    """
+    rows = np.ascontiguousarray(features, dtype=np.float64) + 0.0
+    words = rows.view(np.uint64).reshape(len(rows), -1)
+    seed = int.from_bytes(hashlib.blake2b(str(model_version).encode('utf-8'), digest_size=8).digest(), 'little')
+
+    with np.errstate(over='ignore'):
+        keys = np.full(len(rows), seed, dtype=np.uint64)
+        for column in range(words.shape[1]):
+            keys = _mix64(keys ^ (words[:, column] + _GOLDEN))
+    keys[keys == 0] = 1
+    return keys
+
+def value_checksums(keys, values):
+    """
+    Hash each embedding row together with its key into a uint64 checksum
+
+    A row that was only partly written, or written for another key, does not
+    match the checksum stored for its slot.
+    """
+    words = np.ascontiguousarray(values, dtype=np.float32).view(np.uint32)
+    with np.errstate(over='ignore'):
+        # Odd weights are invertible mod 2**32, so changing any one word changes the sum
+        weights = (_mix64(np.arange(words.shape[1], dtype=np.uint64) + _GOLDEN) | np.uint64(1)).astype(np.uint32)
+        return _mix64(np.asarray(keys, dtype=np.uint64) ^ (words * weights).sum(axis=1, dtype=np.uint64))
+
+class DiskEmbeddingTier:
+    """Open-addressing hash table of embeddings in memory-mapped files"""
+
+    def __init__(self, cache_dir, model_version, dim, capacity=1 << 20):
+        self.directory = Path(cache_dir) / str(model_version)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        header_path = self.directory / 'header.json'
+
+        if header_path.exists():
+            with open(header_path, 'r') as f:
+                header = json.load(f)
+            if header['dim'] != dim:
+                raise ValueError(f"Disk cache at {self.directory} has dim {header['dim']}, expected {dim}")
+            capacity = header['capacity']
+            mode = 'r+'
+        else:
+            mode = 'w+'
+
+        self.dim = dim
+        self.capacity = capacity
+        self.keys = np.lib.format.open_memmap(
+            self.directory / 'keys.npy', mode=mode, dtype=np.uint64, shape=(capacity,)
+        )
+        self.values = np.lib.format.open_memmap(
+            self.directory / 'values.npy', mode=mode, dtype=np.float32, shape=(capacity, dim)
+        )
+        # Caches written before checksums existed get them computed from their values once
+        checksums_path = self.directory / 'checksums.npy'
+        legacy = mode == 'r+' and not checksums_path.exists()
+        self.checksums = np.lib.format.open_memmap(
+            checksums_path, mode='w+' if legacy else mode, dtype=np.uint64, shape=(capacity,)
+        )
+        if legacy:
+            occupied = np.flatnonzero(self.keys)
+            self.checksums[occupied] = value_checksums(self.keys[occupied], self.values[occupied])
+        self.count = int(np.count_nonzero(self.keys)) if mode == 'r+' else 0
+        # Rows found but rejected by their checksum
+        self.rejected = 0
+        self.header_path = header_path
+        self.model_version = model_version
+        self.flush()
+
+    def lookup(self, keys):
+        """Vectorized linear probing; returns slot per key or -1"""
+        slots = (keys % np.uint64(self.capacity)).astype(np.int64)
+        result = np.full(len(keys), -1, dtype=np.int64)
+        active = np.arange(len(keys))
+
+        for _ in range(self.capacity):
+            if not len(active):
+                break
+            stored = self.keys[slots[active]]
+            found = stored == keys[active]
+            result[active[found]] = slots[active[found]]
+            # Stop probing on a hit or an empty slot
+            active = active[~found & (stored != 0)]
+            slots[active] = (slots[active] + 1) % self.capacity
+        return result
+
+    def get(self, keys):
+        """Return (found mask, embeddings for found keys); rows failing their checksum are not found"""
+        slots = self.lookup(keys)
+        found = np.flatnonzero(slots >= 0)
+        embeddings = np.array(self.values[slots[found]])
+        valid = self.checksums[slots[found]] == value_checksums(keys[found], embeddings)
+        self.rejected += int(len(valid) - np.count_nonzero(valid))
+        mask = np.zeros(len(keys), dtype=bool)
+        mask[found[valid]] = True
+        return mask, embeddings[valid]
+
+    def put(self, keys, embeddings):
+        """
+        Insert embeddings; returns the number of rows skipped because the table is full
+
+        New keys are placed by vectorized linear probing: each round, every pending
+        key takes its current slot if that slot is empty and no other pending key
+        claimed it first, and the rest move one slot on. Values are written and
+        flushed before any key is published, so after a crash a stored key never
+        points at an unwritten embedding. An existing key's value is rewritten in
+        place and flushed before its checksum, so a row torn by a crash fails the
+        checksum and is recomputed instead of returned.
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        # One row per key (the last one wins, as with sequential inserts)
+        keys, first_reversed = np.unique(keys[::-1], return_index=True)
+        embeddings = embeddings[::-1][first_reversed]
+
+        slots = self.lookup(keys)
+        existing = slots >= 0
+        # Existing keys keep their slot; only the value (then its checksum) is rewritten
+        if existing.any():
+            self.values[slots[existing]] = embeddings[existing]
+            self.values.flush()
+            self.checksums[slots[existing]] = value_checksums(keys[existing], embeddings[existing])
+
+        new_keys, new_embeddings = keys[~existing], embeddings[~existing]
+        room = max(0, int(np.ceil(self.capacity * DISK_MAX_LOAD_FACTOR - self.count)))
+        skipped = max(0, len(new_keys) - room)
+        new_keys, new_embeddings = new_keys[:room], new_embeddings[:room]
+
+        assigned = np.full(len(new_keys), -1, dtype=np.int64)
+        probe = (new_keys % np.uint64(self.capacity)).astype(np.int64)
+        pending = np.arange(len(new_keys))
+        claimed = np.zeros(0, dtype=np.int64)
+        while len(pending):
+            candidate = probe[pending]
+            free = (self.keys[candidate] == 0) & ~np.isin(candidate, claimed)
+            # Several keys probing the same free slot: the first one gets it
+            _, first = np.unique(candidate[free], return_index=True)
+            winners = pending[free][first]
+            assigned[winners] = probe[winners]
+            claimed = np.concatenate([claimed, probe[winners]])
+            pending = pending[~np.isin(pending, winners)]
+            probe[pending] = (probe[pending] + 1) % self.capacity
+
+        # Values and checksums first, then the keys that make them visible
+        self.values[assigned] = new_embeddings
+        self.checksums[assigned] = value_checksums(new_keys, new_embeddings)
+        self.values.flush()
+        self.checksums.flush()
+        self.keys[assigned] = new_keys
+        self.count += len(new_keys)
+        return skipped
+
+    def flush(self):
+        """Persist the table and its header"""
+        self.keys.flush()
+        self.values.flush()
+        self.checksums.flush()
+        with open(self.header_path, 'w') as f:
+            json.dump({
+                'model_version': self.model_version,
+                'dim': self.dim,
+                'capacity': self.capacity,
+                'count': self.count
+            }, f)
+
+class EmbeddingCache:
+    """Two-tier embedding cache with batch get_or_compute"""
+
+    def __init__(self, embed_fn, model_version, dim, max_entries=100000, cache_dir=None,
+                 disk_capacity=1 << 20):
+        """
+        Args:
+            embed_fn: Callable mapping a (rows, 11) feature array to (rows, dim) embeddings
+            model_version: Model version; part of every cache key
+            dim: Embedding dimension
+            max_entries: Size bound of the in-process LRU
+            cache_dir: Directory of the optional on-disk tier
+            disk_capacity: Number of slots of the disk hash table
+        """
+        self.embed_fn = embed_fn
+        self.model_version = model_version
+        self.dim = dim
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.disk = DiskEmbeddingTier(cache_dir, model_version, dim, disk_capacity) if cache_dir else None
+        self.counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'computed_rows': 0,
+            'evictions': 0,
+            'disk_full_skips': 0
+        }
+
+    def _remember(self, key, embedding):
+        self.memory[key] = np.array(embedding)
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def get_or_compute(self, features):
+        """
+        Embed a batch of feature rows, running inference only for cache misses
+
+        Args:
+            features: Array of shape (rows, 11)
+
+        Returns:
+            float32 array of shape (rows, dim)
+        """
+        features = np.asarray(features)
+        keys = feature_fingerprints(features, self.model_version)
+        result = np.empty((len(keys), self.dim), dtype=np.float32)
+        pending = []
+
+        # Tier 1: in-process LRU
+        for i, key in enumerate(keys.tolist()):
+            embedding = self.memory.get(key)
+            if embedding is None:
+                pending.append(i)
+            else:
+                self.memory.move_to_end(key)
+                result[i] = embedding
+        self.counters['memory_hits'] += len(keys) - len(pending)
+        pending = np.array(pending, dtype=np.int64)
+
+        # Tier 2: disk
+        if self.disk is not None and len(pending):
+            found, embeddings = self.disk.get(keys[pending])
+            hit_rows = pending[found]
+            result[hit_rows] = embeddings
+            for key, embedding in zip(keys[hit_rows].tolist(), embeddings):
+                self._remember(key, embedding)
+            self.counters['disk_hits'] += len(hit_rows)
+            pending = pending[~found]
+
+        # Misses: compute each distinct row once
+        if len(pending):
+            self.counters['misses'] += len(pending)
+            unique_keys, first, inverse = np.unique(keys[pending], return_index=True, return_inverse=True)
+            computed = np.asarray(self.embed_fn(features[pending[first]]), dtype=np.float32)
+            self.counters['computed_rows'] += len(unique_keys)
+            result[pending] = computed[inverse]
+
+            for key, embedding in zip(unique_keys.tolist(), computed):
+                self._remember(key, embedding)
+            if self.disk is not None:
+                self.counters['disk_full_skips'] += self.disk.put(unique_keys, computed)
+
+        return result
+
+    def stats(self):
+        """Hit/miss counters and tier sizes"""
+        lookups = self.counters['memory_hits'] + self.counters['disk_hits'] + self.counters['misses']
+        return {
+            **self.counters,
+            'lookups': lookups,
+            'hit_rate': (lookups - self.counters['misses']) / lookups if lookups else None,
+            'memory_entries': len(self.memory),
+            'disk_entries': self.disk.count if self.disk is not None else None,
+            'disk_rejected_rows': self.disk.rejected if self.disk is not None else None
+        }
+
+    def flush(self):
+        """Persist the disk tier"""
+        if self.disk is not None:
+            self.disk.flush()
+
+def main():
+    """Warm a disk cache from a feature matrix and print cache statistics"""
+    from numpy_inference import NumpyEmbeddingModel
+
+    parser = argparse.ArgumentParser(description='Warm and inspect the embedding cache')
+    parser.add_argument('--npz', type=str, required=True, help='Exported NumPy model (raw-feature input)')
+    parser.add_argument('--features', type=str, required=True, help='.npy feature matrix to embed')
+    parser.add_argument('--cache-dir', type=str, help='Directory of the disk tier')
+    parser.add_argument('--model-version', type=str, help='Model version (defaults to the export metadata)')
+    parser.add_argument('--max-entries', type=int, default=100000, help='In-process LRU size')
+    parser.add_argument('--disk-capacity', type=int, default=1 << 20, help='Disk hash table slots')
+    parser.add_argument('--batch-size', type=int, default=65536, help='Rows per get_or_compute call')
+    args = parser.parse_args()
+
+    model = NumpyEmbeddingModel.load(args.npz)
+    if not model.metadata.get('raw_features'):
+        parser.error('The exported model must take raw features (export without --no-fold-normalization)')
+
+    model_version = args.model_version or model.metadata.get('model_version') or Path(args.npz).stem
+    cache = EmbeddingCache(
+        model.embed,
+        model_version,
+        model.output_dim,
+        max_entries=args.max_entries,
+        cache_dir=args.cache_dir,
+        disk_capacity=args.disk_capacity
+    )
+
+    features = np.load(args.features, mmap_mode='r')
+    for start in range(0, len(features), args.batch_size):
+        cache.get_or_compute(features[start:start + args.batch_size])
+    cache.flush()
+
+    print(json.dumps(cache.stats()))
+
+if __name__ == "__main__":
+    main()
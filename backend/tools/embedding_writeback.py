@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Embedding Write-Back Script
+
+This script computes per-track embeddings with a trained content-based model and
+streams them into the "TrackEmbedding" table using binary COPY FROM STDIN. Rows are
+first loaded into a staging table and then swapped into the live table in a single
+transaction, so readers never see a partially written model version.
+
+Usage:
+python embedding_writeback.py --model ../data/models/content-based-model.keras --model-version 20250301 --batch-size 50000
+"""
+
+import sys
+import io
+import json
+import time
+import struct
+import argparse
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from psycopg2.extras import RealDictCursor
+
+from train_content_model import (
+    FEATURE_COLUMNS,
+    load_env_variables,
+    connect_to_database,
+    extract_features
+)
+
+# Try importing TensorFlow, handle gracefully if not available
+try:
+    import tensorflow as tf
+except ImportError:
+    print("TensorFlow not found, some functionality will be limited")
+    tf = None
+
+# Binary COPY framing (see the PostgreSQL COPY documentation)
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+COPY_TRAILER = struct.pack('>h', -1)
+
+# Type OID of float4, used as the element type of the embedding array
+FLOAT4_OID = 700
+
+EMBEDDING_TABLE = '"TrackEmbedding"'
+STAGING_TABLE = '"TrackEmbedding_staging"'
+COPY_COLUMNS = '("modelVersion", "embedding", "trackId")'
+
+def fetch_track_features(conn):
+    """Fetch the audio features of every track, without building training pairs"""
+    columns = ', '.join(f'f."{column}"' for column in FEATURE_COLUMNS)
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(f"""
+            SELECT t.id AS track_id, {columns}
+            FROM "Track" t
+            JOIN "TrackFeatures" f ON t.id = f."trackId"
+        """)
+        tracks = cursor.fetchall()
+
+    if not tracks:
+        return None, None
+
+    return extract_features(tracks)
+
+def compute_embeddings(model, features, means, stds, batch_size=8192):
+    """Run the model over standardized features in batches"""
+    std_features = ((features - means) / stds).astype(np.float32)
+    embeddings = model.predict(std_features, batch_size=batch_size, verbose=0)
+    return np.asarray(embeddings, dtype=np.float32)
+
+def encode_copy_rows(model_version, embeddings, track_ids):
+    """
+    Encode rows in PostgreSQL binary COPY format
+
+    The fixed-size part of every row (field count, model version and the float4[]
+    embedding) is laid out with a single structured NumPy array; only the variable
+    length track id is appended per row.
+
+    Args:
+        model_version: Model version string written to every row
+        embeddings: float32 array of shape (rows, embedding_size)
+        track_ids: Track ids matching the embedding rows
+
+    Returns:
+        Encoded rows without the COPY header and trailer
+    """
+    rows, dim = embeddings.shape
+    version = model_version.encode('utf-8')
+
+    fixed_dtype = np.dtype([
+        ('field_count', '>i2'),
+        ('version_len', '>i4'),
+        ('version', f'S{len(version)}'),
+        ('array_len', '>i4'),
+        ('ndim', '>i4'),
+        ('has_nulls', '>i4'),
+        ('element_oid', '>i4'),
+        ('dim', '>i4'),
+        ('lower_bound', '>i4'),
+        ('elements', [('len', '>i4'), ('value', '>f4')], (dim,)),
+        ('track_id_len', '>i4')
+    ])
+
+    fixed = np.zeros(rows, dtype=fixed_dtype)
+    fixed['field_count'] = 3
+    fixed['version_len'] = len(version)
+    fixed['version'] = version
+    fixed['array_len'] = 20 + 8 * dim
+    fixed['ndim'] = 1
+    fixed['element_oid'] = FLOAT4_OID
+    fixed['dim'] = dim
+    fixed['lower_bound'] = 1
+    fixed['elements']['len'] = 4
+    fixed['elements']['value'] = embeddings
+
+    encoded_ids = [str(track_id).encode('utf-8') for track_id in track_ids]
+    fixed['track_id_len'] = [len(track_id) for track_id in encoded_ids]
+
+    fixed_bytes = fixed.tobytes()
+    stride = fixed_dtype.itemsize
+
+    buffer = io.BytesIO()
+    for i, track_id in enumerate(encoded_ids):
+        buffer.write(fixed_bytes[i * stride:(i + 1) * stride])
+        buffer.write(track_id)
+
+    return buffer.getvalue()
+
+def write_embeddings(conn, track_ids, embeddings, model_version, batch_size=50000):
+    """
+    Write embeddings for one model version to the database
+
+    All rows are streamed into a temporary staging table with binary COPY, one COPY
+    per batch. The live rows for the model version are then replaced inside the same
+    transaction, so concurrent readers see either the old or the new version.
+
+    Args:
+        conn: Open psycopg2 connection
+        track_ids: Track ids matching the embedding rows
+        embeddings: Array of shape (rows, embedding_size)
+        model_version: Version string identifying the model
+        batch_size: Number of rows per COPY batch
+
+    Returns:
+        Dictionary with row count, elapsed time and rows per second
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    total_rows = len(track_ids)
+    start_time = time.time()
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TEMP TABLE {STAGING_TABLE}
+                (LIKE {EMBEDDING_TABLE} INCLUDING DEFAULTS)
+                ON COMMIT DROP
+            """)
+
+            for start in range(0, total_rows, batch_size):
+                end = min(start + batch_size, total_rows)
+                payload = COPY_HEADER + encode_copy_rows(
+                    model_version,
+                    embeddings[start:end],
+                    track_ids[start:end]
+                ) + COPY_TRAILER
+
+                cursor.copy_expert(
+                    f"COPY {STAGING_TABLE} {COPY_COLUMNS} FROM STDIN WITH (FORMAT binary)",
+                    io.BytesIO(payload)
+                )
+
+                elapsed = time.time() - start_time
+                print(f"  Copied {end}/{total_rows} rows "
+                      f"({end / elapsed if elapsed > 0 else 0:.0f} rows/s)")
+
+            # Swap the staged rows in; nothing is visible to readers until commit
+            cursor.execute(
+                f'DELETE FROM {EMBEDDING_TABLE} WHERE "modelVersion" = %s',
+                (model_version,)
+            )
+            cursor.execute(f"INSERT INTO {EMBEDDING_TABLE} SELECT * FROM {STAGING_TABLE}")
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    total_time = time.time() - start_time
+    return {
+        "model_version": model_version,
+        "rows": total_rows,
+        "embedding_size": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        "seconds": round(total_time, 3),
+        "rows_per_second": round(total_rows / total_time, 1) if total_time > 0 else None
+    }
+
+def main():
+    """Main function to write model embeddings back to the database"""
+    if not tf:
+        print("Cannot compute embeddings because TensorFlow is not available.")
+        sys.exit(1)
+
+    parser = argparse.ArgumentParser(description='Write content-based model embeddings to the database')
+    parser.add_argument('--model', type=str, default='../data/models/content-based-model.keras',
+                        help='Path to the trained Keras model')
+    parser.add_argument('--normalization', type=str, default=None,
+                        help='Path to the normalization JSON (defaults to the file next to the model)')
+    parser.add_argument('--model-version', type=str, default=None,
+                        help='Model version written with every row (defaults to a timestamp)')
+    parser.add_argument('--batch-size', type=int, default=50000, help='Rows per COPY batch')
+    args = parser.parse_args()
+
+    model_path = Path(args.model)
+    norm_path = Path(args.normalization) if args.normalization else \
+        model_path.with_name(f'{model_path.stem}_normalization.json')
+    model_version = args.model_version or datetime.now().strftime('%Y%m%d%H%M%S')
+
+    with open(norm_path, 'r') as f:
+        normalization = json.load(f)
+    means = np.array(normalization['means'])
+    stds = np.array(normalization['stds'])
+
+    print(f"Loading model from {model_path}")
+    model = tf.keras.models.load_model(str(model_path))
+
+    env_vars = load_env_variables()
+    conn = connect_to_database(env_vars)
+    if not conn:
+        print("Failed to connect to database. Exiting.")
+        sys.exit(1)
+
+    try:
+        features, track_ids = fetch_track_features(conn)
+        if features is None:
+            print("No tracks with audio features found in the database.")
+            sys.exit(1)
+
+        print(f"Computing embeddings for {len(track_ids)} tracks")
+        embeddings = compute_embeddings(model, features, means, stds)
+
+        print(f"Writing embeddings for model version {model_version}")
+        stats = write_embeddings(conn, track_ids, embeddings, model_version, args.batch_size)
+    finally:
+        conn.close()
+
+    print(f"Wrote {stats['rows']} rows in {stats['seconds']}s "
+          f"({stats['rows_per_second']} rows/s)")
+    print(json.dumps(stats))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Batched Group-Session Recommendations
+
+This script recommends tracks for many group listening sessions at once. Each
+session has members with seed tracks and optional per-member weights. A member
+vector is the normalized mean of the member's seed embeddings. The group is then
+scored in one of three ways:
+
+- mean: cosine similarity to the mean of the member vectors (every member counts equally)
+- weighted: like mean, with per-member weights (e.g. the host or active listeners)
+- least_misery: the minimum cosine similarity over members, so a track is only
+  recommended if nobody in the group dislikes it
+
+All sessions are scored with one matrix product per block of sessions; for
+least_misery each block is a (sessions x members x tracks) score tensor over
+sessions with the same member count. Tracks the
+session already played (and by default the seed tracks) are excluded before top-k.
+
+Usage:
+python group_recommendations.py recommend --artifact ../src/aiml/models/saved/artifact --sessions sessions.json --strategy least_misery --k 20
+python group_recommendations.py bench --tracks 200000 --sessions 5000
+"""
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+
+from retrieval_eval import l2_normalize, top_k_indices
+
+STRATEGIES = ['mean', 'weighted', 'least_misery']
+
+# Score matrix elements per block (float32), about 256 MB
+DEFAULT_BLOCK_ELEMENTS = 64 * 1024 * 1024
+
+def group_top_k(item_embeddings, seed_tracks, seed_members, member_sessions, num_sessions,
+                k=10, strategy='mean', member_weights=None, exclude_sessions=None,
+                exclude_tracks=None, block_elements=DEFAULT_BLOCK_ELEMENTS):
+    """
+    Top-k tracks for a batch of group sessions
+
+    Args:
+        item_embeddings: L2-normalized catalog embeddings, shape (tracks, dim)
+        seed_tracks: Catalog index of every seed track
+        seed_members: Member index of every seed, non-decreasing; every member has a seed
+        member_sessions: Session index of every member, non-decreasing
+        num_sessions: Number of sessions
+        k: Results per session
+        strategy: One of STRATEGIES
+        member_weights: Per-member weights for the 'weighted' strategy
+        exclude_sessions: Session index of every excluded (session, track) pair
+        exclude_tracks: Catalog index of every excluded (session, track) pair
+        block_elements: Upper bound on score matrix elements per block
+
+    Returns:
+        Tuple of (indices, scores) arrays of shape (num_sessions, k); sessions
+        without members and excluded slots score -inf
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy '{strategy}', expected one of {STRATEGIES}")
+
+    seed_tracks = np.asarray(seed_tracks, dtype=np.int64)
+    seed_members = np.asarray(seed_members, dtype=np.int64)
+    member_sessions = np.asarray(member_sessions, dtype=np.int64)
+    num_tracks = len(item_embeddings)
+    num_members = len(member_sessions)
+    k = min(k, num_tracks)
+
+    indices = np.zeros((num_sessions, k), dtype=np.int64)
+    scores = np.full((num_sessions, k), -np.inf, dtype=np.float32)
+    if not num_members:
+        return indices, scores
+
+    # Member vectors: normalized mean of each member's seed embeddings
+    seed_starts = np.searchsorted(seed_members, np.arange(num_members))
+    member_vectors = l2_normalize(np.add.reduceat(item_embeddings[seed_tracks], seed_starts, axis=0))
+
+    member_starts = np.searchsorted(member_sessions, np.arange(num_sessions + 1))
+    active = np.flatnonzero(np.diff(member_starts) > 0)
+
+    if strategy != 'least_misery':
+        weights = np.ones(num_members, dtype=np.float32)
+        if strategy == 'weighted' and member_weights is not None:
+            weights = np.asarray(member_weights, dtype=np.float32)
+        session_vectors = np.zeros((num_sessions, item_embeddings.shape[1]), dtype=np.float32)
+        session_vectors[active] = l2_normalize(
+            np.add.reduceat(member_vectors * weights[:, None], member_starts[active], axis=0)
+        )
+
+    # Excluded (session, track) pairs, plus every member's seed tracks
+    if exclude_sessions is None:
+        exclude_sessions = np.empty(0, dtype=np.int64)
+        exclude_tracks = np.empty(0, dtype=np.int64)
+    exclude_keys = np.unique(np.concatenate([
+        np.asarray(exclude_sessions, dtype=np.int64) * num_tracks + np.asarray(exclude_tracks, dtype=np.int64),
+        member_sessions[seed_members] * num_tracks + seed_tracks
+    ]))
+    exclude_rows, exclude_cols = exclude_keys // num_tracks, exclude_keys % num_tracks
+
+    # Least misery blocks hold sessions with the same member count, so their member
+    # scores form a dense (sessions x members x tracks) tensor without padding
+    session_sizes = np.diff(member_starts)
+    if strategy == 'least_misery':
+        order = active[np.argsort(session_sizes[active], kind='stable')]
+        groups = np.split(order, np.flatnonzero(np.diff(session_sizes[order])) + 1)
+    else:
+        groups = [active]
+    blocks = []
+    for group in groups:
+        rows_per_session = session_sizes[group[0]] if strategy == 'least_misery' else 1
+        block_size = max(1, int(block_elements // (num_tracks * rows_per_session)))
+        blocks.extend(group[start:start + block_size] for start in range(0, len(group), block_size))
+
+    for block in blocks:
+        if strategy == 'least_misery':
+            size = session_sizes[block[0]]
+            members = member_vectors[member_starts[block, None] + np.arange(size)]
+            block_scores = (members.reshape(-1, members.shape[-1]) @ item_embeddings.T) \
+                .reshape(len(block), size, num_tracks).min(axis=1)
+        else:
+            block_scores = session_vectors[block] @ item_embeddings.T
+
+        # Sessions are sorted, so the block's exclusions are found with searchsorted
+        lookup = np.searchsorted(exclude_rows, block)
+        counts = np.searchsorted(exclude_rows, block, side='right') - lookup
+        positions = np.repeat(lookup - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        block_scores[np.repeat(np.arange(len(block)), counts), exclude_cols[positions]] = -np.inf
+
+        top = top_k_indices(block_scores, k)
+        indices[block] = top
+        scores[block] = np.take_along_axis(block_scores, top, axis=1)
+
+    return indices, scores
+
+class GroupRecommender:
+    """Group recommendations over a catalog of track embeddings"""
+
+    def __init__(self, embeddings, track_ids):
+        self.embeddings = l2_normalize(embeddings)
+        self.track_ids = list(track_ids)
+        self.positions = {track_id: i for i, track_id in enumerate(self.track_ids)}
+
+    def _flatten(self, sessions):
+        """Convert session dictionaries into the index arrays group_top_k expects"""
+        seed_tracks, seed_members = [], []
+        member_sessions, member_weights = [], []
+        exclude_sessions, exclude_tracks = [], []
+
+        for session_index, session in enumerate(sessions):
+            for member in session.get('members', []):
+                tracks = [self.positions[t] for t in member.get('seed_tracks', []) if t in self.positions]
+                if not tracks:
+                    continue  # Members without known seed tracks do not shape the group vector
+                member_index = len(member_sessions)
+                seed_tracks.extend(tracks)
+                seed_members.extend([member_index] * len(tracks))
+                member_sessions.append(session_index)
+                member_weights.append(float(member.get('weight', 1.0)))
+            played = [self.positions[t] for t in session.get('played', []) if t in self.positions]
+            exclude_sessions.extend([session_index] * len(played))
+            exclude_tracks.extend(played)
+
+        return (np.array(seed_tracks, dtype=np.int64), np.array(seed_members, dtype=np.int64),
+                np.array(member_sessions, dtype=np.int64), np.array(member_weights, dtype=np.float32),
+                np.array(exclude_sessions, dtype=np.int64), np.array(exclude_tracks, dtype=np.int64))
+
+    def recommend(self, sessions, k=10, strategy='mean'):
+        """
+        Recommend tracks for a list of sessions
+
+        Args:
+            sessions: List of {"session_id", "members": [{"seed_tracks": [...], "weight"}], "played": [...]}
+            k: Results per session
+            strategy: One of STRATEGIES
+
+        Returns:
+            List of {"session_id", "recommendations": [{"track_id", "score"}]}; sessions
+            without known seed tracks get an empty list
+        """
+        seed_tracks, seed_members, member_sessions, member_weights, exclude_sessions, exclude_tracks = \
+            self._flatten(sessions)
+        indices, scores = group_top_k(
+            self.embeddings, seed_tracks, seed_members, member_sessions, len(sessions),
+            k=k, strategy=strategy, member_weights=member_weights,
+            exclude_sessions=exclude_sessions, exclude_tracks=exclude_tracks
+        )
+
+        results = []
+        for session, row_indices, row_scores in zip(sessions, indices.tolist(), scores.tolist()):
+            results.append({
+                'session_id': session.get('session_id'),
+                'recommendations': [
+                    {'track_id': self.track_ids[i], 'score': score}
+                    for i, score in zip(row_indices, row_scores) if score != -np.inf
+                ]
+            })
+        return results
+
+def random_sessions(num_sessions, num_tracks, max_members=8, max_seeds=10, max_played=30, seed=0):
+    """Random index arrays for benchmarking group_top_k"""
+    rng = np.random.default_rng(seed)
+    members_per_session = rng.integers(2, max_members + 1, num_sessions)
+    member_sessions = np.repeat(np.arange(num_sessions), members_per_session)
+    seeds_per_member = rng.integers(1, max_seeds + 1, len(member_sessions))
+    seed_members = np.repeat(np.arange(len(member_sessions)), seeds_per_member)
+    seed_tracks = rng.integers(0, num_tracks, len(seed_members))
+    played_per_session = rng.integers(0, max_played + 1, num_sessions)
+    exclude_sessions = np.repeat(np.arange(num_sessions), played_per_session)
+    exclude_tracks = rng.integers(0, num_tracks, len(exclude_sessions))
+    member_weights = rng.uniform(0.5, 2.0, len(member_sessions)).astype(np.float32)
+    return seed_tracks, seed_members, member_sessions, member_weights, exclude_sessions, exclude_tracks
+
+def main():
+    """Recommend for sessions from a JSON file, or benchmark the batched engine"""
+    parser = argparse.ArgumentParser(description='Batched group-session recommendations')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    recommend = subparsers.add_parser('recommend', help='Recommend for sessions in a JSON file')
+    recommend.add_argument('--artifact', type=str, required=True, help='Model artifact bundle with embeddings')
+    recommend.add_argument('--sessions', type=str, required=True, help='JSON list of sessions')
+    recommend.add_argument('--strategy', choices=STRATEGIES, default='mean', help='Group aggregation')
+    recommend.add_argument('--k', type=int, default=10, help='Results per session')
+    recommend.add_argument('--output', type=str, help='Write results to this file instead of stdout')
+
+    bench = subparsers.add_parser('bench', help='Time batched recommendations for random sessions')
+    bench.add_argument('--tracks', type=int, default=200000, help='Random catalog size')
+    bench.add_argument('--dim', type=int, default=64, help='Embedding dimension')
+    bench.add_argument('--sessions', type=int, default=5000, help='Number of sessions')
+    bench.add_argument('--k', type=int, default=20, help='Results per session')
+
+    args = parser.parse_args()
+
+    if args.command == 'recommend':
+        from model_artifact import load_artifact
+
+        artifact = load_artifact(args.artifact)
+        recommender = GroupRecommender(np.asarray(artifact.embeddings), artifact.track_ids())
+        with open(args.sessions, 'r') as f:
+            sessions = json.load(f)
+
+        start_time = time.perf_counter()
+        results = recommender.recommend(sessions, k=args.k, strategy=args.strategy)
+        print(f"Scored {len(sessions)} sessions in {time.perf_counter() - start_time:.3f}s", file=sys.stderr)
+
+        if args.output:
+            Path(args.output).write_text(json.dumps(results))
+        else:
+            print(json.dumps(results))
+
+    elif args.command == 'bench':
+        embeddings = l2_normalize(np.random.default_rng(0).standard_normal((args.tracks, args.dim)))
+        arrays = random_sessions(args.sessions, args.tracks)
+        seed_tracks, seed_members, member_sessions, member_weights, exclude_sessions, exclude_tracks = arrays
+
+        results = {'sessions': args.sessions, 'tracks': args.tracks, 'members': int(len(member_sessions))}
+        for strategy in STRATEGIES:
+            start_time = time.perf_counter()
+            group_top_k(
+                embeddings, seed_tracks, seed_members, member_sessions, args.sessions,
+                k=args.k, strategy=strategy, member_weights=member_weights,
+                exclude_sessions=exclude_sessions, exclude_tracks=exclude_tracks
+            )
+            seconds = time.perf_counter() - start_time
+            results[strategy] = {
+                'seconds': round(seconds, 3),
+                'sessions_per_second': round(args.sessions / seconds)
+            }
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
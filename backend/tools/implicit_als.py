@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Implicit-Feedback ALS for User and Track Factors
+
+This script trains a collaborative-filtering model from UserInteraction rows with
+alternating least squares for implicit feedback (Hu, Koren & Volinsky). The
+interactions form a sparse CSR user x track confidence matrix
+C = 1 + alpha * count, or 1 + alpha * log(1 + count / epsilon) with --confidence log.
+Each half-step solves the regularized least-squares systems of all users (then all
+tracks) with a few conjugate-gradient steps, warm-started from the previous factors.
+The CG iterations are vectorized over a block of rows, and blocks run in a thread
+pool. Each solve then costs O(nnz * factors) per CG step instead of a factors^3
+dense solve per row.
+
+Factors are exported as model artifact bundles, the same format as the content
+embeddings:
+    OUTPUT/items   track ids (content model order), feature stats, embeddings = track factors
+    OUTPUT/users   user ids, embeddings = user factors
+
+Usage:
+python implicit_als.py --offline-db ../data/fixtures/bench.db --output ../data/models/als --factors 64 --iterations 15
+python implicit_als.py --workload workload.npz --output ../data/models/als --workers 8
+"""
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from model_artifact import write_artifact
+
+CONFIDENCE_SCHEMES = ['linear', 'log']
+
+# Interactions per CG block; bounds the gathered (factors, nnz) temporaries
+DEFAULT_BLOCK_NNZ = 1 << 19
+
+def build_csr(row_idx, col_idx, num_rows, num_cols):
+    """
+    Aggregate (row, col) interactions into a CSR matrix of counts
+
+    Returns:
+        Tuple of (indptr, indices, counts)
+    """
+    keys, counts = np.unique(
+        np.asarray(row_idx, dtype=np.int64) * num_cols + np.asarray(col_idx, dtype=np.int64),
+        return_counts=True
+    )
+    indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // num_cols, minlength=num_rows), out=indptr[1:])
+    return indptr, (keys % num_cols).astype(np.int64), counts.astype(np.float32)
+
+def transpose_csr(indptr, indices, values, num_cols):
+    """CSR of the transposed matrix"""
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    t_indptr = np.zeros(num_cols + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=num_cols), out=t_indptr[1:])
+    return t_indptr, rows[order], values[order]
+
+def confidence_values(counts, alpha, scheme='linear', epsilon=1.0):
+    """Confidence c_ui from interaction counts"""
+    if scheme == 'linear':
+        return (1.0 + alpha * counts).astype(np.float32)
+    if scheme == 'log':
+        return (1.0 + alpha * np.log1p(counts / epsilon)).astype(np.float32)
+    raise ValueError(f"Unknown confidence scheme '{scheme}', expected one of {CONFIDENCE_SCHEMES}")
+
+def row_blocks(indptr, block_nnz, min_blocks=1):
+    """Split rows into contiguous ranges of roughly block_nnz stored entries"""
+    num_rows = len(indptr) - 1
+    total = int(indptr[-1])
+    block_nnz = max(1, min(block_nnz, -(-total // max(1, min_blocks))))
+    bounds = np.unique(np.searchsorted(indptr, np.arange(0, total, block_nnz), side='right') - 1)
+    bounds = np.unique(np.r_[0, bounds, num_rows])
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+def _segment_sum(values, starts, num_rows, nonempty):
+    """Sum consecutive runs of columns of values (factors, nnz); empty segments are zero"""
+    out = np.zeros((values.shape[0], num_rows), dtype=np.float32)
+    if values.shape[1]:
+        # reduceat along the contiguous axis is several times faster than on axis 0
+        out[:, nonempty] = np.add.reduceat(values, starts[nonempty], axis=1)
+    return out
+
+def _cg_block(start, end, indptr, indices, confidence, X, Y, YtY, regularization, cg_steps):
+    """Update rows [start, end) of X with conjugate-gradient steps, vectorized over rows"""
+    offset = indptr[start]
+    local_ptr = indptr[start:end + 1] - offset
+    counts = np.diff(local_ptr)
+    num_rows = end - start
+    nonempty = counts > 0
+    starts = local_ptr[:-1]
+
+    cols = indices[offset:indptr[end]]
+    conf = confidence[offset:indptr[end]]
+    owner = np.repeat(np.arange(num_rows), counts)
+    # Vectors are kept transposed, (factors, rows) and (factors, nnz), so every
+    # gather and segment sum runs along contiguous memory
+    YiT = np.ascontiguousarray(Y[cols].T)
+
+    def matvec(v):
+        # (YtY + Yt (C_u - I) Y + lambda I) v for every row at once
+        result = YtY @ v
+        result += regularization * v
+        weights = np.einsum('ij,ij->j', YiT, np.take(v, owner, axis=1)) * (conf - 1.0)
+        result += _segment_sum(YiT * weights, starts, num_rows, nonempty)
+        return result
+
+    # Right-hand side Yt C_u p_u with p_u = 1 on observed entries
+    b = _segment_sum(YiT * conf, starts, num_rows, nonempty)
+
+    x = np.ascontiguousarray(X[start:end].T)
+    r = b - matvec(x)
+    p = r.copy()
+    rs_old = np.einsum('ij,ij->j', r, r)
+
+    for _ in range(cg_steps):
+        if not np.any(rs_old > 1e-20):
+            break
+        Ap = matvec(p)
+        step = rs_old / np.maximum(np.einsum('ij,ij->j', p, Ap), 1e-20)
+        x += step * p
+        r -= step * Ap
+        rs_new = np.einsum('ij,ij->j', r, r)
+        p = r + (rs_new / np.maximum(rs_old, 1e-20)) * p
+        rs_old = rs_new
+
+    X[start:end] = x.T
+
+def als_half_step(indptr, indices, confidence, X, Y, regularization, cg_steps, executor, blocks):
+    """Solve for all rows of X with Y fixed"""
+    YtY = (Y.T @ Y).astype(np.float32)
+    futures = [
+        executor.submit(_cg_block, start, end, indptr, indices, confidence, X, Y, YtY,
+                        regularization, cg_steps)
+        for start, end in blocks
+    ]
+    for future in futures:
+        future.result()
+
+def train_als(user_idx, track_idx, num_users, num_tracks, factors=64, iterations=15,
+              regularization=0.01, alpha=40.0, confidence='linear', cg_steps=3, workers=4,
+              block_nnz=DEFAULT_BLOCK_NNZ, seed=42):
+    """
+    Train implicit ALS
+
+    Args:
+        user_idx: User index per interaction
+        track_idx: Track index per interaction
+        num_users: Number of users
+        num_tracks: Number of tracks
+        factors: Latent dimension
+        iterations: Alternating user/track sweeps
+        regularization: L2 regularization lambda
+        alpha: Confidence scale
+        confidence: 'linear' or 'log' confidence scheme
+        cg_steps: Conjugate-gradient steps per solve
+        workers: Threads solving blocks in parallel
+        block_nnz: Interactions per block
+        seed: Seed of the factor initialization
+
+    Returns:
+        Tuple of (user_factors, track_factors, history)
+    """
+    user_indptr, user_cols, counts = build_csr(user_idx, track_idx, num_users, num_tracks)
+    user_conf = confidence_values(counts, alpha, confidence)
+    track_indptr, track_cols, track_conf = transpose_csr(user_indptr, user_cols, user_conf, num_tracks)
+
+    rng = np.random.default_rng(seed)
+    X = (rng.standard_normal((num_users, factors)) * 0.01).astype(np.float32)
+    Y = (rng.standard_normal((num_tracks, factors)) * 0.01).astype(np.float32)
+
+    user_blocks = row_blocks(user_indptr, block_nnz, workers)
+    track_blocks = row_blocks(track_indptr, block_nnz, workers)
+    history = {'iteration_seconds': [], 'nnz': int(user_indptr[-1])}
+
+    print(f"Training ALS on {num_users} users x {num_tracks} tracks, {user_indptr[-1]} non-zeros")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for iteration in range(iterations):
+            start_time = time.perf_counter()
+            als_half_step(user_indptr, user_cols, user_conf, X, Y, regularization, cg_steps,
+                          executor, user_blocks)
+            als_half_step(track_indptr, track_cols, track_conf, Y, X, regularization, cg_steps,
+                          executor, track_blocks)
+            seconds = time.perf_counter() - start_time
+            history['iteration_seconds'].append(round(seconds, 3))
+            print(f"Iteration {iteration + 1}/{iterations}: {seconds:.2f}s")
+
+    return X, Y, history
+
+def load_interactions(args):
+    """
+    Load interactions and the track catalog
+
+    Returns:
+        Tuple of (user_ids, track_ids, user_idx, track_idx, features)
+    """
+    if args.workload:
+        workload = np.load(args.workload)
+        features = workload['features']
+        user_idx = workload['user_idx'].astype(np.int64)
+        track_ids = [f'synthetic_track_{t}' for t in range(len(features))]
+        user_ids = [f'synthetic_user_{u}' for u in range(int(user_idx.max()) + 1)]
+        return user_ids, track_ids, user_idx, workload['track_idx'].astype(np.int64), features
+
+    from data_sources import PostgresDataSource, SQLiteDataSource
+    from train_content_model import connect_to_database, fetch_feature_table, index_interactions, load_env_variables
+
+    if args.offline_db:
+        source = SQLiteDataSource(args.offline_db)
+    else:
+        conn = connect_to_database(load_env_variables())
+        if not conn:
+            print("Failed to connect to database. Exiting.")
+            sys.exit(1)
+        source = PostgresDataSource(conn)
+
+    # The content model's own ingest and indexing, so track rows line up with it
+    features, track_ids, _ = fetch_feature_table(source)
+    interactions = source.fetch_interactions()
+    source.close()
+
+    track_indices = {track_id: i for i, track_id in enumerate(track_ids)}
+    user_idx, track_idx, user_ids = index_interactions(interactions, track_indices, return_users=True)
+    return user_ids, track_ids, user_idx, track_idx, features
+
+def export_factors(output_dir, user_ids, track_ids, user_factors, track_factors, features, extra):
+    """Write user and track factors as model artifact bundles"""
+    output_dir = Path(output_dir)
+    means = features.mean(axis=0) if len(features) else np.zeros(0)
+    stds = features.std(axis=0) if len(features) else np.zeros(0)
+    items = write_artifact(output_dir / 'items', track_ids, means, stds,
+                           embeddings=track_factors, extra={**extra, 'id_kind': 'track'})
+    write_artifact(output_dir / 'users', user_ids, np.zeros(0), np.zeros(0),
+                   embeddings=user_factors, model_version=items['model_version'],
+                   extra={**extra, 'id_kind': 'user'})
+    return items['model_version']
+
+def main():
+    """Train implicit ALS and export user/track factors"""
+    parser = argparse.ArgumentParser(description='Implicit-feedback ALS from user interactions')
+    data = parser.add_mutually_exclusive_group()
+    data.add_argument('--workload', type=str, help='Synthetic workload .npz (skips the database)')
+    data.add_argument('--offline-db', type=str, help='Offline SQLite training database')
+    parser.add_argument('--output', type=str, default='../data/models/als', help='Export directory')
+    parser.add_argument('--factors', type=int, default=64, help='Latent factors')
+    parser.add_argument('--iterations', type=int, default=15, help='ALS sweeps')
+    parser.add_argument('--regularization', type=float, default=0.01, help='L2 regularization')
+    parser.add_argument('--alpha', type=float, default=40.0, help='Confidence scale')
+    parser.add_argument('--confidence', choices=CONFIDENCE_SCHEMES, default='linear', help='Confidence scheme')
+    parser.add_argument('--cg-steps', type=int, default=3, help='Conjugate-gradient steps per solve')
+    parser.add_argument('--workers', type=int, default=4, help='Solver threads')
+    parser.add_argument('--seed', type=int, default=42, help='Initialization seed')
+    args = parser.parse_args()
+
+    load_start = time.perf_counter()
+    user_ids, track_ids, user_idx, track_idx, features = load_interactions(args)
+    print(f"Loaded {len(user_idx)} interactions in {time.perf_counter() - load_start:.2f}s")
+    if not len(user_idx):
+        print("No interactions to train on. Exiting.")
+        sys.exit(1)
+
+    user_factors, track_factors, history = train_als(
+        user_idx, track_idx, len(user_ids), len(track_ids),
+        factors=args.factors,
+        iterations=args.iterations,
+        regularization=args.regularization,
+        alpha=args.alpha,
+        confidence=args.confidence,
+        cg_steps=args.cg_steps,
+        workers=args.workers,
+        seed=args.seed
+    )
+
+    model_version = export_factors(
+        args.output, user_ids, track_ids, user_factors, track_factors, features,
+        extra={
+            'model_type': 'implicit_als',
+            'factors': args.factors,
+            'regularization': args.regularization,
+            'alpha': args.alpha,
+            'confidence': args.confidence,
+            'iterations': args.iterations
+        }
+    )
+    print(json.dumps({'model_version': model_version, 'output': args.output, **history}))
+
+if __name__ == "__main__":
+    main()
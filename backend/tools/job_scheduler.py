@@ -0,0 +1,904 @@
+#!/usr/bin/env python3
+"""
+Local Job Scheduler for Training and Benchmark Runs
+
+Every trainWithGPU call from the Node backend used to start its own
+gpu_accelerator.py process. A burst of requests then oversubscribed the cores
+and memory, and every run slowed down. This module puts those runs in a
+persistent SQLite queue instead, and runs them under a global concurrency limit:
+
+- jobs are "train" (gpu_accelerator.py --action train) or "bench"
+  (benchmark_training.py), with a config, an optional data file and per-job
+  thread and memory budgets
+- a submission is keyed by a hash of (kind, config, data content). If an
+  identical job already finished, its cached result is returned without
+  running anything. If one is queued or running, the submission joins it.
+- at most `workers` jobs run at once, across all processes sharing the state
+  directory. The limit is stored in the queue database (set by `serve
+  --workers` or `config --workers`) and read on every claim. Each job gets
+  threads = CPUs / workers by default through OMP/MKL/TF thread environment
+  variables. A job whose process tree goes over its memory budget is killed.
+- status and cancel work from any process. A cancelled running job is
+  terminated, and jobs orphaned by a dead scheduler are requeued.
+
+Jobs are run by a long-lived `serve` process, by `submit --wait` itself (a
+waiting submitter runs queued jobs while its own is still queued), or by the
+background worker `submit --detach` starts when no worker is alive, which exits
+once the queue is empty. No daemon is required.
+
+Usage:
+python job_scheduler.py submit --kind train --input request.json --wait
+python job_scheduler.py submit --kind bench --config bench.json --threads 4 --memory-mb 4000 --detach
+python job_scheduler.py serve --workers 2
+python job_scheduler.py config --workers 2
+python job_scheduler.py status [--job 12]
+python job_scheduler.py cancel --job 12
+python job_scheduler.py burst --fixture ../data/fixtures/bench.db --jobs 6 --workers 1
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from contextlib import contextmanager
+
+from training_state import write_atomically
+
+TOOLS_DIR = Path(__file__).resolve().parent
+
+# Command line of each job kind, relative to backend/tools
+JOB_SCRIPTS = {
+    'train': TOOLS_DIR.parent / 'src' / 'aiml' / 'python' / 'gpu_accelerator.py',
+    'bench': TOOLS_DIR / 'benchmark_training.py'
+}
+JOB_KINDS = list(JOB_SCRIPTS)
+
+# Job life cycle; done results are the deduplication cache
+ACTIVE_STATUSES = ('queued', 'running')
+FINAL_STATUSES = ('done', 'failed', 'cancelled')
+
+# Shared by every caller regardless of working directory, so the worker limit is global
+DEFAULT_STATE_DIR = TOOLS_DIR.parent / 'data' / 'jobs'
+
+# Seconds between queue and child process checks
+POLL_SECONDS = 0.5
+
+# Concurrent job limit until one is stored with `serve --workers` or `config --workers`
+DEFAULT_WORKER_LIMIT = 1
+
+# Job processes started by this scheduler process, by job id
+_processes = {}
+
+# Environment variable tagging a job's process with its queue and job id, so an
+# orphaned job can be told apart from an unrelated process that reused its pid
+JOB_TAG_VAR = 'JOB_SCHEDULER_JOB'
+
+# Environment variables that cap the thread pools of NumPy, PyTorch and TensorFlow
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    config TEXT NOT NULL,
+    data_path TEXT,
+    threads INTEGER,
+    memory_mb REAL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner_pid INTEGER,
+    child_pid INTEGER,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    pid INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL
+);
+"""
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def job_key(kind, config, data_digest=None):
+    """Deduplication key of a job: its kind, canonical config and data content"""
+    canonical = json.dumps([kind, config, data_digest], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def pid_alive(pid):
+    """Whether a local process with this pid exists"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def process_tree_rss_mb(pid):
+    """Resident memory of a process and its descendants in MB (Linux /proc), or None"""
+    total = None
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total = (total or 0) + int(line.split()[1]) / 1024
+                        break
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children', 'r') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+def job_tag(db_path, job_id):
+    return f'{Path(db_path).resolve()}#{job_id}'
+
+def job_process_alive(pid, tag):
+    """Whether pid is still the job process started with this tag"""
+    if not pid_alive(pid):
+        return False
+    try:
+        with open(f'/proc/{pid}/environ', 'rb') as f:
+            return f'{JOB_TAG_VAR}={tag}'.encode('utf-8') in f.read().split(b'\0')
+    except PermissionError:
+        return True
+    except OSError:
+        # Without /proc trust the pid
+        return pid_alive(pid)
+
+def kill_orphan(pid, tag):
+    """SIGKILL the process group of an orphaned job; returns True if it was still running"""
+    if not job_process_alive(pid, tag):
+        return False
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        return False
+    # The group leader is not our child, so poll until it is gone
+    deadline = time.time() + 10
+    while pid_alive(pid) and time.time() < deadline:
+        time.sleep(0.05)
+    return True
+
+def default_threads(workers):
+    """Threads per job so that `workers` concurrent jobs fill but do not oversubscribe the CPUs"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+class JobQueue:
+    """Persistent job queue in an SQLite database under state_dir"""
+
+    def __init__(self, state_dir=DEFAULT_STATE_DIR):
+        # Absolute, so job paths such as a train result's model_path work from any directory
+        self.state_dir = Path(state_dir).resolve()
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.state_dir / 'queue.db'
+        with self._connect() as conn:
+            # WAL lets status queries read while a worker holds the write lock
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            columns = [row['name'] for row in conn.execute('PRAGMA table_info(jobs)')]
+            if 'child_pid' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN child_pid INTEGER')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Connection holding the database write lock until the block ends"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['config'] = json.loads(job['config'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    def job_dir(self, job_id):
+        """Directory with a job's config, result and log"""
+        return self.state_dir / 'jobs' / str(job_id)
+
+    def store_data(self, data):
+        """Store inline JSON training data content-addressed; returns its path"""
+        payload = json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        path = self.state_dir / 'data' / f'{hashlib.sha256(payload).hexdigest()}.json'
+        if not path.exists():
+            write_atomically(path, lambda f: f.write(payload))
+        return path
+
+    def submit(self, kind, config, data_path=None, threads=None, memory_mb=None):
+        """
+        Queue a job unless an identical one is cached, queued or running
+
+        Args:
+            kind: One of JOB_KINDS
+            config: JSON-serializable job configuration
+            data_path: Optional input file; its content is part of the key
+            threads: Thread budget (default: chosen by the worker)
+            memory_mb: RSS budget of the job's process tree
+
+        Returns:
+            The job, with 'deduplicated' set when an existing job was returned
+        """
+        if kind not in JOB_SCRIPTS:
+            raise ValueError(f"Unknown job kind '{kind}', expected one of {JOB_KINDS}")
+        data_path = str(Path(data_path).resolve()) if data_path else None
+        key = job_key(kind, config, file_digest(data_path) if data_path else None)
+        with self._transaction() as conn:
+            existing = conn.execute(
+                "SELECT * FROM jobs WHERE key = ? AND status IN ('done', 'queued', 'running') "
+                "ORDER BY status = 'done' DESC, id DESC LIMIT 1",
+                (key,)
+            ).fetchone()
+            if existing is not None:
+                job = self._job(existing)
+                job['deduplicated'] = True
+                return job
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, key, status, config, data_path, threads, memory_mb, submitted_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (kind, key, json.dumps(config), data_path, threads, memory_mb, time.time())
+            )
+            job = self._job(conn.execute('SELECT * FROM jobs WHERE id = ?', (cursor.lastrowid,)).fetchone())
+        job['deduplicated'] = False
+        return job
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            return self._job(conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    def list(self, status=None, limit=50):
+        """Most recent jobs first, optionally of one status"""
+        with self._connect() as conn:
+            if status:
+                rows = conn.execute('SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?', (status, limit))
+            else:
+                rows = conn.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,))
+            return [self._job(row) for row in rows]
+
+    def counts(self):
+        """Number of jobs per status"""
+        with self._connect() as conn:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def _requeue_orphans(self, conn):
+        """
+        Return running jobs of dead scheduler processes to the queue (or cancel them)
+
+        The job process runs in its own session and outlives its scheduler, so it
+        is killed first; otherwise the requeued copy would run next to it.
+        """
+        rows = conn.execute("SELECT id, owner_pid, child_pid, cancel_requested FROM jobs WHERE status = 'running'")
+        for row in rows.fetchall():
+            if pid_alive(row['owner_pid']):
+                continue
+            if row['child_pid'] and kill_orphan(row['child_pid'], job_tag(self.db_path, row['id'])):
+                print(f"Killed orphaned process {row['child_pid']} of job {row['id']}", file=sys.stderr)
+            if row['cancel_requested']:
+                conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?",
+                             (time.time(), row['id']))
+            else:
+                conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL, owner_pid = NULL, child_pid = NULL "
+                             "WHERE id = ?", (row['id'],))
+
+    def _worker_limit(self, conn):
+        row = conn.execute("SELECT value FROM settings WHERE name = 'workers'").fetchone()
+        return int(row['value']) if row is not None else DEFAULT_WORKER_LIMIT
+
+    def worker_limit(self):
+        """Maximum number of jobs running at once across all processes"""
+        with self._connect() as conn:
+            return self._worker_limit(conn)
+
+    def set_worker_limit(self, workers):
+        """Store the global concurrent job limit; running jobs above a lowered limit finish"""
+        if workers < 1:
+            raise ValueError(f"The worker limit must be at least 1, got {workers}")
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO settings (name, value) VALUES ('workers', ?)", (str(workers),))
+
+    def _live_workers(self, conn):
+        """Pids of registered worker processes that are alive; dead ones are removed"""
+        alive = []
+        for row in conn.execute('SELECT pid FROM workers ORDER BY started_at').fetchall():
+            if pid_alive(row['pid']):
+                alive.append(row['pid'])
+            else:
+                conn.execute('DELETE FROM workers WHERE pid = ?', (row['pid'],))
+        return alive
+
+    def live_workers(self):
+        with self._transaction() as conn:
+            return self._live_workers(conn)
+
+    def register_worker(self, pid):
+        """Record a process that runs queued jobs, so submitters do not start another"""
+        with self._transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO workers (pid, started_at) VALUES (?, ?)', (pid, time.time()))
+
+    def unregister_worker(self, pid):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM workers WHERE pid = ?', (pid,))
+
+    def retire_if_idle(self, pid):
+        """
+        Unregister a worker once no job is queued and it runs none
+
+        The check and the removal share a transaction with start_worker_unless_alive,
+        so a job submitted meanwhile either keeps this worker or starts a new one.
+        A worker still running a job stays registered and picks up new jobs afterwards.
+
+        Returns:
+            Whether the worker is (now) unregistered and should exit
+        """
+        with self._transaction() as conn:
+            if conn.execute('SELECT 1 FROM workers WHERE pid = ?', (pid,)).fetchone() is None:
+                return True
+            busy = conn.execute(
+                "SELECT 1 FROM jobs WHERE status = 'queued' OR (status = 'running' AND owner_pid = ?) LIMIT 1",
+                (pid,)
+            ).fetchone()
+            if busy is not None:
+                return False
+            conn.execute('DELETE FROM workers WHERE pid = ?', (pid,))
+            return True
+
+    def start_worker_unless_alive(self, start):
+        """
+        Call start() (returning a pid) and register that pid, unless a worker is alive
+
+        Returns:
+            (pid of the live or new worker, whether it was started now)
+        """
+        with self._transaction() as conn:
+            alive = self._live_workers(conn)
+            if alive:
+                return alive[0], False
+            pid = start()
+            conn.execute('INSERT OR REPLACE INTO workers (pid, started_at) VALUES (?, ?)', (pid, time.time()))
+            return pid, True
+
+    def claim(self, owner_pid=None):
+        """
+        Start the oldest queued job if fewer jobs run than the stored worker limit
+
+        Returns:
+            The claimed job, or None when the queue is empty or all slots are busy
+        """
+        with self._transaction() as conn:
+            self._requeue_orphans(conn)
+            running = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+            if running >= self._worker_limit(conn):
+                return None
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, owner_pid = ? WHERE id = ?",
+                (time.time(), owner_pid or os.getpid(), row['id'])
+            )
+            return self._job(conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone())
+
+    def finish(self, job_id, status, result=None, error=None):
+        """Record the final status and result of a job this process is running"""
+        with self._transaction() as conn:
+            # A job requeued on shutdown (or by another scheduler) is no longer ours to finish
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND status = 'running' AND owner_pid = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, os.getpid())
+            )
+
+    def requeue(self, job_id):
+        """Put an interrupted running job back in the queue, or cancel it if that was requested"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+                "WHERE id = ? AND status = 'running' AND cancel_requested = 1",
+                (time.time(), job_id)
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, owner_pid = NULL, child_pid = NULL "
+                "WHERE id = ? AND status = 'running'",
+                (job_id,)
+            )
+
+    def cancel(self, job_id):
+        """
+        Cancel a job: queued jobs are cancelled at once, running jobs are
+        terminated by their worker at its next check
+
+        Returns:
+            The job after the request, or None if it does not exist
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        return self.get(job_id)
+
+    def set_child(self, job_id, pid):
+        """Record the pid (and process group) of a running job's process"""
+        with self._transaction() as conn:
+            conn.execute('UPDATE jobs SET child_pid = ? WHERE id = ?', (pid, job_id))
+
+    def cancel_requested(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+
+def config_flags(config):
+    """Command line flags from a bench config ({"batch_size": 256, "raw_pairs": true} -> --batch-size 256 --raw-pairs)"""
+    flags = []
+    for name, value in config.items():
+        flag = '--' + name.replace('_', '-')
+        if value is True:
+            flags.append(flag)
+        elif value is False or value is None:
+            continue
+        elif isinstance(value, list):
+            for item in value:
+                flags.extend([flag, str(item)])
+        else:
+            flags.extend([flag, str(value)])
+    return flags
+
+def job_command(job, job_dir):
+    """argv of a job; the job writes its JSON result to job_dir/result.json"""
+    script = str(JOB_SCRIPTS[job['kind']])
+    result_path = str(job_dir / 'result.json')
+    if job['kind'] == 'train':
+        command = [sys.executable, script, '--action', 'train', '--config', str(job_dir / 'config.json'),
+                   '--output', result_path]
+        if job['data_path']:
+            command += ['--data', job['data_path']]
+        return command
+    return [sys.executable, script, *config_flags(job['config']), '--output', result_path]
+
+def job_environment(threads, tag):
+    """Environment of a job process with its thread pools capped at `threads`"""
+    env = dict(os.environ)
+    env[JOB_TAG_VAR] = tag
+    # gpu_accelerator.py imports the shared training utilities from here
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(TOOLS_DIR), env.get('PYTHONPATH')]))
+    for name in THREAD_ENV_VARS:
+        env[name] = str(threads)
+    env['TF_NUM_INTEROP_THREADS'] = '1'
+    return env
+
+def stop_process(process):
+    """Terminate a job's process group (autotune probes and data loaders included)"""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+def run_job(queue, job, default_job_threads):
+    """
+    Run a claimed job to completion and record its outcome
+
+    The job's process is polled every POLL_SECONDS: a cancel request terminates it,
+    and so does resident memory of its process tree above the job's memory budget.
+
+    Returns:
+        Final status of the job
+    """
+    job_dir = queue.job_dir(job['id'])
+    job_dir.mkdir(parents=True, exist_ok=True)
+    threads = job['threads'] or default_job_threads
+    memory_mb = job['memory_mb']
+
+    config = dict(job['config'])
+    if job['kind'] == 'train':
+        # Outputs live in the job directory: a cached result must keep pointing at its
+        # own model, not at a shared path a later job overwrites
+        config['model_path'] = str(job_dir / 'model.pt')
+        config.setdefault('snapshot_dir', str(job_dir / 'training_state'))
+        if memory_mb:
+            # Let the trainer abort cleanly at its own stage checks before the hard limit
+            config.setdefault('memory_budgets', {}).setdefault('default', memory_mb)
+    with open(job_dir / 'config.json', 'w') as f:
+        json.dump(config, f, indent=2)
+    result_path = job_dir / 'result.json'
+    if result_path.exists():
+        result_path.unlink()
+
+    print(f"Job {job['id']} ({job['kind']}) started with {threads} threads"
+          f"{f', {memory_mb:.0f} MB' if memory_mb else ''}", file=sys.stderr)
+    error = None
+    status = None
+    with open(job_dir / 'log.txt', 'ab') as log:
+        process = subprocess.Popen(job_command(job, job_dir), stdout=log, stderr=subprocess.STDOUT,
+                                   env=job_environment(threads, job_tag(queue.db_path, job['id'])),
+                                   start_new_session=True)
+        _processes[job['id']] = process
+        try:
+            queue.set_child(job['id'], process.pid)
+            while True:
+                try:
+                    process.wait(timeout=POLL_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                if queue.cancel_requested(job['id']):
+                    status, error = 'cancelled', 'cancelled'
+                elif memory_mb and (process_tree_rss_mb(process.pid) or 0) > memory_mb:
+                    status, error = 'failed', f'exceeded the memory budget of {memory_mb:.0f} MB'
+                else:
+                    continue
+                stop_process(process)
+                break
+        except BaseException:
+            stop_process(process)
+            raise
+        finally:
+            _processes.pop(job['id'], None)
+
+    result = None
+    if result_path.exists():
+        try:
+            with open(result_path, 'r') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            result = None
+    if status is None:
+        if process.returncode == 0 and isinstance(result, dict) and not result.get('error'):
+            status = 'done'
+        else:
+            status = 'failed'
+            error = (result or {}).get('error') if isinstance(result, dict) else None
+            error = error or f'exit code {process.returncode}, see {job_dir / "log.txt"}'
+    queue.finish(job['id'], status, result, error)
+    print(f"Job {job['id']} {status}{f': {error}' if error and status != 'cancelled' else ''}", file=sys.stderr)
+    return status
+
+def work(queue, default_job_threads=None, until=None, stop=None):
+    """
+    Claim and run jobs until `until()` is true or `stop` is set
+
+    Args:
+        queue: JobQueue
+        default_job_threads: Threads of jobs without their own budget (default: CPUs / worker limit)
+        until: Optional callable checked between jobs
+        stop: Optional threading.Event that ends the loop
+    """
+    while not (until and until()) and not (stop and stop.is_set()):
+        if not claim_and_run(queue, default_job_threads):
+            time.sleep(POLL_SECONDS)
+
+def claim_and_run(queue, default_job_threads=None):
+    """Run one queued job if a worker slot is free; returns whether one ran"""
+    job = queue.claim()
+    if job is None:
+        return False
+    try:
+        run_job(queue, job, default_job_threads or default_threads(queue.worker_limit()))
+    except BaseException:
+        queue.requeue(job['id'])
+        raise
+    return True
+
+def serve(queue, workers=None, default_job_threads=None, exit_when_idle=False):
+    """
+    Run one worker thread per slot of the stored limit until interrupted (or until no job is queued)
+
+    Args:
+        queue: JobQueue
+        workers: Optional new global worker limit to store first
+        default_job_threads: Threads of jobs without their own budget (default: CPUs / worker limit)
+        exit_when_idle: Unregister and exit once no job is queued
+    """
+    if workers:
+        queue.set_worker_limit(workers)
+    pid = os.getpid()
+    queue.register_worker(pid)
+    print(f"Serving {queue.db_path} with {queue.worker_limit()} workers", file=sys.stderr)
+    stop = threading.Event()
+    retired = threading.Event()
+
+    def until():
+        if exit_when_idle and (retired.is_set() or queue.retire_if_idle(pid)):
+            retired.set()
+        return retired.is_set()
+
+    threads = []
+    try:
+        while True:
+            threads = [thread for thread in threads if thread.is_alive()]
+            if retired.is_set():
+                if not threads:
+                    break
+            else:
+                # A raised limit gets threads without a restart; claim() enforces a lowered one
+                for _ in range(queue.worker_limit() - len(threads)):
+                    thread = threading.Thread(target=work, args=(queue, default_job_threads),
+                                              kwargs={'until': until, 'stop': stop}, daemon=True)
+                    thread.start()
+                    threads.append(thread)
+            time.sleep(POLL_SECONDS)
+    except KeyboardInterrupt:
+        stop.set()
+        # Interrupted jobs go back to the queue for the next scheduler
+        for job in queue.list(status='running', limit=1000):
+            if job['owner_pid'] == os.getpid():
+                queue.requeue(job['id'])
+        for process in list(_processes.values()):
+            stop_process(process)
+        print("Stopped; running jobs were requeued", file=sys.stderr)
+    finally:
+        queue.unregister_worker(pid)
+
+def start_detached_worker(queue):
+    """
+    Start a background `serve --exit-when-idle` that outlives the caller, unless a worker is alive
+
+    Jobs submitted without --wait need a worker. This one drains the queue under
+    the stored limit and exits once nothing is queued, so no daemon has to be managed.
+
+    Returns:
+        (pid of the live or new worker, whether it was started now)
+    """
+    def start():
+        with open(queue.state_dir / 'worker.log', 'ab') as log:
+            process = subprocess.Popen(
+                [sys.executable, str(Path(__file__).resolve()), '--state-dir', str(queue.state_dir),
+                 'serve', '--exit-when-idle'],
+                stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+            )
+        return process.pid
+
+    return queue.start_worker_unless_alive(start)
+
+def wait_for(queue, job_id, default_job_threads=None):
+    """
+    Wait for a job, running queued jobs while a worker slot is free
+
+    Jobs are only claimed while the awaited job is still queued, so the caller
+    never sits through an unrelated job once its own is running elsewhere.
+    """
+    while True:
+        job = queue.get(job_id)
+        if job['status'] in FINAL_STATUSES:
+            return job
+        if job['status'] == 'running' or not claim_and_run(queue, default_job_threads):
+            time.sleep(POLL_SECONDS)
+
+def burst_benchmark(args):
+    """
+    Aggregate throughput of a burst of bench jobs, unscheduled vs scheduled
+
+    Unscheduled runs start every job at once with default thread pools (what
+    concurrent trainWithGPU calls did); scheduled runs go through a fresh queue.
+    """
+    def bench_config(index):
+        return {
+            'fixture': str(Path(args.fixture).resolve()), 'epochs': args.epochs,
+            'batch_size': args.batch_size, 'seed': args.seed + index
+        }
+
+    report = {'jobs': args.jobs, 'workers': args.workers, 'cpus': os.cpu_count()}
+    pairs = []
+    # A fresh queue, so earlier bursts are not answered from the cache
+    work_dir = Path(tempfile.mkdtemp(prefix='burst_'))
+
+    # Unscheduled: every job starts immediately and competes for all cores
+    unscheduled_dir = work_dir / 'unscheduled'
+    unscheduled_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    processes = []
+    for index in range(args.jobs):
+        output = unscheduled_dir / f'result_{index}.json'
+        command = [sys.executable, str(JOB_SCRIPTS['bench']), *config_flags(bench_config(index)), '--output', str(output)]
+        processes.append((subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), output))
+    for process, output in processes:
+        process.wait()
+        with open(output, 'r') as f:
+            pairs.append(json.load(f))
+    seconds = time.perf_counter() - start
+    report['unscheduled'] = {
+        'seconds': round(seconds, 2),
+        'jobs_per_minute': round(60 * args.jobs / seconds, 2),
+        'mean_pairs_per_second': round(sum(r['pairs_per_second'] for r in pairs) / len(pairs))
+    }
+
+    # Scheduled: the same burst through the queue with `workers` slots
+    queue = JobQueue(work_dir / 'scheduled')
+    queue.set_worker_limit(args.workers)
+    start = time.perf_counter()
+    job_ids = [queue.submit('bench', bench_config(index))['id'] for index in range(args.jobs)]
+    threads = [threading.Thread(target=wait_for, args=(queue, job_id)) for job_id in job_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    results = [queue.get(job_id) for job_id in job_ids]
+    done = [job['result'] for job in results if job['status'] == 'done']
+    report['scheduled'] = {
+        'seconds': round(seconds, 2),
+        'jobs_per_minute': round(60 * args.jobs / seconds, 2),
+        'mean_pairs_per_second': round(sum(r['pairs_per_second'] for r in done) / len(done)) if done else None,
+        'failed': len(results) - len(done)
+    }
+
+    # A resubmitted burst is answered from the cache
+    start = time.perf_counter()
+    cached = [queue.submit('bench', bench_config(index))['deduplicated'] for index in range(args.jobs)]
+    report['resubmitted'] = {'seconds': round(time.perf_counter() - start, 3), 'deduplicated': sum(cached)}
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def _print_job(job, include_result=True):
+    if job is not None and not include_result:
+        job = {key: value for key, value in job.items() if key != 'result'}
+    print(json.dumps(job, indent=2))
+
+def main():
+    """Command line interface for the Node backend and operators"""
+    parser = argparse.ArgumentParser(description='Queue and run training and benchmark jobs')
+    parser.add_argument('--state-dir', type=str, default=str(DEFAULT_STATE_DIR), help='Directory of the queue database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    submit = subparsers.add_parser('submit', help='Queue a job (or return its cached result)')
+    submit.add_argument('--kind', choices=JOB_KINDS, default='train', help='train: gpu_accelerator.py, bench: benchmark_training.py')
+    submit.add_argument('--config', type=str, help='Job configuration JSON file')
+    submit.add_argument('--input', type=str,
+                        help='JSON file of {"config": ..., "training_data": ...} (as written by gpu-accelerator.ts)')
+    submit.add_argument('--data', type=str, help='Training data file (hashed into the deduplication key)')
+    submit.add_argument('--threads', type=int, help='Thread budget of the job (default: CPUs / worker limit)')
+    submit.add_argument('--memory-mb', type=float, help='Memory budget of the job; it is killed above it')
+    submit.add_argument('--wait', action='store_true', help='Wait for the result, running queued jobs meanwhile')
+    submit.add_argument('--detach', action='store_true',
+                        help='Without --wait: unless a worker is alive, start a background one that runs queued jobs, then exits')
+    submit.add_argument('--output', type=str, help='Write the job result JSON to this file (like gpu_accelerator.py --output)')
+
+    serve_parser = subparsers.add_parser('serve', help='Run queued jobs until interrupted')
+    serve_parser.add_argument('--workers', type=int, help='Store this as the global concurrent job limit first')
+    serve_parser.add_argument('--threads', type=int, help='Threads of jobs without a budget (default: CPUs / worker limit)')
+    serve_parser.add_argument('--exit-when-idle', action='store_true', help='Exit once no job is queued')
+
+    config_parser = subparsers.add_parser('config', help='Show or set the global concurrent job limit')
+    config_parser.add_argument('--workers', type=int, help='Concurrent job limit across all processes sharing the queue')
+
+    status = subparsers.add_parser('status', help='Show a job, or recent jobs and counts')
+    status.add_argument('--job', type=int, help='Job id')
+    status.add_argument('--limit', type=int, default=20, help='Jobs listed without --job')
+
+    cancel = subparsers.add_parser('cancel', help='Cancel a queued or running job')
+    cancel.add_argument('--job', type=int, required=True, help='Job id')
+
+    burst = subparsers.add_parser('burst', help='Measure throughput of a job burst with and without the scheduler')
+    burst.add_argument('--fixture', type=str, default='../data/fixtures/bench.db', help='Offline SQLite database')
+    burst.add_argument('--jobs', type=int, default=6, help='Jobs in the burst')
+    burst.add_argument('--workers', type=int, default=1, help='Concurrent job limit of the scheduled run')
+    burst.add_argument('--epochs', type=int, default=1, help='Epochs per bench job')
+    burst.add_argument('--batch-size', type=int, default=256, help='Batch size per bench job')
+    burst.add_argument('--seed', type=int, default=42, help='Seed of the first job (each job gets its own)')
+    args = parser.parse_args()
+
+    # Stop like on Ctrl-C when the Node backend or a service manager terminates us
+    signal.signal(signal.SIGTERM, _interrupt)
+
+    if args.command == 'burst':
+        print(json.dumps(burst_benchmark(args), indent=2))
+        return
+
+    queue = JobQueue(args.state_dir)
+
+    if args.command == 'submit':
+        config, data_path = {}, args.data
+        if args.input:
+            with open(args.input, 'r') as f:
+                request = json.load(f)
+            config = request.get('config') or {}
+            if request.get('training_data') is not None and not data_path:
+                data_path = queue.store_data(request['training_data'])
+        if args.config:
+            with open(args.config, 'r') as f:
+                config = json.load(f)
+        if args.kind == 'bench' and not data_path and config.get('fixture') and os.path.exists(config['fixture']):
+            # A regenerated fixture must not be answered from the cache
+            data_path = config['fixture']
+        job = queue.submit(args.kind, config, data_path, threads=args.threads, memory_mb=args.memory_mb)
+        deduplicated = job['deduplicated']
+        if args.wait and job['status'] not in FINAL_STATUSES:
+            job = wait_for(queue, job['id'])
+            job['deduplicated'] = deduplicated
+        elif args.detach and job['status'] == 'queued':
+            job['worker_pid'], job['worker_started'] = start_detached_worker(queue)
+        if args.output and job['result'] is not None:
+            with open(args.output, 'w') as f:
+                json.dump(job['result'], f, indent=2)
+        _print_job(job)
+        # Failed training results carry their error like gpu_accelerator.py output; only a missing result fails
+        if args.wait and job['status'] != 'done' and job['result'] is None:
+            sys.exit(1)
+
+    elif args.command == 'serve':
+        serve(queue, args.workers, args.threads, exit_when_idle=args.exit_when_idle)
+
+    elif args.command == 'config':
+        if args.workers is not None:
+            queue.set_worker_limit(args.workers)
+        print(json.dumps({'workers': queue.worker_limit(), 'live_workers': queue.live_workers()}, indent=2))
+
+    elif args.command == 'status':
+        if args.job is not None:
+            job = queue.get(args.job)
+            if job is None:
+                print(json.dumps({'error': f'No job {args.job}'}))
+                sys.exit(1)
+            _print_job(job)
+        else:
+            print(json.dumps({
+                'counts': queue.counts(),
+                'jobs': [{key: job[key] for key in ('id', 'kind', 'status', 'submitted_at', 'started_at',
+                                                    'finished_at', 'error')}
+                         for job in queue.list(limit=args.limit)]
+            }, indent=2))
+
+    elif args.command == 'cancel':
+        job = queue.cancel(args.job)
+        if job is None:
+            print(json.dumps({'error': f'No job {args.job}'}))
+            sys.exit(1)
+        _print_job(job, include_result=False)
+
+if __name__ == "__main__":
+    main()
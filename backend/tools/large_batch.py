@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Large-Batch Training: Gradient Accumulation and Layer-Wise Adaptive Optimizers
+
+Throughput of the small content and GPU models rises with batch size, but memory
+caps the batch and plain Adam or SGD converge worse once it grows. This module
+holds the TensorFlow side of the large-batch mode used by train_content_model.py:
+
+- gradient accumulation: the gradients of `accumulation_steps` micro-batches are
+  summed before one optimizer step. Each micro-batch is weighted by its share of
+  the total pair weight, so the step equals the full-batch step of a weighted mean
+  loss exactly, for any batch split.
+- LAMB (Adam direction) and LARS (momentum SGD direction), both layer-wise
+  adaptive: the update of every weight matrix is rescaled by the trust ratio
+  ||w|| / ||update||, so each layer moves by learning_rate times its norm.
+  Biases and BatchNorm parameters get the plain update without weight decay. Keras ships LAMB only from Keras 3
+  on and LARS not at all, so both are implemented here on plain variables.
+
+Accumulation does not make BatchNorm see the large batch. Training-mode
+BatchNorm normalizes each micro-batch with its own statistics, and the moving
+averages are updated once per micro-batch. Normalization noise and
+moving-statistics updates per sample are therefore those of the micro-batch
+size. The `check` command measures the difference.
+
+Usage:
+python large_batch.py check --batch-size 256 --accumulation-steps 8
+"""
+
+import sys
+import json
+import argparse
+import numpy as np
+
+# Try importing TensorFlow, handle gracefully if not available
+try:
+    import tensorflow as tf
+except ImportError:
+    print("TensorFlow not found, some functionality will be limited")
+    tf = None
+
+OPTIMIZERS = ['adam', 'lamb', 'lars']
+
+class LayerwiseAdaptiveOptimizer:
+    """
+    LAMB or LARS on plain TensorFlow variables
+
+    Implements the part of the Keras optimizer interface that train_model uses:
+    a learning_rate variable, build(), variables and apply_gradients().
+    """
+
+    def __init__(self, kind='lamb', learning_rate=0.001, weight_decay=0.0, beta_1=0.9, beta_2=0.999,
+                 epsilon=1e-6, momentum=0.9):
+        """
+        Args:
+            kind: 'lamb' or 'lars'
+            learning_rate: Relative step size per layer (||delta w|| = learning_rate * ||w||)
+            weight_decay: Decoupled weight decay of weight matrices
+            beta_1, beta_2, epsilon: Adam moment parameters (LAMB)
+            momentum: Momentum of the scaled updates (LARS)
+        """
+        if kind not in ('lamb', 'lars'):
+            raise ValueError(f"Unknown layer-wise optimizer '{kind}', expected 'lamb' or 'lars'")
+        self.kind = kind
+        self.learning_rate = tf.Variable(learning_rate, trainable=False, dtype=tf.float32)
+        self.iterations = tf.Variable(0, trainable=False, dtype=tf.int64)
+        self.weight_decay = weight_decay
+        self.beta_1 = beta_1
+        self.beta_2 = beta_2
+        self.epsilon = epsilon
+        self.momentum = momentum
+        self._slots = {}
+        self._slot_order = []
+
+    def build(self, var_list):
+        """Create the moment (LAMB) or momentum (LARS) slots of the variables"""
+        # Keyed by id(): Keras 3 variables are not hashable and have no ref()
+        for variable in var_list:
+            if id(variable) in self._slots:
+                continue
+            count = 2 if self.kind == 'lamb' else 1
+            slots = [tf.Variable(tf.zeros(variable.shape, dtype=variable.dtype), trainable=False)
+                     for _ in range(count)]
+            self._slots[id(variable)] = slots
+            self._slot_order.extend(slots)
+
+    @property
+    def variables(self):
+        """Iteration counter and slots, in build order (for training state snapshots)"""
+        return [self.iterations] + self._slot_order
+
+    def apply_gradients(self, grads_and_vars):
+        """One update of every variable with a gradient"""
+        grads_and_vars = [(gradient, variable) for gradient, variable in grads_and_vars if gradient is not None]
+        self.build([variable for _, variable in grads_and_vars])
+        self.iterations.assign_add(1)
+        step = tf.cast(self.iterations, tf.float32)
+
+        for gradient, variable in grads_and_vars:
+            slots = self._slots[id(variable)]
+            # Weight matrices adapt per layer; biases and BatchNorm vectors do not
+            adaptive = len(variable.shape) > 1
+            if self.kind == 'lamb':
+                m, v = slots
+                m.assign(self.beta_1 * m + (1 - self.beta_1) * gradient)
+                v.assign(self.beta_2 * v + (1 - self.beta_2) * tf.square(gradient))
+                m_hat = m / (1 - self.beta_1 ** step)
+                v_hat = v / (1 - self.beta_2 ** step)
+                update = m_hat / (tf.sqrt(v_hat) + self.epsilon)
+            else:
+                update = tf.convert_to_tensor(gradient)
+            if adaptive:
+                if self.weight_decay:
+                    update += self.weight_decay * variable
+                weight_norm = tf.norm(variable)
+                update_norm = tf.norm(update)
+                trust_ratio = tf.where((weight_norm > 0) & (update_norm > 0), weight_norm / update_norm, 1.0)
+                update *= trust_ratio
+            if self.kind == 'lars':
+                velocity, = slots
+                velocity.assign(self.momentum * velocity + update)
+                update = velocity
+            variable.assign_sub(self.learning_rate * update)
+
+def build_optimizer(name='adam', learning_rate=0.001, weight_decay=0.0):
+    """Keras Adam, or a LayerwiseAdaptiveOptimizer for 'lamb'/'lars'"""
+    if name == 'adam':
+        return tf.keras.optimizers.Adam(learning_rate=learning_rate)
+    if name in ('lamb', 'lars'):
+        return LayerwiseAdaptiveOptimizer(name, learning_rate=learning_rate, weight_decay=weight_decay)
+    raise ValueError(f"Unknown optimizer '{name}', expected one of {OPTIMIZERS}")
+
+class GradientAccumulator:
+    """
+    Weighted sum of micro-batch gradients
+
+    add() takes the gradient of a micro-batch's weighted mean loss and the
+    micro-batch's total weight; mean() returns the gradient of the weighted mean
+    over everything added since the last reset().
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.gradients = None
+        self.total_weight = 0.0
+        self.count = 0
+
+    def add(self, gradients, weight):
+        weight = tf.cast(weight, tf.float32)
+        weighted = [None if gradient is None else tf.convert_to_tensor(gradient) * weight
+                    for gradient in gradients]
+        if self.gradients is None:
+            self.gradients = weighted
+        else:
+            self.gradients = [
+                total if gradient is None else gradient if total is None else total + gradient
+                for total, gradient in zip(self.gradients, weighted)
+            ]
+        self.total_weight += weight
+        self.count += 1
+
+    def mean(self):
+        scale = 1.0 / tf.maximum(self.total_weight, 1e-12)
+        return [None if gradient is None else gradient * scale for gradient in self.gradients]
+
+def accumulation_gap(model, loss_fn, inputs, targets, weights, accumulation_steps, training=True):
+    """
+    Largest relative difference between accumulated and full-batch gradients
+
+    Args:
+        model: Keras model
+        loss_fn: Callable (outputs, targets, weights) -> weighted mean loss
+        inputs: Batch of model inputs
+        targets: Row-aligned loss targets
+        weights: Per-row loss weights
+        accumulation_steps: Number of micro-batches the batch is split into
+        training: Run BatchNorm in training mode (it then normalizes with batch statistics)
+
+    Returns:
+        Maximum over variables of ||accumulated - full|| / ||full||
+    """
+    def gradients(batch, batch_targets, batch_weights):
+        with tf.GradientTape() as tape:
+            loss = loss_fn(model(batch, training=training), batch_targets, batch_weights)
+        return tape.gradient(loss, model.trainable_variables)
+
+    full = gradients(inputs, targets, weights)
+    accumulator = GradientAccumulator()
+    for batch, batch_targets, batch_weights in zip(np.array_split(inputs, accumulation_steps),
+                                                   np.array_split(targets, accumulation_steps),
+                                                   np.array_split(weights, accumulation_steps)):
+        accumulator.add(gradients(batch, batch_targets, batch_weights), np.sum(batch_weights))
+    accumulated = accumulator.mean()
+
+    gaps = [float(tf.norm(a - f) / tf.maximum(tf.norm(f), 1e-12)) for a, f in zip(accumulated, full)]
+    return max(gaps)
+
+def weighted_squared_error(outputs, targets, weights):
+    """Weighted mean over rows of the squared distance to the targets"""
+    errors = tf.reduce_sum(tf.square(outputs - targets), axis=-1)
+    return tf.reduce_sum(weights * errors) / tf.reduce_sum(weights)
+
+def main():
+    """Check gradient accumulation against full-batch gradients on the content model"""
+    parser = argparse.ArgumentParser(description='Large-batch training checks for the content model')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    check = subparsers.add_parser('check', help='Compare accumulated and full-batch gradients')
+    check.add_argument('--batch-size', type=int, default=256, help='Micro-batch size')
+    check.add_argument('--accumulation-steps', type=int, default=8, help='Micro-batches per step')
+    check.add_argument('--feature-dim', type=int, default=11, help='Input features')
+    check.add_argument('--embedding-size', type=int, default=64, help='Embedding size')
+    check.add_argument('--tolerance', type=float, default=1e-4,
+                       help='Maximum relative gradient difference with BatchNorm moving statistics')
+    args = parser.parse_args()
+
+    if tf is None:
+        print("Cannot run the check because TensorFlow is not available.", file=sys.stderr)
+        sys.exit(1)
+
+    from train_content_model import build_embedding_model
+
+    tf.keras.utils.set_random_seed(0)
+    model = build_embedding_model(args.feature_dim, args.embedding_size)
+    rows = args.batch_size * args.accumulation_steps
+    rng = np.random.default_rng(0)
+    inputs = rng.standard_normal((rows, args.feature_dim)).astype(np.float32)
+    targets = rng.standard_normal((rows, args.embedding_size)).astype(np.float32)
+    weights = rng.integers(1, 10, rows).astype(np.float32)
+
+    # Moving statistics: accumulation must reproduce the full-batch gradient
+    moving_gap = accumulation_gap(model, weighted_squared_error, inputs, targets, weights,
+                                  args.accumulation_steps, training=False)
+    # Batch statistics: each micro-batch is normalized on its own, so gradients differ
+    batch_gap = accumulation_gap(model, weighted_squared_error, inputs, targets, weights,
+                                 args.accumulation_steps, training=True)
+
+    print(json.dumps({
+        'batch_size': args.batch_size,
+        'accumulation_steps': args.accumulation_steps,
+        'effective_batch_size': rows,
+        'max_relative_gap_moving_statistics': moving_gap,
+        'max_relative_gap_batch_statistics': batch_gap
+    }, indent=2))
+    if moving_gap > args.tolerance:
+        print(f"Accumulated gradients differ by {moving_gap:.2e} (tolerance {args.tolerance})", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
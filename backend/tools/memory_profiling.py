@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Per-Stage Memory Profiling
+
+This module records peak RSS and the top tracemalloc allocators for each stage of a
+training pipeline (ingest, pair generation, standardization, dataset build, epochs)
+and enforces optional per-stage memory budgets. A watchdog thread samples RSS while a
+stage runs and flags a stage that exceeds its budget; the stage's next check() (or
+its end) raises MemoryBudgetExceeded with a clear message, before the kernel
+OOM-kills the process. Top allocators are the growth since the stage started.
+Stages may nest.
+
+Budgets are given in MB and matched by stage name prefix, e.g. {"epoch": 6000}
+applies to "epoch_1", "epoch_2", ...; the key "default" applies to all stages.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+class MemoryBudgetExceeded(RuntimeError):
+    """Raised when a pipeline stage goes over its memory budget"""
+
+    def __init__(self, stage, rss_mb, budget_mb):
+        super().__init__(
+            f"Stage '{stage}' exceeded its memory budget: {rss_mb:.0f} MB RSS > {budget_mb:.0f} MB"
+        )
+        self.stage = stage
+        self.rss_mb = rss_mb
+        self.budget_mb = budget_mb
+
+def _read_status_mb(field):
+    """Read a memory field (VmRSS, VmHWM) from /proc/self/status in MB"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def current_rss_mb():
+    """Current resident set size in MB"""
+    rss = _read_status_mb('VmRSS')
+    if rss is None and HAS_RESOURCE:
+        # Without /proc fall back to the lifetime peak (KB on Linux, bytes on macOS)
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    return rss
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter (Linux only); returns True on success"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def parse_budgets(values):
+    """Parse ["stage=MB", ...] command line values into a dictionary"""
+    budgets = {}
+    for value in values or []:
+        stage, _, limit = value.partition('=')
+        if not limit:
+            raise ValueError(f"Invalid memory budget '{value}', expected stage=MB")
+        budgets[stage.strip()] = float(limit)
+    return budgets
+
+class _ActiveStage:
+    """Bookkeeping of a stage between entering and leaving stage()"""
+
+    def __init__(self, record, budget):
+        self.record = record
+        self.budget = budget
+        self.violation = None
+        self.stop = threading.Event()
+        self.watchdog = None
+        self.snapshot = None
+        self.peak_reset = False
+        self.kernel_peak = None
+        self.traced_peak = 0
+        self.start_time = time.time()
+
+class MemoryProfiler:
+    """Collects per-stage memory usage and enforces memory budgets"""
+
+    def __init__(self, enabled=True, budgets=None, trace_allocations=True, top_n=10,
+                 sample_interval=0.05):
+        """
+        Args:
+            enabled: Disabled profilers make stage() a no-op
+            budgets: Optional {stage prefix: MB} dictionary
+            trace_allocations: Record tracemalloc top allocators (adds overhead)
+            top_n: Number of allocators to keep per stage
+            sample_interval: Seconds between RSS samples of the watchdog thread
+        """
+        self.enabled = enabled
+        self.budgets = budgets or {}
+        self.trace_allocations = trace_allocations and enabled
+        self.top_n = top_n
+        self.sample_interval = sample_interval
+        self.stages = []
+        # Stages currently entered, outermost first
+        self._active = []
+
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def budget_for(self, stage):
+        """Budget in MB for a stage (longest matching prefix wins)"""
+        matches = [key for key in self.budgets if key != 'default' and stage.startswith(key)]
+        if matches:
+            return self.budgets[max(matches, key=len)]
+        return self.budgets.get('default')
+
+    def _watch(self, active):
+        """Sample RSS until the stage ends; only flags a violation for check() to raise"""
+        while not active.stop.wait(self.sample_interval):
+            rss = current_rss_mb() or 0.0
+            active.record['sampled_peak_rss_mb'] = max(active.record['sampled_peak_rss_mb'], rss)
+            if active.budget is not None and rss > active.budget:
+                active.violation = MemoryBudgetExceeded(active.record['stage'], rss, active.budget)
+                return
+
+    def check(self):
+        """Raise if a running stage is over budget; cheap enough to call per batch"""
+        if not self.enabled or not self._active:
+            return
+        for active in reversed(self._active):
+            if active.violation is not None:
+                raise active.violation
+        rss = current_rss_mb()
+        if rss is None:
+            return
+        for active in reversed(self._active):
+            if active.budget is not None and rss > active.budget:
+                active.violation = MemoryBudgetExceeded(active.record['stage'], rss, active.budget)
+                raise active.violation
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profile the enclosed block as one pipeline stage
+
+        Stages may nest; each keeps its own peak and allocations, and the
+        enclosing stage's peak includes the nested one. A budget violation is
+        raised by the next check() inside the stage, or when the stage ends.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        parent = self._active[-1] if self._active else None
+        active = _ActiveStage({
+            'stage': name,
+            'parent': parent.record['stage'] if parent else None,
+            'budget_mb': self.budget_for(name),
+            'rss_start_mb': current_rss_mb(),
+            'sampled_peak_rss_mb': 0.0
+        }, self.budget_for(name))
+
+        # Resetting the peak counters would lose the enclosing stages' peaks, so save them first
+        kernel_peak = _read_status_mb('VmHWM')
+        traced_peak = tracemalloc.get_traced_memory()[1] if self.trace_allocations else 0
+        for outer in self._active:
+            if outer.peak_reset and kernel_peak is not None:
+                outer.kernel_peak = max(outer.kernel_peak or 0.0, kernel_peak)
+            outer.traced_peak = max(outer.traced_peak, traced_peak)
+        active.peak_reset = reset_peak_rss()
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+            active.snapshot = tracemalloc.take_snapshot()
+
+        self._active.append(active)
+        active.watchdog = threading.Thread(target=self._watch, args=(active,), daemon=True)
+        active.watchdog.start()
+        try:
+            yield
+        finally:
+            active.stop.set()
+            active.watchdog.join()
+            self._active.pop()
+            self._finish_stage(active)
+
+        if active.violation is not None:
+            raise active.violation
+
+    def _finish_stage(self, active):
+        record = active.record
+        rss_end = current_rss_mb()
+        kernel_peak = _read_status_mb('VmHWM') if active.peak_reset else None
+        record['rss_end_mb'] = rss_end
+        record['peak_rss_mb'] = max(
+            value for value in [kernel_peak, active.kernel_peak, record.pop('sampled_peak_rss_mb'), rss_end, 0.0]
+            if value is not None
+        )
+        record['seconds'] = round(time.time() - active.start_time, 3)
+        record['exceeded_budget'] = active.violation is not None
+
+        if self.trace_allocations:
+            _, traced_peak = tracemalloc.get_traced_memory()
+            record['tracemalloc_peak_mb'] = max(traced_peak, active.traced_peak) / (1024 * 1024)
+            # Growth since the stage started, not everything still alive in the process
+            statistics = tracemalloc.take_snapshot().compare_to(active.snapshot, 'lineno')
+            record['top_allocations'] = [
+                {
+                    'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    'size_mb': stat.size_diff / (1024 * 1024),
+                    'count': stat.count_diff
+                }
+                for stat in [stat for stat in statistics if stat.size_diff > 0][:self.top_n]
+            ]
+
+        self.stages.append(record)
+
+        message = f"[memory] {record['stage']}: peak RSS {record['peak_rss_mb']:.0f} MB"
+        if record['budget_mb'] is not None:
+            message += f" (budget {record['budget_mb']:.0f} MB)"
+        print(message, file=sys.stderr)
+
+    def report(self):
+        """Summary of all recorded stages"""
+        return {
+            'pid': os.getpid(),
+            'budgets_mb': self.budgets,
+            'peak_rss_mb': max((s['peak_rss_mb'] for s in self.stages), default=None),
+            'stages': self.stages
+        }
+
+    def write_report(self, path):
+        """Write the report as JSON"""
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        print(f"Memory profile written to {path}", file=sys.stderr)
+
+# Shared no-op profiler for callers that do not profile
+NULL_PROFILER = MemoryProfiler(enabled=False)
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Micro-Batching Scheduler for Embedding and Top-K Queries
+
+Single "similar tracks" or "recommendations" requests are 1 x D by D x N products
+that leave most of the CPU's matmul throughput unused. This module collects
+concurrent requests in an asyncio queue until max_batch_size requests are waiting or
+the oldest has waited max_wait_ms. Each batch then runs as one matrix product in a
+worker thread, and the results are scattered back to the awaiting callers. Latency
+percentiles and a batch-size histogram are tracked per scheduler.
+
+The serve command reads newline-delimited JSON requests on stdin and writes responses
+on stdout as they complete, so a Node.js process can keep one child process open:
+    {"id": 1, "type": "similar", "track_id": "abc", "k": 10}
+    {"id": 2, "type": "query", "vector": [...], "k": 10, "exclude": ["abc"]}
+    {"id": 3, "type": "embed", "features": [11 audio features]}
+    {"id": 4, "type": "stats"}
+
+Usage:
+python microbatch_scheduler.py serve --artifact ../src/aiml/models/saved/artifact --npz ../data/models/content-based-model.npz
+python microbatch_scheduler.py bench --tracks 200000 --clients 256 --requests 20000
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from retrieval_eval import l2_normalize, top_k_indices
+
+LATENCY_WINDOW = 100000
+
+class SchedulerStopped(RuntimeError):
+    """Raised for requests that a stopped scheduler will never answer"""
+
+class MicroBatchScheduler:
+    """Collects concurrent requests into batches for a batch handler"""
+
+    def __init__(self, process_batch, max_batch_size=64, max_wait_ms=2.0, executor=None):
+        """
+        Args:
+            process_batch: Callable mapping a list of request payloads to a list of results;
+                runs in a worker thread
+            max_batch_size: Largest batch handed to process_batch
+            max_wait_ms: Longest time the first request of a batch waits for company
+            executor: Optional executor for process_batch (defaults to one thread)
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.queue = None
+        self.worker = None
+        # Requests taken off the queue whose batch has not been answered yet
+        self.in_flight = []
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.batch_sizes = Counter()
+        self.completed = 0
+        self.started_at = None
+
+    async def start(self):
+        """Start the batching loop on the running event loop"""
+        self.queue = asyncio.Queue()
+        self.started_at = time.perf_counter()
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop; queued and in-flight requests fail with SchedulerStopped"""
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+        pending = self.in_flight
+        self.in_flight = []
+        while self.queue is not None and not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for _, future, _ in pending:
+            if not future.done():
+                future.set_exception(SchedulerStopped("Scheduler stopped before the request was answered"))
+
+    async def submit(self, payload):
+        """Queue one request and wait for its result"""
+        if self.worker is None:
+            raise SchedulerStopped("Scheduler is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((payload, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        """Wait for one request, then gather more until the batch is full or the deadline passes"""
+        # The batch is self.in_flight, so stop() can fail requests taken off the queue
+        batch = self.in_flight
+        batch.append(await self.queue.get())
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            while len(batch) < self.max_batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            remaining = deadline - time.perf_counter()
+            if len(batch) >= self.max_batch_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            batch = self.in_flight = [item for item in batch if not item[1].cancelled()]
+            if not batch:
+                continue
+            self.batch_sizes[len(batch)] += 1
+
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.process_batch, [payload for payload, _, _ in batch]
+                )
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self.in_flight = []
+                continue
+
+            finished = time.perf_counter()
+            for (_, future, submitted), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+                self.latencies.append(finished - submitted)
+            self.completed += len(batch)
+            self.in_flight = []
+
+    def stats(self):
+        """Latency percentiles (ms), throughput and the batch-size histogram"""
+        latencies = np.array(self.latencies) * 1000
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0
+        histogram = Counter()
+        for size, count in self.batch_sizes.items():
+            # Power-of-two buckets: 1, 2, 3-4, 5-8, ...
+            histogram[1 << max(0, (size - 1).bit_length())] += count
+        return {
+            'completed': self.completed,
+            'batches': sum(self.batch_sizes.values()),
+            'mean_batch_size': self.completed / max(1, sum(self.batch_sizes.values())),
+            'qps': round(self.completed / elapsed, 1) if elapsed > 0 else None,
+            'latency_ms': {
+                f'p{percentile}': round(float(np.percentile(latencies, percentile)), 3)
+                for percentile in (50, 90, 99, 99.9)
+            } if len(latencies) else {},
+            'batch_size_histogram': {f'<={bucket}': histogram[bucket] for bucket in sorted(histogram)}
+        }
+
+class CatalogIndex:
+    """Normalized catalog embeddings answering batched cosine top-k queries"""
+
+    def __init__(self, embeddings, track_ids=None):
+        self.embeddings = l2_normalize(embeddings)
+        self.track_ids = track_ids
+        self.positions = {track_id: i for i, track_id in enumerate(track_ids)} if track_ids else {}
+
+    def index_of(self, track_id):
+        position = self.positions.get(track_id)
+        if position is None:
+            raise ValueError(f"Unknown track '{track_id}'")
+        return position
+
+    def top_k(self, queries, k, exclude=None):
+        """
+        Score a batch of query vectors against the catalog
+
+        Args:
+            queries: Array of shape (rows, dim)
+            k: Number of results per row
+            exclude: Optional list (one entry per row) of track indices to skip
+
+        Returns:
+            Tuple of (indices, scores) arrays of shape (rows, k)
+        """
+        scores = l2_normalize(queries) @ self.embeddings.T
+        if exclude is not None:
+            counts = [len(indices) for indices in exclude]
+            if sum(counts):
+                rows = np.repeat(np.arange(len(exclude)), counts)
+                scores[rows, np.concatenate([np.asarray(indices, dtype=np.int64) for indices in exclude])] = -np.inf
+        k = min(k, scores.shape[1])
+        indices = top_k_indices(scores, k)
+        return indices, np.take_along_axis(scores, indices, axis=1)
+
+def topk_batch_handler(index):
+    """Batch handler for {"vector", "k", "exclude"} payloads"""
+
+    def process(payloads):
+        queries = np.stack([np.asarray(payload['vector'], dtype=np.float32) for payload in payloads])
+        max_k = max(payload.get('k', 10) for payload in payloads)
+        exclude = [payload.get('exclude', ()) for payload in payloads]
+        indices, scores = index.top_k(queries, max_k, exclude)
+        return [
+            (indices[row, :payload.get('k', 10)], scores[row, :payload.get('k', 10)])
+            for row, payload in enumerate(payloads)
+        ]
+
+    return process
+
+def embed_batch_handler(model):
+    """Batch handler for raw feature rows, using a NumpyEmbeddingModel"""
+
+    def process(payloads):
+        return list(model.embed(np.asarray(payloads, dtype=np.float32)))
+
+    return process
+
+class RecommendationService:
+    """Routes JSON requests to the embedding and top-k schedulers"""
+
+    def __init__(self, index, model=None, max_batch_size=64, max_wait_ms=2.0):
+        self.index = index
+        self.topk = MicroBatchScheduler(topk_batch_handler(index), max_batch_size, max_wait_ms)
+        self.embed = MicroBatchScheduler(embed_batch_handler(model), max_batch_size, max_wait_ms) \
+            if model is not None else None
+
+    async def start(self):
+        await self.topk.start()
+        if self.embed is not None:
+            await self.embed.start()
+
+    async def stop(self):
+        await self.topk.stop()
+        if self.embed is not None:
+            await self.embed.stop()
+
+    def _results(self, indices, scores):
+        # Excluded and out-of-range slots score -inf, which is not valid JSON
+        ids = self.index.track_ids
+        return [
+            {'track_id': ids[i] if ids else int(i), 'score': float(score)}
+            for i, score in zip(indices.tolist(), scores.tolist()) if score != -np.inf
+        ]
+
+    async def handle(self, request):
+        """Answer one request dictionary"""
+        kind = request.get('type')
+        k = int(request.get('k', 10))
+
+        if kind == 'stats':
+            return {
+                'topk': self.topk.stats(),
+                'embed': self.embed.stats() if self.embed is not None else None
+            }
+        if kind == 'embed':
+            if self.embed is None:
+                raise ValueError("No embedding model loaded (start with --npz)")
+            embedding = await self.embed.submit(request['features'])
+            return {'embedding': embedding.tolist()}
+        if kind == 'similar':
+            position = request['track_index'] if 'track_index' in request else self.index.index_of(request['track_id'])
+            indices, scores = await self.topk.submit({
+                'vector': self.index.embeddings[position],
+                'k': k,
+                'exclude': [position]
+            })
+            return {'results': self._results(indices, scores)}
+        if kind == 'query':
+            vector = request.get('vector')
+            if vector is None:
+                if self.embed is None:
+                    raise ValueError("Query by features needs an embedding model (start with --npz)")
+                vector = await self.embed.submit(request['features'])
+            exclude = [self.index.index_of(track_id) for track_id in request.get('exclude', [])]
+            indices, scores = await self.topk.submit({'vector': vector, 'k': k, 'exclude': exclude})
+            return {'results': self._results(indices, scores)}
+        raise ValueError(f"Unknown request type '{kind}'")
+
+async def serve_stdio(service):
+    """Answer newline-delimited JSON requests from stdin until EOF"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    pending = set()
+
+    async def answer(request):
+        response = {'id': request.get('id')}
+        try:
+            response.update(await service.handle(request))
+        except Exception as e:
+            response['error'] = str(e)
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
+
+    await service.start()
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            sys.stdout.write(json.dumps({'id': None, 'error': f"Invalid JSON: {e}"}) + '\n')
+            sys.stdout.flush()
+            continue
+        task = asyncio.create_task(answer(request))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    if pending:
+        await asyncio.gather(*pending)
+    await service.stop()
+
+async def run_benchmark(index, clients, requests, k, max_batch_size, max_wait_ms, seed=0):
+    """Closed-loop load test: each client issues requests back to back"""
+    scheduler = MicroBatchScheduler(topk_batch_handler(index), max_batch_size, max_wait_ms)
+    await scheduler.start()
+    rng = np.random.default_rng(seed)
+    positions = rng.integers(0, len(index.embeddings), requests)
+    per_client = np.array_split(positions, clients)
+
+    async def client(positions):
+        for position in positions.tolist():
+            await scheduler.submit({'vector': index.embeddings[position], 'k': k, 'exclude': [position]})
+
+    await asyncio.gather(*(client(chunk) for chunk in per_client))
+    stats = scheduler.stats()
+    await scheduler.stop()
+    return stats
+
+def main():
+    """Serve or benchmark batched top-k queries"""
+    parser = argparse.ArgumentParser(description='Micro-batching scheduler for embedding and top-k queries')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help='Answer JSON-lines requests on stdin/stdout')
+    serve.add_argument('--artifact', type=str, required=True, help='Model artifact bundle with embeddings')
+    serve.add_argument('--npz', type=str, help='Exported NumPy model for embed/feature queries')
+
+    bench = subparsers.add_parser('bench', help='Compare batched and unbatched throughput')
+    bench.add_argument('--artifact', type=str, help='Model artifact bundle (random catalog if omitted)')
+    bench.add_argument('--tracks', type=int, default=200000, help='Random catalog size')
+    bench.add_argument('--dim', type=int, default=64, help='Random catalog embedding dimension')
+    bench.add_argument('--clients', type=int, default=256, help='Concurrent clients')
+    bench.add_argument('--requests', type=int, default=20000, help='Total requests')
+    bench.add_argument('--k', type=int, default=10, help='Results per request')
+
+    for subparser in (serve, bench):
+        subparser.add_argument('--max-batch-size', type=int, default=64, help='Largest batch')
+        subparser.add_argument('--max-wait-ms', type=float, default=2.0, help='Longest wait for a batch to fill')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        from model_artifact import load_artifact
+
+        artifact = load_artifact(args.artifact)
+        index = CatalogIndex(np.asarray(artifact.embeddings), artifact.track_ids())
+        model = None
+        if args.npz:
+            from numpy_inference import NumpyEmbeddingModel
+
+            model = NumpyEmbeddingModel.load(args.npz)
+            if not model.metadata.get('raw_features'):
+                parser.error('The exported model must take raw features (export without --no-fold-normalization)')
+        service = RecommendationService(index, model, args.max_batch_size, args.max_wait_ms)
+        asyncio.run(serve_stdio(service))
+
+    elif args.command == 'bench':
+        if args.artifact:
+            from model_artifact import load_artifact
+
+            artifact = load_artifact(args.artifact)
+            index = CatalogIndex(np.asarray(artifact.embeddings), artifact.track_ids())
+        else:
+            index = CatalogIndex(np.random.default_rng(0).standard_normal((args.tracks, args.dim)))
+
+        unbatched_requests = max(1, args.requests // 10)
+        results = {
+            'batched': asyncio.run(run_benchmark(
+                index, args.clients, args.requests, args.k, args.max_batch_size, args.max_wait_ms
+            )),
+            'unbatched': asyncio.run(run_benchmark(
+                index, args.clients, unbatched_requests, args.k, 1, 0.0
+            ))
+        }
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Model Artifact Bundle
+
+This module defines a versioned directory format for trained content-based models.
+A bundle holds a small JSON manifest (version, hashes, shapes, dtypes) next to binary
+sidecars that are memory-mapped on first access:
+
+    manifest.json           format version, model version and file descriptions
+    track_ids.offsets.npy   int64 offsets into track_ids.bin (num_tracks + 1 entries)
+    track_ids.bin.npy       UTF-8 track ids concatenated as uint8
+    means.npy / stds.npy    float64 feature standardization parameters
+    embeddings.npy          float32 track embeddings (optional)
+    features.npy            float32 raw feature matrix (optional)
+    model.keras             copy of the trained model (optional)
+
+Loading a bundle only parses the manifest, so cold load time does not depend on the
+catalog size.
+
+A bundle that readers may have open is never rewritten in place. publish_artifact
+writes every version into a fresh v-<model_version> subdirectory and then atomically
+replaces a CURRENT file naming it; load_artifact follows CURRENT, so a reader sees
+either the old or the new version, never a mix:
+
+    CURRENT                 name of the current version directory
+    v-20250101120000/       complete bundle (manifest.json and sidecars)
+
+Usage:
+python model_artifact.py convert --metadata ../src/aiml/models/content-based-model-metadata.json --output ../data/models/artifacts/1.0.0
+python model_artifact.py convert --normalization ../data/models/content-based-model_normalization.json --model ../data/models/content-based-model.keras --output ../data/models/artifacts/latest
+python model_artifact.py inspect ../data/models/artifacts/latest
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+
+from training_state import write_atomically
+
+ARTIFACT_FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+# Pointer file and version directory prefix of published bundles
+CURRENT_NAME = 'CURRENT'
+VERSION_PREFIX = 'v-'
+
+# Versions kept per published bundle; older ones may still be memory-mapped by readers
+DEFAULT_KEEP_VERSIONS = 2
+
+# Sidecar file names, keyed by their manifest entry
+ARRAY_FILES = {
+    'track_id_offsets': 'track_ids.offsets.npy',
+    'track_id_bytes': 'track_ids.bin.npy',
+    'means': 'means.npy',
+    'stds': 'stds.npy',
+    'embeddings': 'embeddings.npy',
+    'features': 'features.npy'
+}
+MODEL_FILE = 'model.keras'
+HISTORY_FILE = 'history.json'
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Compute the SHA-256 of a file without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def encode_track_ids(track_ids):
+    """Pack track ids into an offsets table and a single UTF-8 byte array"""
+    encoded = [str(track_id).encode('utf-8') for track_id in track_ids]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(track_id) for track_id in encoded], out=offsets[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return offsets, blob
+
+def write_artifact(artifact_dir, track_ids, means, stds, embeddings=None, model_path=None,
+                   history=None, model_version=None, extra=None, features=None):
+    """
+    Write a model artifact bundle
+
+    Sidecars are written first and the manifest last (via an atomic rename), so a
+    directory without a manifest is never mistaken for a complete bundle. Files are
+    written in place; use publish_artifact to replace a bundle readers may have open.
+
+    Args:
+        artifact_dir: Target directory
+        track_ids: Track ids in embedding row order
+        means: Feature means used for standardization
+        stds: Feature standard deviations used for standardization
+        embeddings: Optional array of shape (num_tracks, embedding_size)
+        model_path: Optional path of a saved Keras model to copy into the bundle
+        history: Optional training history dictionary
+        model_version: Version string (defaults to a timestamp)
+        extra: Optional dictionary of additional manifest fields
+        features: Optional raw feature matrix of shape (num_tracks, feature_dim)
+
+    Returns:
+        The manifest dictionary
+    """
+    artifact_dir = Path(artifact_dir)
+    artifact_dir.mkdir(parents=True, exist_ok=True)
+
+    offsets, blob = encode_track_ids(track_ids)
+    arrays = {
+        'track_id_offsets': offsets,
+        'track_id_bytes': blob,
+        'means': np.asarray(means, dtype=np.float64),
+        'stds': np.asarray(stds, dtype=np.float64)
+    }
+    if embeddings is not None:
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.shape[0] != len(track_ids):
+            raise ValueError(
+                f"Got {embeddings.shape[0]} embeddings for {len(track_ids)} track ids"
+            )
+        arrays['embeddings'] = embeddings
+    if features is not None:
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        if features.shape[0] != len(track_ids):
+            raise ValueError(f"Got {features.shape[0]} feature rows for {len(track_ids)} track ids")
+        arrays['features'] = features
+
+    files = {}
+    for name, array in arrays.items():
+        path = artifact_dir / ARRAY_FILES[name]
+        np.save(path, array)
+        files[name] = {
+            'path': path.name,
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'sha256': file_sha256(path)
+        }
+
+    if model_path is not None:
+        target = artifact_dir / MODEL_FILE
+        if Path(model_path).is_dir():
+            raise ValueError(f"Expected a single-file Keras model, got directory {model_path}")
+        shutil.copyfile(model_path, target)
+        files['model'] = {'path': target.name, 'sha256': file_sha256(target)}
+
+    if history is not None:
+        target = artifact_dir / HISTORY_FILE
+        with open(target, 'w') as f:
+            json.dump(history, f)
+        files['history'] = {'path': target.name, 'sha256': file_sha256(target)}
+
+    manifest = {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'model_version': model_version or datetime.now().strftime('%Y%m%d%H%M%S'),
+        'created': datetime.now().isoformat(),
+        'num_tracks': len(track_ids),
+        'feature_dim': int(arrays['means'].shape[0]),
+        'embedding_size': int(embeddings.shape[1]) if embeddings is not None else None,
+        'files': files
+    }
+    if extra:
+        manifest.update(extra)
+
+    tmp_path = artifact_dir / f'{MANIFEST_NAME}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, artifact_dir / MANIFEST_NAME)
+
+    return manifest
+
+def list_versions(artifact_dir):
+    """Version directories of a published bundle, oldest first"""
+    artifact_dir = Path(artifact_dir)
+    if not artifact_dir.is_dir():
+        return []
+    versions = [path for path in artifact_dir.glob(f'{VERSION_PREFIX}*') if path.is_dir()]
+    return sorted(versions, key=lambda path: (path.stat().st_mtime, path.name))
+
+def resolve_artifact_dir(artifact_dir):
+    """Directory holding the manifest: the CURRENT version of a published bundle, else artifact_dir"""
+    artifact_dir = Path(artifact_dir)
+    current = artifact_dir / CURRENT_NAME
+    if current.is_file():
+        return artifact_dir / current.read_text(encoding='utf-8').strip()
+    return artifact_dir
+
+def prune_versions(artifact_dir, keep=DEFAULT_KEEP_VERSIONS):
+    """Delete all but the newest `keep` versions up to and including the current one"""
+    versions = list_versions(artifact_dir)
+    current = resolve_artifact_dir(artifact_dir)
+    if current not in versions:
+        return
+    # Newer directories belong to publishes still in progress
+    older = versions[:versions.index(current)]
+    for path in older[:max(0, len(older) - keep + 1)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+def publish_artifact(artifact_dir, track_ids, means, stds, keep=DEFAULT_KEEP_VERSIONS, **kwargs):
+    """
+    Write a bundle into a fresh version directory and atomically make it current
+
+    Readers that already loaded the previous version keep their memory maps; the
+    newest `keep` versions stay on disk. A plain bundle left in artifact_dir by
+    write_artifact is ignored once CURRENT exists.
+
+    Args:
+        artifact_dir: Published bundle directory (holds CURRENT and the versions)
+        track_ids, means, stds: As for write_artifact
+        keep: Number of versions to keep, including the new one
+        **kwargs: Passed on to write_artifact
+
+    Returns:
+        The manifest dictionary
+    """
+    artifact_dir = Path(artifact_dir)
+    artifact_dir.mkdir(parents=True, exist_ok=True)
+    kwargs['model_version'] = kwargs.get('model_version') or datetime.now().strftime('%Y%m%d%H%M%S')
+
+    # Never write into an existing directory, even for a repeated model version
+    suffix = 0
+    while True:
+        name = f"{VERSION_PREFIX}{kwargs['model_version']}" + (f'-{suffix}' if suffix else '')
+        try:
+            (artifact_dir / name).mkdir()
+            break
+        except FileExistsError:
+            suffix += 1
+
+    manifest = write_artifact(artifact_dir / name, track_ids, means, stds, **kwargs)
+    write_atomically(artifact_dir / CURRENT_NAME, lambda f: f.write(name.encode('utf-8')))
+    prune_versions(artifact_dir, keep)
+    return manifest
+
+class ModelArtifact:
+    """Lazily loaded view of a model artifact bundle"""
+
+    def __init__(self, artifact_dir, manifest):
+        self.artifact_dir = Path(artifact_dir)
+        self.manifest = manifest
+        self._arrays = {}
+        self._track_index = None
+
+    @property
+    def model_version(self):
+        return self.manifest['model_version']
+
+    @property
+    def num_tracks(self):
+        return self.manifest['num_tracks']
+
+    def has(self, name):
+        """Check whether the bundle contains a given file"""
+        return name in self.manifest['files']
+
+    def path(self, name):
+        """Absolute path of a bundle file"""
+        if not self.has(name):
+            raise KeyError(f"Artifact {self.artifact_dir} has no '{name}' file")
+        return self.artifact_dir / self.manifest['files'][name]['path']
+
+    def array(self, name):
+        """Memory-map a binary sidecar on first access"""
+        if name not in self._arrays:
+            array = np.load(self.path(name), mmap_mode='r')
+            expected = self.manifest['files'][name]
+            if array.dtype.str != expected['dtype'] or list(array.shape) != expected['shape']:
+                raise ValueError(
+                    f"'{name}' does not match the manifest: got {array.dtype.str} {list(array.shape)}, "
+                    f"expected {expected['dtype']} {expected['shape']}"
+                )
+            self._arrays[name] = array
+        return self._arrays[name]
+
+    @property
+    def means(self):
+        return self.array('means')
+
+    @property
+    def stds(self):
+        return self.array('stds')
+
+    @property
+    def embeddings(self):
+        return self.array('embeddings')
+
+    @property
+    def features(self):
+        return self.array('features')
+
+    def track_id(self, index):
+        """Decode a single track id without materializing the whole table"""
+        offsets = self.array('track_id_offsets')
+        start, end = int(offsets[index]), int(offsets[index + 1])
+        return self.array('track_id_bytes')[start:end].tobytes().decode('utf-8')
+
+    def track_ids(self):
+        """Decode all track ids"""
+        offsets = self.array('track_id_offsets')
+        blob = self.array('track_id_bytes').tobytes()
+        return [
+            blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+            for i in range(self.num_tracks)
+        ]
+
+    def index_of(self, track_id):
+        """Row index of a track id (builds the lookup table on first use)"""
+        if self._track_index is None:
+            self._track_index = {tid: i for i, tid in enumerate(self.track_ids())}
+        return self._track_index.get(track_id)
+
+    def history(self):
+        """Load the training history, if the bundle has one"""
+        if not self.has('history'):
+            return None
+        with open(self.path('history'), 'r') as f:
+            return json.load(f)
+
+    def verify(self):
+        """Check every file against the SHA-256 recorded in the manifest"""
+        mismatched = [
+            name for name, entry in self.manifest['files'].items()
+            if file_sha256(self.artifact_dir / entry['path']) != entry['sha256']
+        ]
+        if mismatched:
+            raise ValueError(f"Checksum mismatch in {self.artifact_dir}: {', '.join(mismatched)}")
+        return True
+
+def load_artifact(artifact_dir, verify=False):
+    """
+    Open a model artifact bundle
+
+    Only the manifest is read here; sidecars are memory-mapped when first used. A
+    published bundle is resolved to its current version once, so the returned
+    artifact keeps reading that version after a newer one is published.
+
+    Args:
+        artifact_dir: Bundle directory
+        verify: Check all file hashes before returning (reads every file)
+
+    Returns:
+        ModelArtifact instance
+    """
+    artifact_dir = resolve_artifact_dir(artifact_dir)
+    manifest_path = artifact_dir / MANIFEST_NAME
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+
+    if manifest.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported artifact format version {manifest.get('format_version')} "
+            f"in {manifest_path}"
+        )
+
+    artifact = ModelArtifact(artifact_dir, manifest)
+    if verify:
+        artifact.verify()
+    return artifact
+
+def convert_legacy_files(output_dir, metadata_path=None, normalization_path=None,
+                         history_path=None, model_path=None, embeddings_path=None,
+                         model_version=None):
+    """
+    Convert existing training outputs into an artifact bundle
+
+    Accepts either a metadata JSON (as written by save_model_and_metadata or the
+    checked-in content-based-model-metadata.json) or the normalization/history JSON
+    files written by train_model.
+
+    Returns:
+        The manifest dictionary
+    """
+    track_ids = []
+    means = stds = history = None
+
+    if metadata_path:
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+        track_ids = metadata.get('track_ids', [])
+        means = metadata.get('means', metadata.get('feature_means'))
+        stds = metadata.get('stds', metadata.get('feature_stds'))
+        history = metadata.get('training_history')
+        model_version = model_version or metadata.get('model_version')
+
+    if normalization_path:
+        with open(normalization_path, 'r') as f:
+            normalization = json.load(f)
+        means, stds = normalization['means'], normalization['stds']
+
+    if history_path:
+        with open(history_path, 'r') as f:
+            history = json.load(f)
+
+    if means is None or stds is None:
+        raise ValueError("No normalization parameters found; pass --metadata or --normalization")
+
+    embeddings = np.load(embeddings_path) if embeddings_path else None
+
+    return publish_artifact(
+        output_dir,
+        track_ids,
+        means,
+        stds,
+        embeddings=embeddings,
+        model_path=model_path,
+        history=history,
+        model_version=model_version
+    )
+
+def main():
+    """Command line entry point for converting and inspecting bundles"""
+    parser = argparse.ArgumentParser(description='Manage content-based model artifact bundles')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert = subparsers.add_parser('convert', help='Convert existing training outputs into a bundle')
+    convert.add_argument('--output', type=str, required=True, help='Bundle directory to publish a new version in')
+    convert.add_argument('--metadata', type=str, help='Metadata JSON with track ids and normalization')
+    convert.add_argument('--normalization', type=str, help='Normalization JSON written by train_model')
+    convert.add_argument('--history', type=str, help='History JSON written by train_model')
+    convert.add_argument('--model', type=str, help='Saved .keras model to include')
+    convert.add_argument('--embeddings', type=str, help='Embeddings .npy to include')
+    convert.add_argument('--model-version', type=str, help='Model version (defaults to metadata or timestamp)')
+
+    inspect = subparsers.add_parser('inspect', help='Print a bundle manifest')
+    inspect.add_argument('artifact_dir', type=str, help='Bundle directory')
+    inspect.add_argument('--verify', action='store_true', help='Verify file hashes')
+
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        manifest = convert_legacy_files(
+            args.output,
+            metadata_path=args.metadata,
+            normalization_path=args.normalization,
+            history_path=args.history,
+            model_path=args.model,
+            embeddings_path=args.embeddings,
+            model_version=args.model_version
+        )
+        print(f"Wrote artifact {manifest['model_version']} with {manifest['num_tracks']} tracks to {args.output}")
+    elif args.command == 'inspect':
+        try:
+            artifact = load_artifact(args.artifact_dir, verify=args.verify)
+        except (OSError, ValueError) as e:
+            print(f"Error loading artifact: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(artifact.manifest, indent=2))
+
+if __name__ == "__main__":
+    main()
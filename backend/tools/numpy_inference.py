@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+NumPy Inference Engine for the Content-Based Model
+
+This module exports the Sequential embedding model built by train_model
+(BatchNorm -> Dense -> Dropout -> Dense -> Dropout -> Dense tanh) to a plain .npz file
+and runs batched inference with NumPy only. During export:
+
+- BatchNormalization layers are folded into the adjacent Dense layer
+- Dropout layers are dropped (they are the identity at inference time)
+- Feature standardization (means/stds) is optionally folded into the first layer,
+  so the exported model consumes raw audio features
+
+Loading the exported file takes milliseconds and needs no TensorFlow import.
+
+Usage:
+python numpy_inference.py export --model ../data/models/content-based-model.keras --output ../data/models/content-based-model.npz
+python numpy_inference.py verify --model ../data/models/content-based-model.keras --npz ../data/models/content-based-model.npz
+python numpy_inference.py bench --npz ../data/models/content-based-model.npz --rows 1000000
+"""
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+
+NUMPY_MODEL_FORMAT_VERSION = 1
+
+ACTIVATIONS = ['linear', 'relu', 'tanh', 'sigmoid']
+
+def _apply_activation(buffer, activation):
+    """Apply an activation function in place"""
+    if activation == 'relu':
+        np.maximum(buffer, 0, out=buffer)
+    elif activation == 'tanh':
+        np.tanh(buffer, out=buffer)
+    elif activation == 'sigmoid':
+        np.negative(buffer, out=buffer)
+        np.exp(buffer, out=buffer)
+        buffer += 1
+        np.reciprocal(buffer, out=buffer)
+    elif activation != 'linear':
+        raise ValueError(f"Unsupported activation '{activation}'")
+    return buffer
+
+def _batch_norm_affine(layer):
+    """Express an inference-mode BatchNormalization layer as x * scale + shift"""
+    variance = np.asarray(layer.moving_variance, dtype=np.float64)
+    mean = np.asarray(layer.moving_mean, dtype=np.float64)
+    gamma = np.asarray(layer.gamma, dtype=np.float64) if layer.gamma is not None else np.ones_like(mean)
+    beta = np.asarray(layer.beta, dtype=np.float64) if layer.beta is not None else np.zeros_like(mean)
+    scale = gamma / np.sqrt(variance + layer.epsilon)
+    return scale, beta - mean * scale
+
+def fold_keras_model(model, means=None, stds=None):
+    """
+    Convert a Keras Sequential model into a list of folded dense layers
+
+    Args:
+        model: Keras model made of BatchNormalization, Dense and Dropout layers
+        means: Optional feature means to fold into the first layer
+        stds: Optional feature standard deviations to fold into the first layer
+
+    Returns:
+        List of (kernel, bias, activation) tuples in float64
+    """
+    layers = []
+    # Affine transform (x * scale + shift) waiting to be folded into the next Dense
+    pending_scale = None
+    pending_shift = None
+
+    if means is not None and stds is not None:
+        stds = np.asarray(stds, dtype=np.float64)
+        pending_scale = 1.0 / stds
+        pending_shift = -np.asarray(means, dtype=np.float64) / stds
+
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in ('InputLayer', 'Dropout'):
+            continue
+        if kind == 'BatchNormalization':
+            scale, shift = _batch_norm_affine(layer)
+            if layers and layers[-1][2] == 'linear':
+                # Follows a linear Dense layer: fold into its outputs
+                kernel, bias, activation = layers[-1]
+                layers[-1] = (kernel * scale, bias * scale + shift, activation)
+            elif pending_scale is not None:
+                pending_shift = pending_shift * scale + shift
+                pending_scale = pending_scale * scale
+            else:
+                pending_scale, pending_shift = scale, shift
+            continue
+        if kind != 'Dense':
+            raise ValueError(f"Cannot export layer '{layer.name}' of type {kind}")
+
+        kernel = np.asarray(layer.kernel, dtype=np.float64)
+        bias = np.asarray(layer.bias, dtype=np.float64) if layer.use_bias else np.zeros(kernel.shape[1])
+        activation = layer.activation.__name__
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation '{activation}' in layer '{layer.name}'")
+
+        if pending_scale is not None:
+            # (x * s + t) @ W + b == x @ (s[:, None] * W) + (t @ W + b)
+            bias = pending_shift @ kernel + bias
+            kernel = pending_scale[:, None] * kernel
+            pending_scale = pending_shift = None
+
+        layers.append((kernel, bias, activation))
+
+    if pending_scale is not None:
+        raise ValueError("Model ends with a normalization that cannot be folded into a Dense layer")
+
+    return layers
+
+def export_numpy_model(model, output_path, means=None, stds=None, model_version=None):
+    """
+    Export a Keras embedding model to a .npz file
+
+    When means/stds are given they are folded into the first layer and the exported
+    model takes raw (unstandardized) features.
+    """
+    layers = fold_keras_model(model, means, stds)
+
+    arrays = {}
+    for i, (kernel, bias, _) in enumerate(layers):
+        arrays[f'kernel_{i}'] = kernel.astype(np.float32)
+        arrays[f'bias_{i}'] = bias.astype(np.float32)
+
+    metadata = {
+        'format_version': NUMPY_MODEL_FORMAT_VERSION,
+        'model_version': model_version,
+        'activations': [activation for _, _, activation in layers],
+        'input_dim': int(layers[0][0].shape[0]),
+        'output_dim': int(layers[-1][0].shape[1]),
+        'raw_features': means is not None and stds is not None
+    }
+    arrays['metadata'] = np.array(json.dumps(metadata))
+
+    np.savez(output_path, **arrays)
+    return metadata
+
+class NumpyEmbeddingModel:
+    """Batched, allocation-free forward pass over exported dense layers"""
+
+    def __init__(self, kernels, biases, activations, metadata=None):
+        self.kernels = [np.ascontiguousarray(k, dtype=np.float32) for k in kernels]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float32) for b in biases]
+        self.activations = activations
+        self.metadata = metadata or {}
+        self._buffers = {}
+
+    @classmethod
+    def load(cls, path):
+        """Load an exported .npz model"""
+        with np.load(path) as data:
+            metadata = json.loads(str(data['metadata']))
+            if metadata.get('format_version') != NUMPY_MODEL_FORMAT_VERSION:
+                raise ValueError(f"Unsupported NumPy model format in {path}")
+            count = len(metadata['activations'])
+            kernels = [data[f'kernel_{i}'] for i in range(count)]
+            biases = [data[f'bias_{i}'] for i in range(count)]
+        return cls(kernels, biases, metadata['activations'], metadata)
+
+    @property
+    def input_dim(self):
+        return self.kernels[0].shape[0]
+
+    @property
+    def output_dim(self):
+        return self.kernels[-1].shape[1]
+
+    def _layer_buffers(self, rows):
+        """Reuse one output buffer per layer for a given batch size"""
+        if rows not in self._buffers:
+            self._buffers = {rows: [np.empty((rows, k.shape[1]), dtype=np.float32) for k in self.kernels]}
+        return self._buffers[rows]
+
+    def _forward(self, batch, out):
+        buffers = self._layer_buffers(len(batch))
+        x = batch
+        last = len(self.kernels) - 1
+        for i, (kernel, bias, activation) in enumerate(zip(self.kernels, self.biases, self.activations)):
+            target = out if i == last else buffers[i]
+            np.matmul(x, kernel, out=target)
+            target += bias
+            _apply_activation(target, activation)
+            x = target
+        return out
+
+    def embed(self, features, batch_size=16384, out=None):
+        """
+        Compute embeddings for a feature matrix
+
+        Args:
+            features: Array (or memmap) of shape (rows, input_dim)
+            batch_size: Rows per forward pass; bounds temporary memory
+            out: Optional preallocated float32 output of shape (rows, output_dim)
+
+        Returns:
+            float32 array of shape (rows, output_dim)
+        """
+        rows = len(features)
+        if out is None:
+            out = np.empty((rows, self.output_dim), dtype=np.float32)
+
+        for start in range(0, rows, batch_size):
+            end = min(start + batch_size, rows)
+            batch = np.asarray(features[start:end], dtype=np.float32)
+            self._forward(batch, out[start:end])
+        return out
+
+    __call__ = embed
+
+def load_keras_and_normalization(model_path, normalization_path=None):
+    """Load a Keras model and its normalization JSON (TensorFlow import happens here)"""
+    import tensorflow as tf
+
+    model_path = Path(model_path)
+    norm_path = Path(normalization_path) if normalization_path else \
+        model_path.with_name(f'{model_path.stem}_normalization.json')
+
+    model = tf.keras.models.load_model(str(model_path))
+    means = stds = None
+    if norm_path.exists():
+        with open(norm_path, 'r') as f:
+            normalization = json.load(f)
+        means = np.array(normalization['means'])
+        stds = np.array(normalization['stds'])
+    return model, means, stds
+
+def main():
+    """Export, verify or benchmark a NumPy embedding model"""
+    parser = argparse.ArgumentParser(description='TensorFlow-free inference for the content-based model')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export = subparsers.add_parser('export', help='Export a Keras model to .npz')
+    export.add_argument('--model', type=str, required=True, help='Path to the .keras model')
+    export.add_argument('--normalization', type=str, help='Normalization JSON (defaults to the file next to the model)')
+    export.add_argument('--no-fold-normalization', action='store_true',
+                        help='Keep standardization outside the model (inputs must be standardized)')
+    export.add_argument('--model-version', type=str, help='Version recorded in the export')
+    export.add_argument('--output', type=str, required=True, help='Output .npz path')
+
+    verify = subparsers.add_parser('verify', help='Compare NumPy and Keras embeddings')
+    verify.add_argument('--model', type=str, required=True, help='Path to the .keras model')
+    verify.add_argument('--normalization', type=str, help='Normalization JSON')
+    verify.add_argument('--npz', type=str, required=True, help='Exported .npz model')
+    verify.add_argument('--rows', type=int, default=10000, help='Number of random rows to compare')
+    verify.add_argument('--tolerance', type=float, default=1e-4, help='Maximum absolute difference')
+
+    bench = subparsers.add_parser('bench', help='Measure load time and inference throughput')
+    bench.add_argument('--npz', type=str, required=True, help='Exported .npz model')
+    bench.add_argument('--rows', type=int, default=1000000, help='Number of rows to embed')
+    bench.add_argument('--batch-size', type=int, default=16384, help='Rows per forward pass')
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        model, means, stds = load_keras_and_normalization(args.model, args.normalization)
+        if args.no_fold_normalization:
+            means = stds = None
+        metadata = export_numpy_model(model, args.output, means, stds, args.model_version)
+        print(json.dumps(metadata))
+
+    elif args.command == 'verify':
+        model, means, stds = load_keras_and_normalization(args.model, args.normalization)
+        numpy_model = NumpyEmbeddingModel.load(args.npz)
+
+        rng = np.random.default_rng(0)
+        standardized = rng.standard_normal((args.rows, numpy_model.input_dim)).astype(np.float32)
+        expected = model.predict(standardized, batch_size=4096, verbose=0)
+        if numpy_model.metadata.get('raw_features'):
+            inputs = standardized * stds + means
+        else:
+            inputs = standardized
+        actual = numpy_model.embed(inputs)
+
+        max_error = float(np.max(np.abs(actual - expected)))
+        print(json.dumps({'rows': args.rows, 'max_abs_error': max_error}))
+        if max_error > args.tolerance:
+            print(f"Embeddings differ by {max_error} (tolerance {args.tolerance})", file=sys.stderr)
+            sys.exit(1)
+
+    elif args.command == 'bench':
+        start_time = time.perf_counter()
+        numpy_model = NumpyEmbeddingModel.load(args.npz)
+        load_ms = (time.perf_counter() - start_time) * 1000
+
+        features = np.random.default_rng(0).standard_normal((args.rows, numpy_model.input_dim)).astype(np.float32)
+        out = np.empty((args.rows, numpy_model.output_dim), dtype=np.float32)
+        numpy_model.embed(features[:args.batch_size], args.batch_size)  # Warm up
+
+        start_time = time.perf_counter()
+        numpy_model.embed(features, args.batch_size, out=out)
+        seconds = time.perf_counter() - start_time
+
+        print(json.dumps({
+            'load_ms': round(load_ms, 3),
+            'rows': args.rows,
+            'seconds': round(seconds, 4),
+            'rows_per_second': round(args.rows / seconds)
+        }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Offline Retrieval Evaluation for Track Embeddings
+
+This script holds out a fraction of each user's interactions, builds a query vector
+per user from the mean embedding of the remaining tracks, and ranks the whole catalog
+for every user by cosine similarity. Users are scored in blocks: one matrix
+multiplication per block, a grouped argpartition for the top k, and a sorted-key lookup to
+find held-out hits. Blocks run in parallel threads (NumPy releases the GIL in
+matmul and partitioning). recall@k, MAP@k and NDCG@k for all requested k come out of
+the same pass.
+
+Usage:
+python retrieval_eval.py --workload workload.npz --npz ../data/models/content-based-model.npz --k 10 20 50 100
+python retrieval_eval.py --offline-db ../data/fixtures/bench.db --npz ../data/models/content-based-model.npz
+"""
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_KS = (10, 20, 50, 100)
+
+# Score matrix elements per block (float32), about 256 MB
+DEFAULT_BLOCK_ELEMENTS = 64 * 1024 * 1024
+
+def holdout_split(user_idx, track_idx, holdout_fraction=0.2, min_interactions=2, seed=42):
+    """
+    Choose held-out interactions per user
+
+    Each user with at least min_interactions unique tracks keeps
+    ceil(holdout_fraction * n) of them (at least one, at most n - 1) for evaluation.
+
+    Returns:
+        Boolean mask over the interactions; True marks held-out rows
+    """
+    user_idx = np.asarray(user_idx, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+
+    # Random order within each user
+    order = np.lexsort((rng.random(len(user_idx)), user_idx))
+    sorted_users = user_idx[order]
+    starts = np.flatnonzero(np.r_[True, sorted_users[1:] != sorted_users[:-1]])
+    counts = np.diff(np.r_[starts, len(sorted_users)])
+
+    num_holdout = np.ceil(counts * holdout_fraction).astype(np.int64)
+    num_holdout = np.clip(num_holdout, 1, np.maximum(counts - 1, 0))
+    num_holdout[counts < min_interactions] = 0
+
+    rank = np.arange(len(sorted_users)) - np.repeat(starts, counts)
+    mask = np.zeros(len(user_idx), dtype=bool)
+    mask[order] = rank < np.repeat(num_holdout, counts)
+    return mask
+
+def _gather_rows(indptr, indices, rows):
+    """Concatenate the CSR rows of the given users without a Python loop"""
+    counts = indptr[rows + 1] - indptr[rows]
+    offsets = np.repeat(indptr[rows] - np.cumsum(counts) + counts, counts)
+    return counts, indices[offsets + np.arange(counts.sum())]
+
+def to_csr_sorted(user_idx, track_idx, num_users):
+    """CSR of already-unique (user, track) interactions sorted by user and track"""
+    order = np.lexsort((track_idx, user_idx))
+    indptr = np.zeros(num_users + 1, dtype=np.int64)
+    np.cumsum(np.bincount(user_idx, minlength=num_users), out=indptr[1:])
+    return indptr, np.ascontiguousarray(track_idx[order], dtype=np.int64)
+
+def l2_normalize(matrix):
+    """Row-normalize a float32 matrix (zero rows stay zero)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def user_query_vectors(indptr, indices, item_embeddings):
+    """Mean of the normalized embeddings of each user's tracks, normalized again"""
+    num_users = len(indptr) - 1
+    queries = np.zeros((num_users, item_embeddings.shape[1]), dtype=np.float32)
+    counts = np.diff(indptr)
+    active = np.flatnonzero(counts)
+    if len(active):
+        sums = np.add.reduceat(item_embeddings[indices], indptr[active], axis=0)
+        queries[active] = sums / counts[active, None]
+    return l2_normalize(queries)
+
+def top_k_indices(scores, k):
+    """
+    Column indices of the k largest scores per row, best first
+
+    For wide rows the columns are split into strided groups; the top k scores lie
+    in the k groups with the largest maxima, so only those groups are partitioned.
+    """
+    rows, n = scores.shape
+    group = n // (64 * k)
+    if group < 2:
+        candidates = None
+        values = scores
+    else:
+        # Group j holds columns j, j + chunks, j + 2 * chunks, ...
+        chunks = n // group
+        maxima = scores[:, :chunks * group].reshape(rows, group, chunks).max(axis=1)
+        best = np.argpartition(maxima, chunks - k, axis=1)[:, chunks - k:]
+        candidates = (best[:, :, None] + np.arange(group) * chunks).reshape(rows, -1)
+        if chunks * group < n:
+            tail = np.broadcast_to(np.arange(chunks * group, n), (rows, n - chunks * group))
+            candidates = np.concatenate([candidates, tail], axis=1)
+        values = np.take_along_axis(scores, candidates, axis=1)
+
+    top = np.argpartition(values, values.shape[1] - k, axis=1)[:, values.shape[1] - k:]
+    top_values = np.take_along_axis(values, top, axis=1)
+    top = np.take_along_axis(top, np.argsort(-top_values, axis=1, kind='stable'), axis=1)
+    return top if candidates is None else np.take_along_axis(candidates, top, axis=1)
+
+def _block_metrics(block_users, queries, item_embeddings, seen, relevant, ks, num_tracks):
+    """Score one block of users and return metric sums"""
+    seen_indptr, seen_indices = seen
+    rel_indptr, rel_indices = relevant
+    max_k = max(ks)
+
+    scores = queries[block_users] @ item_embeddings.T
+
+    # Never recommend tracks the user already interacted with
+    seen_counts, cols = _gather_rows(seen_indptr, seen_indices, block_users)
+    scores[np.repeat(np.arange(len(block_users)), seen_counts), cols] = -np.inf
+
+    top = top_k_indices(scores, max_k)
+
+    # Held-out hits via sorted (user, track) keys
+    rel_counts, rel_tracks = _gather_rows(rel_indptr, rel_indices, block_users)
+    rel_keys = np.repeat(block_users, rel_counts) * num_tracks + rel_tracks
+    query_keys = block_users[:, None].astype(np.int64) * num_tracks + top
+    positions = np.minimum(np.searchsorted(rel_keys, query_keys), len(rel_keys) - 1)
+    hits = (rel_keys[positions] == query_keys).astype(np.float64)
+
+    discounts = 1.0 / np.log2(np.arange(2, max_k + 2))
+    cumulative_hits = np.cumsum(hits, axis=1)
+    precision_at_rank = cumulative_hits / np.arange(1, max_k + 1)
+
+    sums = {}
+    for k in ks:
+        relevant_k = np.minimum(rel_counts, k)
+        ideal = np.cumsum(discounts)[relevant_k - 1]
+        sums[f'recall@{k}'] = float(np.sum(cumulative_hits[:, k - 1] / rel_counts))
+        sums[f'map@{k}'] = float(np.sum((precision_at_rank[:, :k] * hits[:, :k]).sum(axis=1) / relevant_k))
+        sums[f'ndcg@{k}'] = float(np.sum((hits[:, :k] * discounts[:k]).sum(axis=1) / ideal))
+    return sums
+
+def evaluate_retrieval(user_idx, track_idx, item_embeddings, ks=DEFAULT_KS, holdout_fraction=0.2,
+                       min_interactions=2, block_size=None, workers=4, seed=42):
+    """
+    Evaluate embeddings with per-user holdout retrieval
+
+    Args:
+        user_idx: User index per interaction
+        track_idx: Track index per interaction (rows of item_embeddings)
+        item_embeddings: Embedding matrix of the catalog
+        ks: Cutoffs to report
+        holdout_fraction: Fraction of each user's tracks held out
+        min_interactions: Users with fewer unique tracks are not evaluated
+        block_size: Users per block (defaults to about 256 MB of scores per block)
+        workers: Threads scoring blocks in parallel
+        seed: Seed of the holdout split
+
+    Returns:
+        Dictionary with the mean of every metric over evaluated users
+    """
+    user_idx = np.asarray(user_idx, dtype=np.int64)
+    track_idx = np.asarray(track_idx, dtype=np.int64)
+    ks = sorted(set(int(k) for k in ks))
+    num_tracks = len(item_embeddings)
+    if ks[-1] > num_tracks:
+        raise ValueError(f"k={ks[-1]} exceeds the catalog size {num_tracks}")
+
+    # Deduplicate before splitting so a repeated play cannot leak into the holdout
+    keys = np.unique(user_idx * num_tracks + track_idx)
+    user_idx, track_idx = keys // num_tracks, keys % num_tracks
+    num_users = int(user_idx.max()) + 1 if len(user_idx) else 0
+
+    heldout = holdout_split(user_idx, track_idx, holdout_fraction, min_interactions, seed)
+    seen = to_csr_sorted(user_idx[~heldout], track_idx[~heldout], num_users)
+    relevant = to_csr_sorted(user_idx[heldout], track_idx[heldout], num_users)
+
+    item_embeddings = l2_normalize(item_embeddings)
+    queries = user_query_vectors(seen[0], seen[1], item_embeddings)
+
+    evaluated = np.flatnonzero((np.diff(relevant[0]) > 0) & (np.diff(seen[0]) > 0))
+    if block_size is None:
+        block_size = max(1, DEFAULT_BLOCK_ELEMENTS // num_tracks)
+    blocks = [evaluated[start:start + block_size] for start in range(0, len(evaluated), block_size)]
+
+    start_time = time.perf_counter()
+    totals = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for sums in executor.map(
+            lambda block: _block_metrics(block, queries, item_embeddings, seen, relevant, ks, num_tracks),
+            blocks
+        ):
+            for name, value in sums.items():
+                totals[name] = totals.get(name, 0.0) + value
+    seconds = time.perf_counter() - start_time
+
+    metrics = {name: value / len(evaluated) for name, value in totals.items()} if len(evaluated) else {}
+    return {
+        'users_evaluated': int(len(evaluated)),
+        'num_tracks': int(num_tracks),
+        'heldout_interactions': int(heldout.sum()),
+        'holdout_fraction': holdout_fraction,
+        'seconds': round(seconds, 3),
+        'users_per_second': round(len(evaluated) / seconds) if seconds > 0 else None,
+        'metrics': metrics
+    }
+
+def load_interactions(args):
+    """Return (user_idx, track_idx, features) from a workload file or an offline database"""
+    if args.workload:
+        workload = np.load(args.workload)
+        return workload['user_idx'], workload['track_idx'], workload['features']
+
+    from data_sources import SQLiteDataSource
+    from train_content_model import extract_features, index_interactions
+
+    source = SQLiteDataSource(args.offline_db)
+    tracks = source.fetch_tracks()
+    interactions = source.fetch_interactions()
+    source.close()
+    features, _ = extract_features(tracks)
+    track_indices = {track['track_id']: i for i, track in enumerate(tracks)}
+    user_idx, track_idx = index_interactions(interactions, track_indices)
+    return user_idx, track_idx, features
+
+def main():
+    """Evaluate track embeddings with held-out user interactions"""
+    parser = argparse.ArgumentParser(description='Offline retrieval evaluation for track embeddings')
+    data = parser.add_mutually_exclusive_group(required=True)
+    data.add_argument('--workload', type=str, help='Synthetic workload .npz with user_idx/track_idx/features')
+    data.add_argument('--offline-db', type=str, help='Offline SQLite training database')
+    embeddings = parser.add_mutually_exclusive_group(required=True)
+    embeddings.add_argument('--npz', type=str, help='Exported NumPy model (raw-feature input)')
+    embeddings.add_argument('--embeddings', type=str, help='.npy embedding matrix in track order')
+    parser.add_argument('--k', type=int, nargs='+', default=list(DEFAULT_KS), help='Cutoffs to report')
+    parser.add_argument('--holdout-fraction', type=float, default=0.2, help='Fraction of each user held out')
+    parser.add_argument('--min-interactions', type=int, default=2, help='Skip users with fewer tracks')
+    parser.add_argument('--block-size', type=int, help='Users per scoring block')
+    parser.add_argument('--workers', type=int, default=4, help='Threads scoring blocks in parallel')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the holdout split')
+    parser.add_argument('--output', type=str, help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    user_idx, track_idx, features = load_interactions(args)
+
+    if args.npz:
+        from numpy_inference import NumpyEmbeddingModel
+
+        model = NumpyEmbeddingModel.load(args.npz)
+        if not model.metadata.get('raw_features'):
+            parser.error('The exported model must take raw features (export without --no-fold-normalization)')
+        item_embeddings = model.embed(features)
+    else:
+        item_embeddings = np.load(args.embeddings, mmap_mode='r')
+
+    if len(item_embeddings) != len(features):
+        print(f"Embedding rows ({len(item_embeddings)}) do not match tracks ({len(features)})", file=sys.stderr)
+        sys.exit(1)
+
+    report = evaluate_retrieval(
+        user_idx,
+        track_idx,
+        item_embeddings,
+        ks=args.k,
+        holdout_fraction=args.holdout_fraction,
+        min_interactions=args.min_interactions,
+        block_size=args.block_size,
+        workers=args.workers,
+        seed=args.seed
+    )
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
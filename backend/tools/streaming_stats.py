@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Streaming Feature Statistics
+
+This module computes per-feature means and variances over chunks of rows, so that
+feature standardization never needs a second copy of the feature matrix. Chunk
+statistics are combined with the parallel variant of Welford's algorithm (Chan et al.),
+which makes partial results from different worker processes mergeable.
+
+Usage:
+python streaming_stats.py features.npy --workers 4 --chunk-size 100000 --output stats.json
+"""
+
+import json
+import argparse
+import numpy as np
+from multiprocessing import Pool
+
+DEFAULT_CHUNK_SIZE = 65536
+
+class RunningStats:
+    """Mergeable running mean and variance for each feature column"""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.count = 0
+        self.mean = np.zeros(dim, dtype=np.float64)
+        self.m2 = np.zeros(dim, dtype=np.float64)
+
+    def update(self, chunk):
+        """Add a chunk of rows of shape (rows, dim)"""
+        chunk = np.asarray(chunk)
+        if chunk.ndim == 1:
+            chunk = chunk.reshape(1, -1)
+        if len(chunk) == 0:
+            return self
+
+        chunk_mean = chunk.mean(axis=0, dtype=np.float64)
+        chunk_m2 = ((chunk - chunk_mean) ** 2).sum(axis=0, dtype=np.float64)
+        return self._combine(len(chunk), chunk_mean, chunk_m2)
+
+    def merge(self, other):
+        """Fold the statistics of another RunningStats into this one"""
+        if other.dim != self.dim:
+            raise ValueError(f"Cannot merge stats of dimension {other.dim} into {self.dim}")
+        if other.count == 0:
+            return self
+        return self._combine(other.count, other.mean, other.m2)
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+        return self
+
+    @property
+    def variance(self):
+        """Population variance (matches np.var with ddof=0)"""
+        if self.count == 0:
+            return np.zeros(self.dim, dtype=np.float64)
+        return self.m2 / self.count
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def safe_std(self):
+        """Standard deviations with zeros replaced by 1 to avoid division by zero"""
+        stds = self.std
+        stds[stds == 0] = 1
+        return stds
+
+    def to_dict(self):
+        """Serialize for sending between processes or saving to JSON"""
+        return {
+            'count': self.count,
+            'mean': self.mean.tolist(),
+            'm2': self.m2.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(len(data['mean']))
+        stats.count = data['count']
+        stats.mean = np.array(data['mean'], dtype=np.float64)
+        stats.m2 = np.array(data['m2'], dtype=np.float64)
+        return stats
+
+def iter_chunks(features, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield row chunks of an array or memmap as views"""
+    for start in range(0, len(features), chunk_size):
+        yield features[start:start + chunk_size]
+
+def compute_stats(chunks, dim=None):
+    """
+    Compute feature statistics from an iterable of row chunks
+
+    Args:
+        chunks: Iterable of arrays of shape (rows, dim), e.g. database fetches
+        dim: Feature dimension (taken from the first chunk if omitted)
+
+    Returns:
+        RunningStats instance
+    """
+    stats = RunningStats(dim) if dim is not None else None
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        if stats is None:
+            stats = RunningStats(chunk.shape[-1])
+        stats.update(chunk)
+    return stats
+
+def standardize_inplace(features, means, stds, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Standardize a float array (or writable memmap) chunk by chunk without copying it"""
+    if not np.issubdtype(features.dtype, np.floating):
+        raise TypeError(f"In-place standardization needs a float array, got {features.dtype}")
+    for chunk in iter_chunks(features, chunk_size):
+        chunk -= means
+        chunk /= stds
+    return features
+
+def _stats_for_range(task):
+    """Worker: compute statistics for a row range of a .npy file"""
+    path, start, end, chunk_size = task
+    features = np.load(path, mmap_mode='r')
+    return compute_stats(iter_chunks(features[start:end], chunk_size), features.shape[1]).to_dict()
+
+def compute_stats_parallel(path, workers=4, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Compute feature statistics of a .npy file with several processes
+
+    Each worker memory-maps the file, reduces its row range and returns a
+    serialized RunningStats; the partial results are merged at the end.
+    """
+    features = np.load(path, mmap_mode='r')
+    rows, dim = features.shape
+    bounds = np.linspace(0, rows, workers + 1, dtype=np.int64)
+    tasks = [(str(path), int(bounds[i]), int(bounds[i + 1]), chunk_size) for i in range(workers)]
+
+    stats = RunningStats(dim)
+    with Pool(processes=workers) as pool:
+        for partial in pool.imap_unordered(_stats_for_range, tasks):
+            stats.merge(RunningStats.from_dict(partial))
+    return stats
+
+def main():
+    """Compute feature statistics of a .npy feature matrix"""
+    parser = argparse.ArgumentParser(description='Compute streaming feature statistics')
+    parser.add_argument('features', type=str, help='Path to a .npy feature matrix')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per chunk')
+    parser.add_argument('--output', type=str, help='Write means/stds JSON to this path')
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        stats = compute_stats_parallel(args.features, args.workers, args.chunk_size)
+    else:
+        features = np.load(args.features, mmap_mode='r')
+        stats = compute_stats(iter_chunks(features, args.chunk_size), features.shape[1])
+
+    result = {
+        'count': stats.count,
+        'means': stats.mean.tolist(),
+        'stds': stats.safe_std().tolist()
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f)
+
+    print(json.dumps(result))
+
+if __name__ == "__main__":
+    main()
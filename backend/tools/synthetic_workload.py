@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Synthetic Interaction Workload Generator
+
+This script generates large, seeded user-track interaction workloads for load testing
+and benchmarking the training pipeline. Track popularity and user activity follow
+configurable power laws, and users can optionally be grouped into co-listening
+clusters that favour a subset of the catalog. Everything is vectorized with NumPy.
+
+Outputs:
+    --output-npz   user_idx/track_idx arrays, synthetic audio features and, with
+                   --pairs, the similar-pair array fetch_training_data would build
+    --output-csv   "userId","trackId","action" rows for COPY ... WITH (FORMAT csv, HEADER)
+    --output-sqlite offline Track/TrackFeatures/UserInteraction database for
+                   train_content_model.py --offline-db
+
+Usage:
+python synthetic_workload.py --users 1000000 --tracks 500000 --mean-interactions 20 --clusters 200 --output-npz workload.npz
+"""
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+from cooccurrence import interactions_to_pairs
+from data_sources import FEATURE_COLUMNS, create_sqlite_schema
+
+def power_law_weights(n, alpha, rng):
+    """Zipf-like weights rank**-alpha, assigned to items in random order"""
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -alpha
+    return weights[rng.permutation(n)]
+
+def sample_user_activity(num_users, mean_interactions, alpha, min_interactions,
+                         max_interactions, rng):
+    """Draw per-user interaction counts from a Pareto distribution with the given mean"""
+    activity = rng.pareto(alpha, num_users) + 1.0
+    counts = np.rint(activity * (mean_interactions / activity.mean()))
+    return np.clip(counts, min_interactions, max_interactions).astype(np.int64)
+
+def generate_interactions(num_users, num_tracks, mean_interactions=20, track_alpha=1.0,
+                          user_alpha=1.5, min_interactions=1, max_interactions=5000,
+                          num_clusters=0, cluster_affinity=0.7, unique=True, seed=42):
+    """
+    Generate a synthetic interaction workload
+
+    Args:
+        num_users: Number of users
+        num_tracks: Number of tracks in the catalog
+        mean_interactions: Target mean interactions per user
+        track_alpha: Exponent of the track popularity power law
+        user_alpha: Pareto shape of user activity (smaller is heavier tailed)
+        min_interactions: Minimum interactions per user
+        max_interactions: Maximum interactions per user
+        num_clusters: Number of co-listening clusters (0 disables clustering)
+        cluster_affinity: Probability that an interaction stays in the user's cluster
+        unique: Drop repeated (user, track) interactions
+        seed: Random seed
+
+    Returns:
+        Tuple of (user_idx, track_idx) int32 arrays, sorted by user
+    """
+    rng = np.random.default_rng(seed)
+
+    counts = sample_user_activity(
+        num_users, mean_interactions, user_alpha, min_interactions, max_interactions, rng
+    )
+    user_idx = np.repeat(np.arange(num_users, dtype=np.int32), counts)
+    total = len(user_idx)
+
+    popularity = power_law_weights(num_tracks, track_alpha, rng)
+
+    if num_clusters > 0:
+        # Sort tracks by cluster so every cluster is a contiguous range of a single
+        # cumulative weight table; sampling within a cluster is then one searchsorted.
+        track_cluster = rng.integers(0, num_clusters, num_tracks)
+        order = np.argsort(track_cluster, kind='stable')
+        sorted_cdf = np.cumsum(popularity[order])
+        bounds = np.searchsorted(track_cluster[order], np.arange(num_clusters + 1))
+        low = np.concatenate(([0.0], sorted_cdf))[bounds[:-1]]
+        high = np.concatenate(([0.0], sorted_cdf))[bounds[1:]]
+
+        user_cluster = rng.integers(0, num_clusters, num_users)
+        in_cluster = rng.random(total) < cluster_affinity
+        clusters = user_cluster[user_idx]
+
+        # Empty clusters fall back to the global distribution
+        in_cluster &= high[clusters] > low[clusters]
+
+        targets = rng.random(total)
+        targets = np.where(
+            in_cluster,
+            low[clusters] + targets * (high[clusters] - low[clusters]),
+            targets * sorted_cdf[-1]
+        )
+        positions = np.minimum(np.searchsorted(sorted_cdf, targets, side='right'), num_tracks - 1)
+        track_idx = order[positions].astype(np.int32)
+    else:
+        cdf = np.cumsum(popularity)
+        positions = np.searchsorted(cdf, rng.random(total) * cdf[-1], side='right')
+        track_idx = np.minimum(positions, num_tracks - 1).astype(np.int32)
+
+    if unique:
+        keys = np.unique(user_idx.astype(np.int64) * num_tracks + track_idx)
+        user_idx = (keys // num_tracks).astype(np.int32)
+        track_idx = (keys % num_tracks).astype(np.int32)
+
+    return user_idx, track_idx
+
+def generate_track_features(num_tracks, seed=42):
+    """Generate audio features in Spotify's value ranges, in FEATURE_COLUMNS order"""
+    rng = np.random.default_rng(seed + 1)
+    columns = {
+        'acousticness': rng.beta(0.8, 1.5, num_tracks),
+        'danceability': rng.beta(4, 3, num_tracks),
+        'energy': rng.beta(3, 2, num_tracks),
+        'instrumentalness': rng.beta(0.3, 2, num_tracks),
+        'key': rng.integers(0, 12, num_tracks).astype(np.float64),
+        'liveness': rng.beta(1.5, 6, num_tracks),
+        'loudness': np.clip(rng.normal(-9, 4, num_tracks), -60, 0),
+        'mode': (rng.random(num_tracks) < 0.6).astype(np.float64),
+        'speechiness': rng.beta(1, 10, num_tracks),
+        'tempo': np.clip(rng.normal(120, 28, num_tracks), 40, 220),
+        'valence': rng.beta(2, 2, num_tracks)
+    }
+    return np.stack([columns[column] for column in FEATURE_COLUMNS], axis=1)
+
+def write_interactions_csv(path, user_idx, track_idx, track_ids=None, action='play',
+                           chunk_size=1000000):
+    """Write interactions as Postgres-compatible CSV with a header row"""
+    with open(path, 'w') as f:
+        f.write('"userId","trackId","action"\n')
+        for start in range(0, len(user_idx), chunk_size):
+            users = user_idx[start:start + chunk_size].tolist()
+            tracks = track_idx[start:start + chunk_size].tolist()
+            if track_ids is not None:
+                tracks = [track_ids[t] for t in tracks]
+            else:
+                tracks = [f'synthetic_track_{t}' for t in tracks]
+            f.write(''.join(
+                f'synthetic_user_{u},{t},{action}\n' for u, t in zip(users, tracks)
+            ))
+
+def write_sqlite_fixture(path, user_idx, track_idx, features, action='play',
+                         chunk_size=1000000):
+    """
+    Write a workload as an offline training database
+
+    Track and user ids match write_interactions_csv. Existing rows are replaced,
+    so the same seed always produces the same database contents.
+    """
+    conn = create_sqlite_schema(path)
+    try:
+        conn.execute('DELETE FROM "UserInteraction"')
+        conn.execute('DELETE FROM "TrackFeatures"')
+        conn.execute('DELETE FROM "Track"')
+
+        conn.executemany(
+            'INSERT INTO "Track" (id, name, artists, popularity) VALUES (?, ?, ?, ?)',
+            ((f'synthetic_track_{t}', f'Synthetic Track {t}', '[]', 0) for t in range(len(features)))
+        )
+        placeholders = ', '.join(['?'] * (len(FEATURE_COLUMNS) + 1))
+        columns = ', '.join(FEATURE_COLUMNS)
+        conn.executemany(
+            f'INSERT INTO "TrackFeatures" ("trackId", {columns}) VALUES ({placeholders})',
+            ((f'synthetic_track_{t}', *row) for t, row in enumerate(features.tolist()))
+        )
+        for start in range(0, len(user_idx), chunk_size):
+            users = user_idx[start:start + chunk_size].tolist()
+            tracks = track_idx[start:start + chunk_size].tolist()
+            conn.executemany(
+                'INSERT INTO "UserInteraction" ("userId", "trackId", "action") VALUES (?, ?, ?)',
+                ((f'synthetic_user_{u}', f'synthetic_track_{t}', action) for u, t in zip(users, tracks))
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+def main():
+    """Generate a workload and report generation throughput"""
+    parser = argparse.ArgumentParser(description='Generate synthetic interaction workloads')
+    parser.add_argument('--users', type=int, default=100000, help='Number of users')
+    parser.add_argument('--tracks', type=int, default=50000, help='Number of tracks')
+    parser.add_argument('--mean-interactions', type=float, default=20, help='Mean interactions per user')
+    parser.add_argument('--track-alpha', type=float, default=1.0, help='Track popularity power-law exponent')
+    parser.add_argument('--user-alpha', type=float, default=1.5, help='User activity Pareto shape')
+    parser.add_argument('--min-interactions', type=int, default=1, help='Minimum interactions per user')
+    parser.add_argument('--max-interactions', type=int, default=5000, help='Maximum interactions per user')
+    parser.add_argument('--clusters', type=int, default=0, help='Number of co-listening clusters')
+    parser.add_argument('--cluster-affinity', type=float, default=0.7, help='Probability of in-cluster interactions')
+    parser.add_argument('--allow-duplicates', action='store_true', help='Keep repeated (user, track) interactions')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--pairs', action='store_true', help='Also build the similar-pair array')
+    parser.add_argument('--max-pairs', type=int, default=200000000, help='Abort if more pairs would be built')
+    parser.add_argument('--output-npz', type=str, help='Write NumPy arrays to this .npz file')
+    parser.add_argument('--output-csv', type=str, help='Write interactions to this CSV file')
+    parser.add_argument('--output-sqlite', type=str, help='Write an offline training database to this SQLite file')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    user_idx, track_idx = generate_interactions(
+        args.users,
+        args.tracks,
+        mean_interactions=args.mean_interactions,
+        track_alpha=args.track_alpha,
+        user_alpha=args.user_alpha,
+        min_interactions=args.min_interactions,
+        max_interactions=args.max_interactions,
+        num_clusters=args.clusters,
+        cluster_affinity=args.cluster_affinity,
+        unique=not args.allow_duplicates,
+        seed=args.seed
+    )
+    generation_time = time.time() - start_time
+
+    result = {
+        'users': args.users,
+        'tracks': args.tracks,
+        'interactions': int(len(user_idx)),
+        'generation_seconds': round(generation_time, 3),
+        'interactions_per_second': round(len(user_idx) / generation_time) if generation_time > 0 else None
+    }
+
+    arrays = {
+        'user_idx': user_idx,
+        'track_idx': track_idx
+    }
+
+    if args.pairs:
+        pair_start = time.time()
+        try:
+            arrays['similar_pairs'] = interactions_to_pairs(user_idx, track_idx, args.max_pairs)
+        except ValueError as e:
+            print(f"Error building pairs: {e}", file=sys.stderr)
+            sys.exit(1)
+        result['pairs'] = int(len(arrays['similar_pairs']))
+        result['pair_seconds'] = round(time.time() - pair_start, 3)
+
+    if args.output_npz:
+        arrays['features'] = generate_track_features(args.tracks, args.seed)
+        np.savez(args.output_npz, **arrays)
+        print(f"Saved arrays to {args.output_npz}", file=sys.stderr)
+
+    if args.output_csv:
+        csv_start = time.time()
+        write_interactions_csv(args.output_csv, user_idx, track_idx)
+        result['csv_seconds'] = round(time.time() - csv_start, 3)
+        print(f"Saved CSV to {args.output_csv}", file=sys.stderr)
+
+    if args.output_sqlite:
+        sqlite_start = time.time()
+        write_sqlite_fixture(
+            args.output_sqlite, user_idx, track_idx, generate_track_features(args.tracks, args.seed)
+        )
+        result['sqlite_seconds'] = round(time.time() - sqlite_start, 3)
+        print(f"Saved offline database to {args.output_sqlite}", file=sys.stderr)
+
+    print(json.dumps(result))
+
+if __name__ == "__main__":
+    main()
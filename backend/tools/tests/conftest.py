@@ -0,0 +1,6 @@
+"""Make the flat backend/tools scripts importable as top-level modules"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,60 @@
+"""
+Disk tier of the embedding cache: a row torn by a crash during an overwrite
+must be recomputed, never returned.
+"""
+
+import numpy as np
+
+from embedding_cache import DiskEmbeddingTier, EmbeddingCache, feature_fingerprints
+
+DIM = 8
+
+def embed(features):
+    return np.tile(features.sum(axis=1, keepdims=True), (1, DIM)).astype(np.float32)
+
+def test_torn_overwrite_is_a_miss(tmp_path):
+    features = np.random.default_rng(0).random((50, 11))
+    keys = feature_fingerprints(features, 'v1')
+    tier = DiskEmbeddingTier(tmp_path, 'v1', DIM, capacity=256)
+    tier.put(keys, embed(features))
+
+    # Crash halfway through rewriting one row: new first half, old second half
+    slot = tier.lookup(keys[:1])[0]
+    tier.values[slot, :DIM // 2] = -1.0
+    tier.flush()
+
+    reopened = DiskEmbeddingTier(tmp_path, 'v1', DIM)
+    found, embeddings = reopened.get(keys)
+    assert not found[0] and found[1:].all()
+    np.testing.assert_array_equal(embeddings, embed(features[1:]))
+    assert reopened.rejected == 1
+
+def test_rejected_row_is_recomputed_and_rewritten(tmp_path):
+    features = np.random.default_rng(1).random((20, 11))
+    cache = EmbeddingCache(embed, 'v1', DIM, cache_dir=tmp_path, disk_capacity=256)
+    cache.get_or_compute(features)
+    slot = cache.disk.lookup(feature_fingerprints(features[:1], 'v1'))[0]
+    cache.disk.values[slot] = 0.0
+    cache.flush()
+
+    cache = EmbeddingCache(embed, 'v1', DIM, cache_dir=tmp_path)
+    np.testing.assert_array_equal(cache.get_or_compute(features), embed(features))
+    assert cache.stats()['computed_rows'] == 1
+    assert cache.stats()['disk_rejected_rows'] == 1
+
+    # The recomputed row was rewritten with a matching checksum
+    found, _ = DiskEmbeddingTier(tmp_path, 'v1', DIM).get(feature_fingerprints(features, 'v1'))
+    assert found.all()
+
+def test_cache_without_checksums_is_migrated(tmp_path):
+    features = np.random.default_rng(2).random((30, 11))
+    keys = feature_fingerprints(features, 'v1')
+    tier = DiskEmbeddingTier(tmp_path, 'v1', DIM, capacity=256)
+    tier.put(keys, embed(features))
+    tier.flush()
+    del tier
+    (tmp_path / 'v1' / 'checksums.npy').unlink()
+
+    found, embeddings = DiskEmbeddingTier(tmp_path, 'v1', DIM).get(keys)
+    assert found.all()
+    np.testing.assert_array_equal(embeddings, embed(features))
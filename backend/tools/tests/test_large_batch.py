@@ -0,0 +1,157 @@
+"""
+BatchNorm under gradient accumulation, for the Keras and the PyTorch trainer
+
+Accumulating K micro-batches of size B must give the gradient of one batch of
+size K*B when BatchNorm uses its moving statistics. In training mode it does
+not: each micro-batch is normalized with its own statistics, and the moving
+statistics are updated once per micro-batch (K times per optimizer step).
+"""
+
+import numpy as np
+import pytest
+
+BATCH_SIZE = 64
+ACCUMULATION_STEPS = 4
+FEATURE_DIM = 11
+
+def micro_batches(array, steps=ACCUMULATION_STEPS):
+    return np.array_split(array, steps)
+
+@pytest.fixture
+def rows():
+    rng = np.random.default_rng(0)
+    total = BATCH_SIZE * ACCUMULATION_STEPS
+    # Offset and scaled so the moving statistics move visibly from their initial values
+    inputs = (rng.standard_normal((total, FEATURE_DIM)) * 3 + 2).astype(np.float32)
+    return inputs, rng
+
+class TestKeras:
+    @pytest.fixture(autouse=True)
+    def tensorflow(self):
+        self.tf = pytest.importorskip('tensorflow')
+        self.tf.keras.utils.set_random_seed(0)
+
+    def bn_model(self):
+        tf = self.tf
+        return tf.keras.Sequential([
+            tf.keras.layers.InputLayer(input_shape=(FEATURE_DIM,)),
+            tf.keras.layers.BatchNormalization(),
+            tf.keras.layers.Dense(16, activation='relu'),
+            tf.keras.layers.Dense(8)
+        ])
+
+    def test_moving_statistics_match_full_batch(self, rows):
+        from large_batch import accumulation_gap, weighted_squared_error
+        from train_content_model import build_embedding_model
+
+        inputs, rng = rows
+        model = build_embedding_model(FEATURE_DIM, 16)
+        targets = rng.standard_normal((len(inputs), 16)).astype(np.float32)
+        weights = rng.integers(1, 10, len(inputs)).astype(np.float32)
+
+        gap = accumulation_gap(model, weighted_squared_error, inputs, targets, weights,
+                               ACCUMULATION_STEPS, training=False)
+        assert gap < 1e-5
+
+    def test_batch_statistics_differ_from_full_batch(self, rows):
+        from large_batch import accumulation_gap, weighted_squared_error
+
+        inputs, rng = rows
+        targets = rng.standard_normal((len(inputs), 8)).astype(np.float32)
+        weights = np.ones(len(inputs), dtype=np.float32)
+
+        gap = accumulation_gap(self.bn_model(), weighted_squared_error, inputs, targets, weights,
+                               ACCUMULATION_STEPS, training=True)
+        assert gap > 1e-3
+
+    def test_moving_statistics_update_once_per_micro_batch(self, rows):
+        inputs, _ = rows
+        model = self.bn_model()
+        bn = model.layers[0]
+        momentum = bn.momentum
+
+        mean = np.zeros(FEATURE_DIM)
+        variance = np.ones(FEATURE_DIM)
+        for batch in micro_batches(inputs):
+            model(batch, training=True)
+            mean = momentum * mean + (1 - momentum) * batch.mean(axis=0)
+            variance = momentum * variance + (1 - momentum) * batch.var(axis=0)
+
+        np.testing.assert_allclose(bn.moving_mean.numpy(), mean, rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(bn.moving_variance.numpy(), variance, rtol=1e-4, atol=1e-5)
+        # One update with the full batch would have moved them far less
+        full_batch_mean = (1 - momentum) * inputs.mean(axis=0)
+        assert not np.allclose(bn.moving_mean.numpy(), full_batch_mean, rtol=1e-2)
+
+class TestTorch:
+    @pytest.fixture(autouse=True)
+    def torch(self):
+        self.torch = pytest.importorskip('torch')
+        self.torch.manual_seed(0)
+
+    def bn_model(self):
+        nn = self.torch.nn
+        return nn.Sequential(
+            nn.BatchNorm1d(FEATURE_DIM),
+            nn.Linear(FEATURE_DIM, 16),
+            nn.ReLU(),
+            nn.Linear(16, 4)
+        )
+
+    def batch(self, rows):
+        inputs, rng = rows
+        labels = rng.integers(0, 4, len(inputs))
+        return self.torch.from_numpy(inputs), self.torch.from_numpy(labels)
+
+    def test_moving_statistics_match_full_batch(self, rows):
+        from torch_large_batch import accumulation_gap
+
+        model = self.bn_model().eval()
+        inputs, labels = self.batch(rows)
+        gap = accumulation_gap(model, self.torch.nn.CrossEntropyLoss(), inputs, labels, ACCUMULATION_STEPS)
+        assert gap < 1e-5
+
+    def test_batch_statistics_differ_from_full_batch(self, rows):
+        from torch_large_batch import accumulation_gap
+
+        model = self.bn_model().train()
+        inputs, labels = self.batch(rows)
+        gap = accumulation_gap(model, self.torch.nn.CrossEntropyLoss(), inputs, labels, ACCUMULATION_STEPS)
+        assert gap > 1e-3
+
+    def test_uneven_window_weights_match_full_batch(self, rows):
+        from torch_large_batch import window_loss_weight
+
+        # A last window shorter than the others still averages over its own rows
+        model = self.bn_model().eval()
+        inputs, labels = self.batch(rows)
+        inputs, labels = inputs[:150], labels[:150]
+        criterion = self.torch.nn.CrossEntropyLoss()
+
+        criterion(model(inputs), labels).backward()
+        full = [param.grad.clone() for param in model.parameters()]
+        model.zero_grad()
+        for start in range(0, len(inputs), BATCH_SIZE):
+            batch, batch_labels = inputs[start:start + BATCH_SIZE], labels[start:start + BATCH_SIZE]
+            (criterion(model(batch), batch_labels) * window_loss_weight(len(batch), len(inputs))).backward()
+        for param, expected in zip(model.parameters(), full):
+            self.torch.testing.assert_close(param.grad, expected, rtol=1e-5, atol=1e-6)
+
+    def test_running_statistics_update_once_per_micro_batch(self, rows):
+        model = self.bn_model().train()
+        bn = model[0]
+        inputs, _ = self.batch(rows)
+        momentum = bn.momentum
+
+        mean = np.zeros(FEATURE_DIM)
+        variance = np.ones(FEATURE_DIM)
+        for batch in self.torch.tensor_split(inputs, ACCUMULATION_STEPS):
+            model(batch)
+            batch = batch.numpy()
+            mean = (1 - momentum) * mean + momentum * batch.mean(axis=0)
+            # PyTorch tracks the unbiased variance
+            variance = (1 - momentum) * variance + momentum * batch.var(axis=0, ddof=1)
+
+        assert int(bn.num_batches_tracked) == ACCUMULATION_STEPS
+        np.testing.assert_allclose(bn.running_mean.numpy(), mean, rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(bn.running_var.numpy(), variance, rtol=1e-4, atol=1e-5)
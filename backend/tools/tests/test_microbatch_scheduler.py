@@ -0,0 +1,58 @@
+"""
+MicroBatchScheduler shutdown: every request that was queued or taken into a
+batch must be answered, even when stop() interrupts the batching loop.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from microbatch_scheduler import MicroBatchScheduler, SchedulerStopped
+
+def test_stop_fails_queued_and_in_flight_requests():
+    release = threading.Event()
+
+    def slow_batch(payloads):
+        release.wait(5)
+        return payloads
+
+    async def scenario():
+        scheduler = MicroBatchScheduler(slow_batch, max_batch_size=2, max_wait_ms=0)
+        await scheduler.start()
+        requests = [asyncio.create_task(scheduler.submit(i)) for i in range(5)]
+        # Let the worker take the first batch and block in slow_batch
+        while not scheduler.in_flight:
+            await asyncio.sleep(0.001)
+        await scheduler.stop()
+        release.set()
+        return await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), 1)
+
+    results = asyncio.run(scenario())
+    assert len(results) == 5
+    assert all(isinstance(result, SchedulerStopped) for result in results)
+
+def test_stop_during_collect_fails_collected_requests():
+    async def scenario():
+        # A long wait keeps the first request in the batch being collected
+        scheduler = MicroBatchScheduler(lambda payloads: payloads, max_batch_size=8, max_wait_ms=10000)
+        await scheduler.start()
+        request = asyncio.create_task(scheduler.submit('a'))
+        while not scheduler.in_flight:
+            await asyncio.sleep(0.001)
+        await scheduler.stop()
+        return await asyncio.wait_for(asyncio.gather(request, return_exceptions=True), 1)
+
+    result, = asyncio.run(scenario())
+    assert isinstance(result, SchedulerStopped)
+
+def test_submit_after_stop_raises():
+    async def scenario():
+        scheduler = MicroBatchScheduler(lambda payloads: payloads)
+        await scheduler.start()
+        assert await scheduler.submit('a') == 'a'
+        await scheduler.stop()
+        with pytest.raises(SchedulerStopped):
+            await scheduler.submit('b')
+
+    asyncio.run(scenario())
@@ -0,0 +1,71 @@
+"""
+Alias sampler: the table must encode the target distribution exactly, and
+draws from it must follow that distribution.
+"""
+
+import numpy as np
+import pytest
+
+from negative_sampling import AliasSampler, popularity_sampler
+
+def table_probabilities(sampler):
+    """Probability of each outcome implied by the accept and alias columns"""
+    size = len(sampler)
+    implied = sampler.accept.copy()
+    np.add.at(implied, sampler.alias, 1.0 - sampler.accept)
+    return implied / size
+
+@pytest.mark.parametrize('weights', [
+    [1.0],
+    [3.0, 1.0],
+    [0.0, 5.0, 0.0, 1.0],
+    np.ones(17),
+    np.random.default_rng(0).zipf(1.3, 5000).clip(max=10 ** 6)
+], ids=['single', 'two', 'zeros', 'uniform', 'zipf'])
+def test_table_encodes_distribution(weights):
+    sampler = AliasSampler(weights)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    np.testing.assert_allclose(sampler.probabilities, weights / weights.sum(), rtol=1e-12)
+    assert np.all((sampler.accept >= 0) & (sampler.accept <= 1 + 1e-12))
+    np.testing.assert_allclose(table_probabilities(sampler), sampler.probabilities, rtol=1e-9, atol=1e-15)
+
+def test_draws_follow_distribution():
+    weights = np.random.default_rng(1).zipf(1.5, 200).clip(max=1000)
+    sampler = popularity_sampler(weights)
+    samples = 2_000_000
+    draws = sampler.sample(samples, np.random.default_rng(2))
+
+    empirical = np.bincount(draws, minlength=len(sampler)) / samples
+    expected = sampler.probabilities
+    # Every outcome within 5 standard errors of its binomial frequency
+    stderr = np.sqrt(expected * (1 - expected) / samples)
+    assert np.all(np.abs(empirical - expected) < 5 * stderr + 1e-9)
+    assert 0.5 * np.abs(empirical - expected).sum() < 0.01
+
+def test_zero_weight_is_never_drawn():
+    sampler = AliasSampler([0.0, 2.0, 0.0, 1.0])
+    draws = sampler.sample(100_000, np.random.default_rng(3))
+    assert set(np.unique(draws)) == {1, 3}
+
+def test_same_generator_gives_same_draws():
+    sampler = popularity_sampler(np.arange(1, 100))
+    np.testing.assert_array_equal(
+        sampler.sample(1000, np.random.default_rng([5, 7])),
+        sampler.sample(1000, np.random.default_rng([5, 7]))
+    )
+
+def test_popularity_smoothing():
+    counts = np.array([0, 1, 16, 81])
+    np.testing.assert_allclose(popularity_sampler(counts, 0.0).probabilities, np.full(4, 0.25))
+    np.testing.assert_allclose(popularity_sampler(counts, 1.0).probabilities, np.array([1, 1, 16, 81]) / 99)
+
+    sampler = popularity_sampler(counts, 0.75)
+    weights = np.array([1, 1, 8, 27], dtype=np.float64)
+    np.testing.assert_allclose(sampler.probabilities, weights / weights.sum())
+    np.testing.assert_allclose(sampler.log_q(np.array([3, 0])), np.log(weights[[3, 0]] / weights.sum()))
+
+@pytest.mark.parametrize('weights', [[], [0.0, 0.0], [1.0, -1.0, 2.0]], ids=['empty', 'all-zero', 'negative'])
+def test_invalid_weights_are_rejected(weights):
+    with pytest.raises(ValueError):
+        AliasSampler(weights)
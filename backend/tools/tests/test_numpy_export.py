@@ -0,0 +1,80 @@
+"""
+The NumPy export must give the embeddings of the Keras model in inference mode,
+with BatchNormalization, Dropout and feature standardization folded away.
+"""
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from numpy_inference import NumpyEmbeddingModel, export_numpy_model
+from train_content_model import build_embedding_model
+
+FEATURE_DIM = 11
+
+def randomize_batch_norm(model, rng):
+    """Non-trivial moving statistics and affine parameters, so folding is exercised"""
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.layers.BatchNormalization):
+            size = layer.moving_mean.shape[0]
+            layer.moving_mean.assign(rng.normal(size=size).astype(np.float32))
+            layer.moving_variance.assign(rng.uniform(0.2, 3.0, size).astype(np.float32))
+            layer.gamma.assign(rng.uniform(0.5, 1.5, size).astype(np.float32))
+            layer.beta.assign(rng.normal(size=size).astype(np.float32))
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    raw = (rng.normal(size=(500, FEATURE_DIM)) * rng.uniform(0.5, 50, FEATURE_DIM) + 10).astype(np.float32)
+    return raw, raw.mean(axis=0), raw.std(axis=0), rng
+
+def test_export_with_folded_standardization(tmp_path, data):
+    raw, means, stds, rng = data
+    model = build_embedding_model(FEATURE_DIM, 16)
+    randomize_batch_norm(model, rng)
+
+    metadata = export_numpy_model(model, tmp_path / 'model.npz', means, stds, model_version='v1')
+    exported = NumpyEmbeddingModel.load(tmp_path / 'model.npz')
+
+    expected = model((raw - means) / stds, training=False).numpy()
+    assert metadata['raw_features'] and metadata['model_version'] == 'v1'
+    assert exported.input_dim == FEATURE_DIM and exported.output_dim == 16
+    np.testing.assert_allclose(exported.embed(raw, batch_size=64), expected, atol=1e-5)
+
+def test_export_without_standardization(tmp_path, data):
+    raw, means, stds, rng = data
+    standardized = (raw - means) / stds
+    model = build_embedding_model(FEATURE_DIM, 8)
+    randomize_batch_norm(model, rng)
+
+    export_numpy_model(model, tmp_path / 'model.npz')
+    exported = NumpyEmbeddingModel.load(tmp_path / 'model.npz')
+
+    assert not exported.metadata['raw_features']
+    np.testing.assert_allclose(exported.embed(standardized), model(standardized, training=False).numpy(), atol=1e-5)
+
+def test_batch_norm_after_linear_dense(tmp_path, data):
+    raw, means, stds, rng = data
+    model = tf.keras.Sequential([
+        tf.keras.layers.InputLayer(input_shape=(FEATURE_DIM,)),
+        tf.keras.layers.Dense(12),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.Dense(6, activation='sigmoid')
+    ])
+    randomize_batch_norm(model, rng)
+
+    export_numpy_model(model, tmp_path / 'model.npz', means, stds)
+    exported = NumpyEmbeddingModel.load(tmp_path / 'model.npz')
+
+    assert len(exported.kernels) == 2
+    np.testing.assert_allclose(exported.embed(raw), model((raw - means) / stds, training=False).numpy(), atol=1e-5)
+
+def test_unsupported_layer_is_rejected(tmp_path):
+    model = tf.keras.Sequential([
+        tf.keras.layers.InputLayer(input_shape=(FEATURE_DIM,)),
+        tf.keras.layers.Dense(4),
+        tf.keras.layers.LayerNormalization()
+    ])
+    with pytest.raises(ValueError, match='Cannot export'):
+        export_numpy_model(model, tmp_path / 'model.npz')
@@ -0,0 +1,83 @@
+"""
+Online fold-in: the Woodbury solve must equal the direct implicit-ALS solve for
+one user, and the store must fold events in with the documented decay.
+"""
+
+import numpy as np
+import pytest
+
+from online_foldin import FoldIn, OnlineUserStore
+
+NUM_TRACKS = 400
+FACTORS = 16
+
+@pytest.fixture
+def item_factors():
+    return (np.random.default_rng(0).normal(size=(NUM_TRACKS, FACTORS)) * 0.3).astype(np.float32)
+
+def exact_solve(item_factors, items, weights, regularization, alpha):
+    """x = (YtY + Yr^T D Yr + lambda I)^-1 Yr^T c with c = 1 + alpha * w and D = diag(alpha * w)"""
+    Y = item_factors.astype(np.float64)
+    Yr = Y[items]
+    excess = alpha * np.asarray(weights, dtype=np.float64)
+    system = Y.T @ Y + Yr.T @ (excess[:, None] * Yr) + regularization * np.eye(Y.shape[1])
+    return np.linalg.solve(system, Yr.T @ (1.0 + excess))
+
+@pytest.mark.parametrize('regularization, alpha', [(0.01, 40.0), (1.0, 1.0), (0.1, 400.0)])
+@pytest.mark.parametrize('num_items', [1, 5, 40])
+def test_woodbury_solve_matches_the_direct_solve(item_factors, regularization, alpha, num_items):
+    rng = np.random.default_rng(num_items)
+    items = rng.choice(NUM_TRACKS, num_items, replace=False)
+    # From nearly expired (large 1 / excess on the diagonal) to heavy repeat plays
+    weights = rng.uniform(0.05, 20.0, num_items)
+
+    fold_in = FoldIn(item_factors, regularization=regularization, alpha=alpha)
+    expected = exact_solve(item_factors, items, weights, regularization, alpha)
+    np.testing.assert_allclose(fold_in.solve(items, weights), expected, rtol=1e-4,
+                               atol=1e-5 * np.abs(expected).max())
+
+def test_no_history_gives_a_zero_vector(item_factors):
+    vector = FoldIn(item_factors).solve(np.zeros(0, dtype=np.int64), np.zeros(0))
+    assert vector.shape == (FACTORS,) and not vector.any()
+
+def test_store_decays_weights_between_events(item_factors):
+    fold_in = FoldIn(item_factors)
+    hour = 3600.0
+    store = OnlineUserStore(fold_in, half_life=hour)
+    store.observe('u', 3, timestamp=0.0)
+    store.observe('u', 7, timestamp=hour)
+    vector = store.observe('u', 3, timestamp=2 * hour)
+
+    # Track 3: 1 decayed over two half-lives plus 1; track 7: 1 decayed over one half-life
+    expected = exact_solve(item_factors, [3, 7], [1.25, 0.5], fold_in.regularization, fold_in.alpha)
+    np.testing.assert_allclose(vector, expected, rtol=1e-4, atol=1e-6)
+
+def test_store_drops_expired_and_replaces_the_weakest_track(item_factors):
+    store = OnlineUserStore(FoldIn(item_factors), history=3, half_life=1.0, min_weight=0.1)
+    store.observe('u', 1, timestamp=0.0)
+    # Four half-lives later the first track weighs 1/16 < min_weight and is dropped
+    store.observe('u', 2, timestamp=4.0)
+    row = store.rows['u']
+    assert store.items[row, :store.lengths[row]].tolist() == [2]
+
+    store.observe('u', 3, timestamp=4.0)
+    store.observe('u', 3, timestamp=4.0)
+    store.observe('u', 4, timestamp=4.0)
+    # The buffer is full; track 2 and track 4 weigh 1, track 3 weighs 2
+    store.observe('u', 5, timestamp=4.0)
+    assert sorted(store.items[row, :store.lengths[row]].tolist()) == [3, 4, 5]
+
+def test_store_grows_and_round_trips(tmp_path, item_factors):
+    fold_in = FoldIn(item_factors)
+    store = OnlineUserStore(fold_in, half_life=60.0, capacity=2)
+    rng = np.random.default_rng(1)
+    for event in range(50):
+        store.observe(f'user{event % 7}', int(rng.integers(NUM_TRACKS)), timestamp=float(event))
+    assert len(store) == 7 and len(store.vectors) >= 7
+
+    store.save(tmp_path / 'users.npz')
+    loaded = OnlineUserStore.load(tmp_path / 'users.npz', fold_in)
+    for user_id in store.user_ids:
+        np.testing.assert_array_equal(loaded.vector(user_id), store.vector(user_id))
+    assert loaded.recommend('user3', k=5) == store.recommend('user3', k=5)
+    assert loaded.vector('unknown') is None and loaded.recommend('unknown') == []
@@ -0,0 +1,72 @@
+"""
+Vectorized retrieval metrics, checked against a per-user loop that follows the
+textbook definitions of recall@k, MAP@k and NDCG@k.
+"""
+
+import numpy as np
+import pytest
+
+from retrieval_eval import evaluate_retrieval, holdout_split, top_k_indices
+
+def reference_metrics(user_idx, track_idx, embeddings, ks, holdout_fraction, seed):
+    num_tracks = len(embeddings)
+    keys = np.unique(user_idx * num_tracks + track_idx)
+    user_idx, track_idx = keys // num_tracks, keys % num_tracks
+    heldout = holdout_split(user_idx, track_idx, holdout_fraction, seed=seed)
+    items = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    totals = {f'{name}@{k}': 0.0 for k in ks for name in ('recall', 'map', 'ndcg')}
+    evaluated = 0
+    for user in np.unique(user_idx):
+        seen = track_idx[(user_idx == user) & ~heldout]
+        relevant = set(track_idx[(user_idx == user) & heldout].tolist())
+        if not len(seen) or not relevant:
+            continue
+        evaluated += 1
+        query = items[seen].mean(axis=0)
+        scores = items @ (query / np.linalg.norm(query))
+        scores[seen] = -np.inf
+        ranking = np.argsort(-scores, kind='stable')
+        for k in ks:
+            hits = [track in relevant for track in ranking[:k].tolist()]
+            totals[f'recall@{k}'] += sum(hits) / len(relevant)
+            precision_sum = sum(sum(hits[:rank + 1]) / (rank + 1) for rank in range(k) if hits[rank])
+            totals[f'map@{k}'] += precision_sum / min(len(relevant), k)
+            dcg = sum(1 / np.log2(rank + 2) for rank in range(k) if hits[rank])
+            ideal = sum(1 / np.log2(rank + 2) for rank in range(min(len(relevant), k)))
+            totals[f'ndcg@{k}'] += dcg / ideal
+    return {name: value / evaluated for name, value in totals.items()}, evaluated
+
+@pytest.mark.parametrize('block_size', [None, 7])
+def test_metrics_match_the_reference(block_size):
+    rng = np.random.default_rng(0)
+    num_users, num_tracks = 60, 300
+    # Neighbouring tracks have similar embeddings and users play from one region of the
+    # catalog, so the metrics are far from zero; repeated plays exercise the deduplication
+    angle = 2 * np.pi * np.arange(num_tracks) / num_tracks
+    embeddings = np.column_stack([4 * np.cos(angle), 4 * np.sin(angle), rng.normal(size=(num_tracks, 14))])
+    user_idx = np.repeat(np.arange(num_users), rng.integers(1, 30, num_users))
+    track_idx = (user_idx * 5 + rng.integers(0, 40, len(user_idx))) % num_tracks
+    ks = [1, 5, 20]
+
+    result = evaluate_retrieval(user_idx, track_idx, embeddings, ks=ks, holdout_fraction=0.3,
+                                block_size=block_size, workers=2, seed=3)
+    expected, evaluated = reference_metrics(user_idx, track_idx, embeddings, ks, 0.3, seed=3)
+
+    assert result['users_evaluated'] == evaluated
+    assert set(result['metrics']) == set(expected)
+    for name, value in expected.items():
+        assert result['metrics'][name] == pytest.approx(value, abs=1e-6), name
+
+def test_holdout_keeps_at_least_one_seen_track():
+    user_idx = np.repeat(np.arange(4), [1, 2, 5, 10])
+    track_idx = np.arange(len(user_idx))
+    heldout = holdout_split(user_idx, track_idx, holdout_fraction=0.9)
+    per_user = np.bincount(user_idx[heldout], minlength=4)
+    assert per_user.tolist() == [0, 1, 4, 9]
+
+@pytest.mark.parametrize('num_columns', [50, 2000, 2003])
+def test_top_k_indices_matches_a_full_sort(num_columns):
+    scores = np.random.default_rng(num_columns).normal(size=(9, num_columns)).astype(np.float32)
+    expected = np.argsort(-scores, axis=1, kind='stable')[:, :5]
+    np.testing.assert_array_equal(top_k_indices(scores, 5), expected)
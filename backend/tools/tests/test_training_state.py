@@ -0,0 +1,104 @@
+"""
+Training state snapshots: a run killed mid-epoch and resumed from its newest
+snapshot must end with bit-identical weights and history to a run that was
+never interrupted.
+"""
+
+import argparse
+import contextlib
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from training_state import (
+    capture_rng_state, epoch_order, latest_snapshot, list_snapshots, load_array_snapshot,
+    restore_rng_state, save_array_snapshot
+)
+from train_content_model import train_model
+
+class Killed(Exception):
+    pass
+
+class KillAfter:
+    """Profiler stand-in that kills the run after a number of training batches"""
+
+    def __init__(self, batches):
+        self.batches = batches
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        yield
+
+    def check(self):
+        self.batches -= 1
+        if self.batches == 0:
+            raise Killed()
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    features = rng.normal(size=(120, 11)).astype(np.float32)
+    pairs = rng.integers(0, len(features), size=(300, 2))
+    return features, pairs
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    # train_model writes its checkpoints and model to ../data/models
+    (tmp_path / 'work').mkdir()
+    monkeypatch.chdir(tmp_path / 'work')
+
+def make_args(snapshot_dir, **overrides):
+    args = dict(
+        seed=7, epochs=2, batch_size=16, learning_rate=0.01, warmup_epochs=0.5,
+        validation_split=0.2, embedding_size=8, snapshot_every=3, snapshot_dir=str(snapshot_dir),
+        resume=False
+    )
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+def test_snapshot_round_trip_and_pruning(tmp_path):
+    for step in range(1, 5):
+        save_array_snapshot(tmp_path, step, {'model': [np.full(3, step), np.eye(2)]}, {'step': step}, keep=2)
+
+    assert [path.name for path in list_snapshots(tmp_path)] == ['state-000000000003.npz', 'state-000000000004.npz']
+    groups, meta = load_array_snapshot(latest_snapshot(tmp_path))
+    assert meta == {'step': 4}
+    np.testing.assert_array_equal(groups['model'][0], np.full(3, 4))
+    np.testing.assert_array_equal(groups['model'][1], np.eye(2))
+
+def test_temporary_files_are_not_snapshots(tmp_path):
+    save_array_snapshot(tmp_path, 1, {}, {'step': 1})
+    (tmp_path / 'state-000000000002.npz.tmp').write_bytes(b'torn')
+    assert latest_snapshot(tmp_path).name == 'state-000000000001.npz'
+
+def test_epoch_order_and_rng_state():
+    np.testing.assert_array_equal(epoch_order(7, 1, 50), epoch_order(7, 1, 50))
+    assert not np.array_equal(epoch_order(7, 1, 50), epoch_order(7, 2, 50))
+
+    state = capture_rng_state()
+    expected = np.random.random(5)
+    np.random.random(3)
+    restore_rng_state(state)
+    np.testing.assert_array_equal(np.random.random(5), expected)
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'loss': 'infonce', 'num_negatives': 8, 'accumulation_steps': 2}
+], ids=['cosine', 'infonce-accumulated'])
+def test_resume_is_bit_exact(tmp_path, data, options):
+    features, pairs = data
+    model, history = train_model(features, pairs, make_args(tmp_path / 'uninterrupted', **options))
+    expected = [variable.numpy() for variable in model.variables]
+
+    # 15 training batches per epoch: killed in the second epoch, between snapshots
+    with pytest.raises(Killed):
+        train_model(features, pairs, make_args(tmp_path / 'killed', **options), profiler=KillAfter(20))
+    meta = load_array_snapshot(latest_snapshot(tmp_path / 'killed'))[1]
+    assert meta['epoch'] == 1 and meta['cursor'] > 0
+
+    model, resumed_history = train_model(features, pairs, make_args(tmp_path / 'killed', resume=True, **options))
+    assert resumed_history == history
+    for variable, value in zip(model.variables, expected):
+        np.testing.assert_array_equal(variable.numpy(), value, err_msg=variable.path)
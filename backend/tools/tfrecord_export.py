@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Sharded TFRecord Export for Content Model Training
+
+This script exports training pairs as standardized (anchor, positive, weight) records
+into N compressed TFRecord shards, split into train and validation sets. Each record
+holds a block of pairs, so writing and parsing cost is amortized. The training path
+reads the shards with a parallel interleave, shuffles at the file level and inside a
+buffer, and parses records in parallel, so datasets far larger than RAM stream at
+disk speed and several trainers can share one export.
+
+Layout of an export directory:
+    tfrecords.json                 manifest (shapes, counts, normalization, files)
+    train-00000-of-00016.tfrecord  training shards (GZIP compressed by default)
+    val-00000-of-00016.tfrecord    validation shards
+    artifact/                      track ids, normalization and raw features (model_artifact format)
+
+Usage:
+python tfrecord_export.py --output ../data/tfrecords/latest --num-shards 16
+python tfrecord_export.py --workload workload.npz --output ../data/tfrecords/synthetic
+"""
+
+import sys
+import json
+import argparse
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+
+from cooccurrence import WEIGHTING_SCHEMES
+from model_artifact import write_artifact
+from streaming_stats import compute_stats, iter_chunks
+
+# Try importing TensorFlow, handle gracefully if not available
+try:
+    import tensorflow as tf
+except ImportError:
+    print("TensorFlow not found, some functionality will be limited")
+    tf = None
+
+TFRECORD_FORMAT_VERSION = 1
+TFRECORD_MANIFEST = 'tfrecords.json'
+SPLITS = ['train', 'val']
+
+def _float_feature(values):
+    return tf.train.Feature(float_list=tf.train.FloatList(value=values))
+
+def _serialize_block(anchors, positives, weights):
+    """Serialize a block of pairs into one tf.train.Example"""
+    example = tf.train.Example(features=tf.train.Features(feature={
+        'anchor': _float_feature(anchors.ravel()),
+        'positive': _float_feature(positives.ravel()),
+        'weight': _float_feature(weights)
+    }))
+    return example.SerializeToString()
+
+def shard_paths(output_dir, split, num_shards):
+    """File names of the shards of one split"""
+    return [
+        Path(output_dir) / f'{split}-{shard:05d}-of-{num_shards:05d}.tfrecord'
+        for shard in range(num_shards)
+    ]
+
+def export_tfrecords(output_dir, features, similar_pairs, pair_weights=None, stats=None,
+                     track_ids=None, num_shards=16, pairs_per_record=128,
+                     validation_split=0.2, compression='GZIP', chunk_size=65536, seed=42):
+    """
+    Write standardized training pairs into sharded TFRecord files
+
+    Args:
+        output_dir: Export directory
+        features: Raw feature matrix (array or memmap)
+        similar_pairs: Array of (anchor, positive) track index pairs
+        pair_weights: Optional per-pair loss weights
+        stats: Optional RunningStats of the features
+        track_ids: Optional track ids, stored as a model artifact next to the shards
+            together with the raw features (so trainers can embed the catalog)
+        num_shards: Number of shards per split
+        pairs_per_record: Pairs serialized into each record
+        validation_split: Fraction of pairs written to the validation shards
+        compression: 'GZIP', 'ZLIB' or '' for uncompressed
+        chunk_size: Pairs standardized at once (bounds memory)
+        seed: Seed of the pair shuffle before splitting
+
+    Returns:
+        The manifest dictionary
+    """
+    if tf is None:
+        raise ImportError("TensorFlow is required to write TFRecords")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if stats is None:
+        stats = compute_stats(iter_chunks(features), features.shape[1])
+    means = stats.mean.astype(np.float32)
+    stds = stats.safe_std().astype(np.float32)
+
+    similar_pairs = np.asarray(similar_pairs, dtype=np.int64).reshape(-1, 2)
+    if pair_weights is None:
+        pair_weights = np.ones(len(similar_pairs), dtype=np.float32)
+    pair_weights = np.asarray(pair_weights, dtype=np.float32)
+
+    order = np.random.default_rng(seed).permutation(len(similar_pairs))
+    train_size = int(len(order) * (1 - validation_split))
+    split_orders = {'train': order[:train_size], 'val': order[train_size:]}
+
+    # Round chunks to whole records so only the last record of a split is partial
+    chunk_size = max(pairs_per_record, chunk_size - chunk_size % pairs_per_record)
+    options = tf.io.TFRecordOptions(compression_type=compression)
+    splits = {}
+
+    for split, split_order in split_orders.items():
+        paths = shard_paths(output_dir, split, num_shards)
+        writers = [tf.io.TFRecordWriter(str(path), options) for path in paths]
+        record_index = 0
+        try:
+            for start in range(0, len(split_order), chunk_size):
+                indices = np.sort(split_order[start:start + chunk_size])
+                pairs = similar_pairs[indices]
+                anchors = ((np.asarray(features[pairs[:, 0]], dtype=np.float32) - means) / stds)
+                positives = ((np.asarray(features[pairs[:, 1]], dtype=np.float32) - means) / stds)
+                weights = pair_weights[indices]
+
+                # The chunk was sorted for sequential reads, which lost its shuffled order. Shuffle it
+                # again with a fresh permutation seeded by the chunk start, so it is reproducible
+                # but different from the order before sorting.
+                shuffle = np.random.default_rng(seed + start).permutation(len(indices))
+                anchors, positives, weights = anchors[shuffle], positives[shuffle], weights[shuffle]
+
+                for block in range(0, len(indices), pairs_per_record):
+                    end = block + pairs_per_record
+                    writers[record_index % num_shards].write(
+                        _serialize_block(anchors[block:end], positives[block:end], weights[block:end])
+                    )
+                    record_index += 1
+        finally:
+            for writer in writers:
+                writer.close()
+
+        splits[split] = {
+            'pairs': int(len(split_order)),
+            'records': record_index,
+            'files': [path.name for path in paths]
+        }
+        print(f"Wrote {len(split_order)} {split} pairs to {num_shards} shards")
+
+    manifest = {
+        'format_version': TFRECORD_FORMAT_VERSION,
+        'created': datetime.now().isoformat(),
+        'feature_dim': int(features.shape[1]),
+        'pairs_per_record': pairs_per_record,
+        'compression': compression,
+        'num_shards': num_shards,
+        'means': stats.mean.tolist(),
+        'stds': stats.safe_std().tolist(),
+        'splits': splits
+    }
+
+    if track_ids is not None:
+        write_artifact(output_dir / 'artifact', track_ids, stats.mean, stats.safe_std(), features=features)
+        manifest['artifact_dir'] = 'artifact'
+
+    with open(output_dir / TFRECORD_MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+def load_tfrecord_manifest(export_dir):
+    """Read and validate an export manifest"""
+    with open(Path(export_dir) / TFRECORD_MANIFEST, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != TFRECORD_FORMAT_VERSION:
+        raise ValueError(f"Unsupported TFRecord export format in {export_dir}")
+    return manifest
+
+def make_tfrecord_dataset(files, feature_dim, batch_size, compression='GZIP', shuffle=False,
+                          shuffle_buffer=10000, pairs_per_record=128, seed=None, deterministic=None):
+    """
+    Build a dataset of (anchor, positive, weight) batches from TFRecord shards
+
+    Files are shuffled and read with a parallel interleave; records are parsed in
+    parallel, and pairs are shuffled again inside a buffer after unbatching.
+    Shuffled datasets trade a reproducible order for throughput unless
+    deterministic=True (with a seed, the order is then fixed).
+    """
+    if deterministic is None:
+        deterministic = not shuffle
+    feature_spec = {
+        'anchor': tf.io.VarLenFeature(tf.float32),
+        'positive': tf.io.VarLenFeature(tf.float32),
+        'weight': tf.io.VarLenFeature(tf.float32)
+    }
+
+    def parse_block(record):
+        parsed = tf.io.parse_single_example(record, feature_spec)
+        anchors = tf.reshape(tf.sparse.to_dense(parsed['anchor']), [-1, feature_dim])
+        positives = tf.reshape(tf.sparse.to_dense(parsed['positive']), [-1, feature_dim])
+        return anchors, positives, tf.sparse.to_dense(parsed['weight'])
+
+    dataset = tf.data.Dataset.from_tensor_slices([str(path) for path in files])
+    if shuffle:
+        dataset = dataset.shuffle(len(files), seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.interleave(
+        lambda path: tf.data.TFRecordDataset(path, compression_type=compression),
+        cycle_length=min(len(files), 16),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=deterministic
+    )
+    if shuffle:
+        dataset = dataset.shuffle(max(1, shuffle_buffer // pairs_per_record), seed=seed)
+    dataset = dataset.map(parse_block, num_parallel_calls=tf.data.AUTOTUNE, deterministic=deterministic)
+    dataset = dataset.unbatch()
+    if shuffle:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+def load_tfrecord_datasets(export_dir, batch_size, shuffle_buffer=10000, seed=None, deterministic=None):
+    """
+    Open the train and validation datasets of an export
+
+    Returns:
+        Tuple of (train_dataset, val_dataset, manifest)
+    """
+    manifest = load_tfrecord_manifest(export_dir)
+    datasets = []
+    for split in SPLITS:
+        files = [Path(export_dir) / name for name in manifest['splits'][split]['files']]
+        datasets.append(make_tfrecord_dataset(
+            files,
+            manifest['feature_dim'],
+            batch_size,
+            compression=manifest['compression'],
+            shuffle=split == 'train',
+            shuffle_buffer=shuffle_buffer,
+            pairs_per_record=manifest['pairs_per_record'],
+            seed=seed,
+            deterministic=deterministic
+        ))
+    return datasets[0], datasets[1], manifest
+
+def main():
+    """Export training pairs from the database or a synthetic workload"""
+    if not tf:
+        print("Cannot export TFRecords because TensorFlow is not available.")
+        sys.exit(1)
+
+    parser = argparse.ArgumentParser(description='Export content model training pairs to TFRecord shards')
+    parser.add_argument('--output', type=str, required=True, help='Export directory')
+    parser.add_argument('--workload', type=str, help='Synthetic workload .npz (skips the database)')
+    parser.add_argument('--num-shards', type=int, default=16, help='Shards per split')
+    parser.add_argument('--pairs-per-record', type=int, default=128, help='Pairs per TFRecord record')
+    parser.add_argument('--validation-split', type=float, default=0.2, help='Validation data split ratio')
+    parser.add_argument('--compression', choices=['GZIP', 'ZLIB', 'NONE'], default='GZIP', help='Shard compression')
+    parser.add_argument('--raw-pairs', action='store_true', help='Export one pair per user instead of weighted pairs')
+    parser.add_argument('--min-cooccurrence', type=int, default=1, help='Drop pairs shared by fewer users')
+    parser.add_argument('--pair-weighting', choices=WEIGHTING_SCHEMES, default='count',
+                        help='Weighting scheme for co-occurrence pairs')
+    args = parser.parse_args()
+
+    if args.workload:
+        from cooccurrence import interactions_to_pairs, weighted_pairs
+
+        workload = np.load(args.workload)
+        features = workload['features']
+        # Same ids as synthetic_workload.write_interactions_csv
+        track_ids = [f'synthetic_track_{t}' for t in range(len(features))]
+        if args.raw_pairs:
+            similar_pairs = interactions_to_pairs(workload['user_idx'], workload['track_idx'])
+            pair_weights = None
+        else:
+            similar_pairs, pair_weights = weighted_pairs(
+                workload['user_idx'], workload['track_idx'], len(features),
+                min_count=args.min_cooccurrence, weighting=args.pair_weighting
+            )
+    else:
+        from train_content_model import load_env_variables, connect_to_database, fetch_training_data
+
+        conn = connect_to_database(load_env_variables())
+        if not conn:
+            print("Failed to connect to database. Exiting.")
+            sys.exit(1)
+        features, similar_pairs, track_ids, pair_weights = fetch_training_data(
+            conn,
+            aggregate_pairs=not args.raw_pairs,
+            min_cooccurrence=args.min_cooccurrence,
+            pair_weighting=args.pair_weighting
+        )
+        conn.close()
+        if features is None:
+            print("Failed to fetch training data. Exiting.")
+            sys.exit(1)
+
+    manifest = export_tfrecords(
+        args.output,
+        features,
+        similar_pairs,
+        pair_weights=pair_weights,
+        track_ids=track_ids,
+        num_shards=args.num_shards,
+        pairs_per_record=args.pairs_per_record,
+        validation_split=args.validation_split,
+        compression='' if args.compression == 'NONE' else args.compression
+    )
+    print(json.dumps({split: info['pairs'] for split, info in manifest['splits'].items()}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Layer-Wise Adaptive Optimizers for PyTorch
+
+PyTorch counterparts of the LAMB and LARS optimizers in large_batch.py, used by
+gpu_accelerator.py when training with accumulated large batches. torch.optim
+ships neither. Update rules match the TensorFlow versions. Every weight matrix
+update is rescaled by ||w|| / ||update||, so the relative step per layer does
+not depend on the gradient scale. Parameters with one dimension
+(biases, BatchNorm weights) get the plain update without weight decay.
+
+Gradient accumulation weights each micro-batch's mean loss by its share of the
+window's rows (window_loss_weight), so the summed gradients equal those of the
+mean loss over the window. As in large_batch.py, BatchNorm is not affected by
+this: in training mode each micro-batch is normalized with its own statistics,
+and the running statistics are updated once per micro-batch.
+
+This module imports torch at load time; gpu_accelerator.py imports it lazily
+inside its training function, like torch itself.
+"""
+
+import torch
+
+# Same choices as large_batch.OPTIMIZERS (not imported: it loads TensorFlow)
+OPTIMIZERS = ['adam', 'lamb', 'lars']
+
+def _trust_ratio(param, update):
+    """||w|| / ||update||, or 1 when either norm is zero"""
+    weight_norm = torch.linalg.vector_norm(param)
+    update_norm = torch.linalg.vector_norm(update)
+    if weight_norm > 0 and update_norm > 0:
+        return weight_norm / update_norm
+    return torch.ones((), device=param.device)
+
+class Lamb(torch.optim.Optimizer):
+    """LAMB: Adam direction with decoupled weight decay, scaled per layer by the trust ratio"""
+
+    def __init__(self, params, lr=0.001, betas=(0.9, 0.999), eps=1e-6, weight_decay=0.0):
+        super().__init__(params, dict(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay))
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+        for group in self.param_groups:
+            beta_1, beta_2 = group['betas']
+            for param in group['params']:
+                if param.grad is None:
+                    continue
+                state = self.state[param]
+                if not state:
+                    state['step'] = 0
+                    state['exp_avg'] = torch.zeros_like(param)
+                    state['exp_avg_sq'] = torch.zeros_like(param)
+                state['step'] += 1
+                exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
+                exp_avg.mul_(beta_1).add_(param.grad, alpha=1 - beta_1)
+                exp_avg_sq.mul_(beta_2).addcmul_(param.grad, param.grad, value=1 - beta_2)
+                m_hat = exp_avg / (1 - beta_1 ** state['step'])
+                v_hat = exp_avg_sq / (1 - beta_2 ** state['step'])
+                update = m_hat / (v_hat.sqrt() + group['eps'])
+                if param.ndim > 1:
+                    if group['weight_decay']:
+                        update.add_(param, alpha=group['weight_decay'])
+                    update.mul_(_trust_ratio(param, update))
+                param.sub_(update, alpha=group['lr'])
+        return loss
+
+class Lars(torch.optim.Optimizer):
+    """LARS: momentum SGD on gradients plus weight decay, scaled per layer by the trust ratio"""
+
+    def __init__(self, params, lr=0.001, momentum=0.9, weight_decay=0.0):
+        super().__init__(params, dict(lr=lr, momentum=momentum, weight_decay=weight_decay))
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+        for group in self.param_groups:
+            for param in group['params']:
+                if param.grad is None:
+                    continue
+                update = param.grad.clone()
+                if param.ndim > 1:
+                    if group['weight_decay']:
+                        update.add_(param, alpha=group['weight_decay'])
+                    update.mul_(_trust_ratio(param, update))
+                state = self.state[param]
+                if 'velocity' not in state:
+                    state['velocity'] = torch.zeros_like(param)
+                velocity = state['velocity']
+                velocity.mul_(group['momentum']).add_(update)
+                param.sub_(velocity, alpha=group['lr'])
+        return loss
+
+def window_loss_weight(batch_rows, window_rows):
+    """Factor of a micro-batch's mean loss so that summed gradients are those of the window mean"""
+    return batch_rows / window_rows
+
+def accumulation_gap(model, criterion, inputs, targets, accumulation_steps):
+    """
+    Largest relative difference between accumulated and full-batch gradients
+
+    Runs the model in its current mode (train() normalizes BatchNorm with batch
+    statistics and updates the running statistics on every forward pass).
+
+    Args:
+        model: torch.nn.Module
+        criterion: Loss returning the mean over the rows of a batch
+        inputs: Batch of model inputs
+        targets: Row-aligned loss targets
+        accumulation_steps: Number of micro-batches the batch is split into
+
+    Returns:
+        Maximum over parameters of ||accumulated - full|| / ||full||
+    """
+    params = [param for param in model.parameters() if param.requires_grad]
+    model.zero_grad()
+    criterion(model(inputs), targets).backward()
+    full = [param.grad.clone() for param in params]
+
+    model.zero_grad()
+    for batch, batch_targets in zip(torch.tensor_split(inputs, accumulation_steps),
+                                    torch.tensor_split(targets, accumulation_steps)):
+        loss = criterion(model(batch), batch_targets)
+        (loss * window_loss_weight(len(batch), len(inputs))).backward()
+    accumulated = [param.grad.clone() for param in params]
+    model.zero_grad()
+
+    gaps = [float(torch.linalg.vector_norm(a - f) / torch.linalg.vector_norm(f).clamp_min(1e-12))
+            for a, f in zip(accumulated, full)]
+    return max(gaps)
+
+def build_torch_optimizer(name, params, learning_rate=0.001, weight_decay=0.0):
+    """torch.optim.Adam, Lamb or Lars for one of OPTIMIZERS"""
+    if name == 'adam':
+        return torch.optim.Adam(params, lr=learning_rate)
+    if name == 'lamb':
+        return Lamb(params, lr=learning_rate, weight_decay=weight_decay)
+    if name == 'lars':
+        return Lars(params, lr=learning_rate, weight_decay=weight_decay)
+    raise ValueError(f"Unknown optimizer '{name}', expected one of {OPTIMIZERS}")
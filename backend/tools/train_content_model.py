@@ -12,14 +12,58 @@ python train_content_model.py --epochs 50 --batch-size 64 --validation-split 0.2
 import os
 import sys
 import json
+import math
+import time
 import argparse
+import tempfile
+import multiprocessing
 import numpy as np
 from pathlib import Path
 from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+try:
+    import psycopg2
+except ImportError:
+    # Offline training (--offline-db) does not need a Postgres driver
+    psycopg2 = None
 from dotenv import load_dotenv
 
+from autotune import (
+    LR_SCALING_RULES,
+    autotune,
+    default_thread_counts,
+    geometric_range,
+    is_out_of_memory,
+    scale_learning_rate,
+    total_memory_mb,
+    warmup_factor
+)
+from data_sources import FETCH_CHUNK_SIZE, FEATURE_COLUMNS, SQLiteDataSource, as_data_source
+from distill_model import DISTILLATION_LOSSES, distill_and_report, to_numpy_model
+from large_batch import OPTIMIZERS, GradientAccumulator, build_optimizer
+from model_artifact import load_artifact, publish_artifact
+from numpy_inference import export_numpy_model
+from cooccurrence import WEIGHTING_SCHEMES, interactions_to_pairs, weighted_pairs
+from negative_sampling import DEFAULT_ALPHA, popularity_sampler
+from memory_profiling import NULL_PROFILER, MemoryBudgetExceeded, MemoryProfiler, parse_budgets
+from tfrecord_export import export_tfrecords, load_tfrecord_datasets, load_tfrecord_manifest
+from training_state import (
+    capture_rng_state,
+    epoch_order,
+    latest_snapshot,
+    load_array_snapshot,
+    restore_rng_state,
+    save_array_snapshot
+)
+from streaming_stats import (
+    DEFAULT_CHUNK_SIZE,
+    RunningStats,
+    compute_stats,
+    iter_chunks,
+    standardize_inplace
+)
+
 # Try importing TensorFlow, handle gracefully if not available
 try:
     import tensorflow as tf
@@ -27,6 +71,18 @@ except ImportError:
     print("TensorFlow not found, some functionality will be limited")
     tf = None
 
+# Training objectives: positive-only cosine distance, or InfoNCE with negatives
+LOSSES = ['cosine', 'infonce']
+
+# Untimed steps before each autotune probe (tracing, allocator warmup)
+AUTOTUNE_WARMUP_STEPS = 3
+
+# Data of the autotune probe process, set by its initializer
+_PROBE_DATA = None
+
+class ModelSaveError(Exception):
+    """Raised by save_model_and_metadata after writing everything it could"""
+
 def load_env_variables():
     """Load environment variables from .env file"""
     env_vars = {}
@@ -58,6 +114,9 @@ def load_env_variables():
 
 def connect_to_database(env_vars):
     """Connect to PostgreSQL database using environment variables"""
+    if psycopg2 is None:
+        print("psycopg2 is not installed; use --offline-db to train from a SQLite database")
+        return None
     try:
         # Parse DATABASE_URL if available
         db_url = env_vars.get('DATABASE_URL', '')
@@ -103,117 +162,165 @@ def connect_to_database(env_vars):
         print(f"Error connecting to database: {e}")
         return None
 
-def fetch_training_data(conn):
-    """Fetch training data from the database"""
-    print("Fetching training data from database...")
+def index_interactions(interactions, track_indices, return_users=False):
+    """
+    Convert interaction rows to user/track index arrays, dropping unknown tracks
+    
+    Args:
+        interactions: Rows with userId and trackId
+        track_indices: Mapping of track id to row in the feature table
+        return_users: Also return the user ids, indexed like user_idx
+    
+    Returns:
+        Tuple of (user_idx, track_idx), plus user_ids with return_users
+    """
+    user_indices = {}
+    user_idx = []
+    track_idx = []
+    for interaction in interactions:
+        track_index = track_indices.get(interaction['trackId'])
+        if track_index is None:
+            continue  # Skip interactions for tracks without features
+        user_idx.append(user_indices.setdefault(interaction['userId'], len(user_indices)))
+        track_idx.append(track_index)
+    result = (np.array(user_idx, dtype=np.int64), np.array(track_idx, dtype=np.int64))
+    if return_users:
+        result += (list(user_indices),)
+    return result
+
+def fetch_feature_table(source, chunk_size=FETCH_CHUNK_SIZE, profiler=None):
+    """
+    Stream track rows into a memory-mapped float32 feature table
+    
+    Rows are fetched chunk by chunk, folded into feature statistics and appended
+    to an unlinked temporary file, so neither all track rows nor a second copy
+    of the feature matrix is ever held in memory. The table is backed by the
+    page cache and can be evicted under memory pressure.
+    
+    Args:
+        source: DataSource to read track rows from
+        chunk_size: Rows per fetch
+        profiler: Optional MemoryProfiler, checked against its budgets after every chunk
+    
+    Returns:
+        Tuple of (features of shape (num_tracks, len(FEATURE_COLUMNS)), track_ids, RunningStats)
+    """
+    profiler = profiler or NULL_PROFILER
+    dim = len(FEATURE_COLUMNS)
+    stats = RunningStats(dim)
+    track_ids = []
+    with tempfile.TemporaryFile(prefix='features-') as f:
+        for rows in source.iter_tracks(chunk_size):
+            chunk, chunk_ids = extract_features(rows)
+            stats.update(chunk)
+            f.write(chunk.astype(np.float32).tobytes())
+            track_ids.extend(chunk_ids)
+            profiler.check()
+        if not track_ids:
+            return np.zeros((0, dim), dtype=np.float32), track_ids, stats
+        f.flush()
+        # The mapping keeps its own file descriptor after the file is closed
+        features = np.memmap(f, dtype=np.float32, mode='r', shape=(len(track_ids), dim))
+    return features, track_ids, stats
+
+def fetch_training_data(conn, aggregate_pairs=True, min_cooccurrence=1, pair_weighting='count',
+                        profiler=None, return_counts=False, return_stats=False):
+    """
+    Fetch training data from the database
+    
+    Args:
+        conn: Open database connection or DataSource (e.g. an offline SQLiteDataSource)
+        aggregate_pairs: Return weighted unique pairs instead of one pair per user
+        min_cooccurrence: Drop pairs shared by fewer users (aggregated pairs only)
+        pair_weighting: Weighting scheme for aggregated pairs (see cooccurrence.py)
+        profiler: Optional MemoryProfiler recording the ingest and pair generation stages
+        return_counts: Also return the number of interactions per track
+        return_stats: Also return the RunningStats of the features, accumulated
+            while streaming them from the database
+        
+    Returns:
+        Tuple of (features, similar_pairs, track_ids, pair_weights), plus
+        track_counts with return_counts and stats with return_stats;
+        features is a read-only float32 memmap (see fetch_feature_table) and
+        pair_weights is None for unaggregated pairs
+    """
+    failed = (None,) * (4 + return_counts + return_stats)
+    source = as_data_source(conn)
+    print(f"Fetching training data from {source.name} data source...")
+    profiler = profiler or NULL_PROFILER
     
     try:
-        # Get tracks with audio features
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("""
-                SELECT t.id AS track_id, t.name, t.artists, t.popularity, 
-                       f.acousticness, f.danceability, f.energy, f.instrumentalness, 
-                       f.key, f.liveness, f.loudness, f.mode, f.speechiness, 
-                       f.tempo, f.valence
-                FROM "Track" t
-                JOIN "TrackFeatures" f ON t.id = f."trackId"
-            """)
-            tracks = cursor.fetchall()
+        with profiler.stage('ingest'):
+            # Stream tracks with audio features into the feature table
+            features, track_ids, stats = fetch_feature_table(source, profiler=profiler)
             
-            if not tracks:
+            if not track_ids:
                 print("No tracks with audio features found in the database.")
-                return None, None, None
-                
-            print(f"Found {len(tracks)} tracks with audio features")
+                return failed
+            
+            print(f"Found {len(track_ids)} tracks with audio features")
             
             # Try to get user interactions
             try:
-                cursor.execute("""
-                    SELECT "userId", "trackId" FROM "UserInteraction"
-                    WHERE "action" IN ('play', 'like', 'addToPlaylist')
-                """)
-                interactions = cursor.fetchall()
+                interactions = source.fetch_interactions()
                 
                 if not interactions:
                     print("No user interactions found in the database. Generating synthetic interactions.")
-                    interactions = generate_synthetic_interactions(tracks)
-                    
+                    interactions = generate_synthetic_interactions(track_ids)
+                
                 print(f"Using {len(interactions)} user interactions")
             except Exception as e:
                 print(f"Error fetching user interactions: {e}")
                 print("Generating synthetic interactions for training.")
-                interactions = generate_synthetic_interactions(tracks)
-            
+                interactions = generate_synthetic_interactions(track_ids)
+        
+        with profiler.stage('pair_generation'):
             # Create track indices
-            track_indices = {track['track_id']: i for i, track in enumerate(tracks)}
-            
-            # Group interactions by user
-            user_tracks = {}
-            for interaction in interactions:
-                user_id = interaction['userId']
-                track_id = interaction['trackId']
-                
-                if track_id not in track_indices:
-                    continue  # Skip interactions for tracks without features
-                    
-                if user_id not in user_tracks:
-                    user_tracks[user_id] = []
-                user_tracks[user_id].append(track_id)
-            
-            # Create similar pairs
-            similar_pairs = []
-            for user_id, track_ids in user_tracks.items():
-                # Remove duplicates
-                unique_track_ids = list(set(track_ids))
-                
-                # Only process users with at least 2 tracks
-                if len(unique_track_ids) >= 2:
-                    # Create all possible pairs
-                    for i in range(len(unique_track_ids)):
-                        for j in range(i + 1, len(unique_track_ids)):
-                            track1_id = unique_track_ids[i]
-                            track2_id = unique_track_ids[j]
-                            
-                            if track1_id in track_indices and track2_id in track_indices:
-                                similar_pairs.append([
-                                    track_indices[track1_id],
-                                    track_indices[track2_id]
-                                ])
+            track_indices = {track_id: i for i, track_id in enumerate(track_ids)}
             
-            print(f"Created {len(similar_pairs)} similar pairs from user interactions")
+            # Map interactions to index arrays, skipping tracks without features
+            user_idx, track_idx = index_interactions(interactions, track_indices)
             
-            # Extract features
-            features = []
-            track_ids = []
-            
-            for track in tracks:
-                feature_vector = [
-                    float(track['acousticness']),
-                    float(track['danceability']),
-                    float(track['energy']),
-                    float(track['instrumentalness']),
-                    float(track['key']),
-                    float(track['liveness']),
-                    float(track['loudness']),
-                    float(track['mode']),
-                    float(track['speechiness']),
-                    float(track['tempo']),
-                    float(track['valence'])
-                ]
-                features.append(feature_vector)
-                track_ids.append(track['track_id'])
-            
-            return np.array(features), np.array(similar_pairs), track_ids
+            if aggregate_pairs:
+                # Weighted unique pairs instead of one pair per user who shares them
+                similar_pairs, pair_weights = weighted_pairs(
+                    user_idx, track_idx, len(track_ids),
+                    min_count=min_cooccurrence, weighting=pair_weighting
+                )
+                print(f"Created {len(similar_pairs)} weighted unique pairs from user interactions "
+                      f"(weighting={pair_weighting}, min_count={min_cooccurrence})")
+            else:
+                similar_pairs = interactions_to_pairs(user_idx, track_idx)
+                pair_weights = None
+                print(f"Created {len(similar_pairs)} similar pairs from user interactions")
+        
+        result = (features, similar_pairs, track_ids, pair_weights)
+        if return_counts:
+            result += (np.bincount(track_idx, minlength=len(track_ids)),)
+        if return_stats:
+            result += (stats,)
+        return result
+    except MemoryBudgetExceeded:
+        raise
     except Exception as e:
         print(f"Error fetching training data: {e}")
-        return None, None, None
+        return failed
+
+def extract_features(tracks):
+    """Build the feature matrix and track id list from track rows"""
+    features = np.array(
+        [[float(track[column]) for column in FEATURE_COLUMNS] for track in tracks],
+        dtype=np.float64
+    )
+    track_ids = [track['track_id'] for track in tracks]
+    return features, track_ids
 
-def generate_synthetic_interactions(tracks):
+def generate_synthetic_interactions(track_ids):
     """Generate synthetic user interactions for training"""
     print("Generating synthetic user interactions for training...")
     
     # Create synthetic users
-    num_users = min(50, len(tracks) // 5)  # 1 user per 5 tracks, max 50 users
+    num_users = min(50, len(track_ids) // 5)  # 1 user per 5 tracks, max 50 users
     num_users = max(10, num_users)  # At least 10 users
     
     # Generate interactions
@@ -222,25 +329,36 @@ def generate_synthetic_interactions(tracks):
     # Each user interacts with 5-20 tracks
     for user_id in range(1, num_users + 1):
         # Determine how many tracks this user interacts with
-        num_interactions = np.random.randint(5, min(20, len(tracks)))
+        num_interactions = np.random.randint(5, min(20, len(track_ids)))
         
         # Select random tracks for this user
-        track_indices = np.random.choice(len(tracks), num_interactions, replace=False)
+        track_indices = np.random.choice(len(track_ids), num_interactions, replace=False)
         
         for idx in track_indices:
             interactions.append({
                 'userId': f"synthetic_user_{user_id}",
-                'trackId': tracks[idx]['track_id']
+                'trackId': track_ids[idx]
             })
     
     print(f"Generated {len(interactions)} synthetic interactions for {num_users} users")
     return interactions
 
-def standardize_features(features):
-    """Standardize features to zero mean and unit variance"""
-    means = np.mean(features, axis=0)
-    stds = np.std(features, axis=0)
-    stds[stds == 0] = 1  # Avoid division by zero
+def compute_feature_stats(features, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Compute feature statistics chunk by chunk (works on arrays and memmaps)"""
+    return compute_stats(iter_chunks(features, chunk_size), features.shape[1])
+
+def standardize_features(features, in_place=False):
+    """
+    Standardize features to zero mean and unit variance
+    
+    Statistics are accumulated chunk by chunk. With in_place=True the float
+    input array is overwritten instead of allocating a standardized copy.
+    """
+    stats = compute_feature_stats(features)
+    means = stats.mean
+    stds = stats.safe_std()  # Avoid division by zero
+    if in_place:
+        return standardize_inplace(features, means, stds), means, stds
     return (features - means) / stds, means, stds
 
 def create_training_pairs(features, similar_pairs):
@@ -301,45 +419,404 @@ def build_model(feature_dim, embed_dim, hidden_layers, learning_rate, dropout_ra
     
     return model
 
-def train_model(features, similar_pairs, args):
-    """Train the content-based model using a custom training approach"""
+def build_embedding_model(feature_dim, embedding_size):
+    """Build the pair-trained track embedding network used by train_model"""
+    return tf.keras.Sequential([
+        tf.keras.layers.InputLayer(input_shape=(feature_dim,)),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.Dense(embedding_size * 2, activation='relu',
+                             kernel_regularizer=tf.keras.regularizers.l2(0.01)),
+        tf.keras.layers.Dropout(0.2),
+        tf.keras.layers.Dense(embedding_size, activation='relu',
+                             kernel_regularizer=tf.keras.regularizers.l2(0.01)),
+        tf.keras.layers.Dropout(0.2),
+        tf.keras.layers.Dense(embedding_size, activation='tanh')
+    ])
+
+def cosine_distance(y_true, y_pred):
+    """Negative cosine similarity per row"""
+    y_true = tf.nn.l2_normalize(y_true, axis=-1)
+    y_pred = tf.nn.l2_normalize(y_pred, axis=-1)
+    return -tf.reduce_sum(y_true * y_pred, axis=-1)
+
+def weighted_cosine_loss(anchor_embedding, positive_embedding, weights):
+    """Weighted mean of per-pair losses (plain mean for unit weights)"""
+    distances = cosine_distance(anchor_embedding, positive_embedding)
+    return tf.reduce_sum(weights * distances) / tf.maximum(tf.reduce_sum(weights), 1e-12)
+
+def info_nce_loss(anchor_embedding, positive_embedding, weights, temperature=0.1,
+                  negative_embedding=None, negative_log_q=None):
+    """
+    Weighted InfoNCE with in-batch negatives
+    
+    Row i scores its anchor against every positive in the batch, so the other
+    B - 1 positives act as negatives without extra forward passes. Optional
+    sampled negatives add columns, with their logits lowered by log(M * q) (the
+    sampled-softmax correction for negatives drawn from q).
+    """
+    anchor = tf.nn.l2_normalize(anchor_embedding, axis=-1)
+    positive = tf.nn.l2_normalize(positive_embedding, axis=-1)
+    logits = tf.matmul(anchor, positive, transpose_b=True) / temperature
+    if negative_embedding is not None:
+        negative = tf.nn.l2_normalize(negative_embedding, axis=-1)
+        negative_logits = tf.matmul(anchor, negative, transpose_b=True) / temperature
+        if negative_log_q is not None:
+            negative_logits -= negative_log_q
+        logits = tf.concat([logits, negative_logits], axis=1)
+    
+    labels = tf.range(tf.shape(anchor)[0])
+    losses = tf.nn.sparse_softmax_cross_entropy_with_logits(labels=labels, logits=logits)
+    return tf.reduce_sum(weights * losses) / tf.maximum(tf.reduce_sum(weights), 1e-12)
+
+def pair_loss(anchor_embedding, positive_embedding, weights, objective='cosine', temperature=0.1,
+              negative_embedding=None, negative_log_q=None):
+    """Loss of a batch of pair embeddings for one of LOSSES"""
+    if objective == 'infonce':
+        return info_nce_loss(anchor_embedding, positive_embedding, weights, temperature,
+                             negative_embedding, negative_log_q)
+    return weighted_cosine_loss(anchor_embedding, positive_embedding, weights)
+
+def pair_gradients(model, anchor_batch, positive_batch, weight_batch, objective='cosine',
+                   temperature=0.1, negative_batch=None, negative_log_q=None):
+    """Loss of a batch of pairs (and optional sampled negatives) and its gradients"""
+    with tf.GradientTape() as tape:
+        anchor_embedding = model(anchor_batch, training=True)
+        positive_embedding = model(positive_batch, training=True)
+        negative_embedding = model(negative_batch, training=True) if negative_batch is not None else None
+        loss = pair_loss(anchor_embedding, positive_embedding, weight_batch, objective, temperature,
+                         negative_embedding, negative_log_q)
+    
+    return loss, tape.gradient(loss, model.trainable_variables)
+
+def train_step(model, optimizer, anchor_batch, positive_batch, weight_batch, objective='cosine',
+               temperature=0.1, negative_batch=None, negative_log_q=None):
+    """One optimizer step on a batch of pairs (and optional sampled negatives); returns the loss"""
+    loss, gradients = pair_gradients(model, anchor_batch, positive_batch, weight_batch, objective,
+                                     temperature, negative_batch, negative_log_q)
+    optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+    return loss
+
+def gather_standardized(features, indices, means, stds):
+    """Standardized float32 feature rows of a raw feature array or memmap"""
+    rows = np.asarray(features[indices], dtype=np.float32)
+    rows -= means
+    rows /= stds
+    return rows
+
+def make_pair_dataset(features, means, stds, pairs, weights, batch_size, shuffle=False):
+    """
+    Build a dataset of (anchor, positive, weight) batches from pair indices
+    
+    Rows are gathered from the raw feature array (or memmap) and standardized
+    inside the pipeline, so neither a tensor copy or standardized copy of the
+    features nor per-pair feature arrays are materialized.
+    """
+    means = np.asarray(means, dtype=np.float32)
+    stds = np.asarray(stds, dtype=np.float32)
     feature_dim = features.shape[1]
     
-    # Standardize features
-    std_features, means, stds = standardize_features(features)
+    def gather_rows(batch_pairs):
+        return (gather_standardized(features, batch_pairs[:, 0], means, stds),
+                gather_standardized(features, batch_pairs[:, 1], means, stds))
     
-    # Create training pairs
-    anchor_features = []
-    positive_features = []
+    def gather_pairs(batch_pairs, batch_weights):
+        anchor, positive = tf.numpy_function(
+            gather_rows, [batch_pairs], [tf.float32, tf.float32], stateful=False
+        )
+        anchor.set_shape([None, feature_dim])
+        positive.set_shape([None, feature_dim])
+        return anchor, positive, batch_weights
     
-    for pair in similar_pairs:
-        anchor_idx, positive_idx = pair
-        anchor_features.append(std_features[anchor_idx])
-        positive_features.append(std_features[positive_idx])
+    dataset = tf.data.Dataset.from_tensor_slices((pairs, weights))
+    if shuffle:
+        dataset = dataset.shuffle(buffer_size=1000)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(gather_pairs, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def _init_probe_worker(threads, data):
+    """Fix the TensorFlow thread pool of a probe process before its runtime starts"""
+    global _PROBE_DATA
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    _PROBE_DATA = data
+
+def _probe_batch_size(batch_size, steps):
+    """Time training steps at one batch size in a probe process"""
+    data = _PROBE_DATA
+    if data['tfrecord_dir']:
+        train_dataset, _, manifest = load_tfrecord_datasets(data['tfrecord_dir'], batch_size)
+        feature_dim = manifest['feature_dim']
+    else:
+        feature_dim = data['features'].shape[1]
+        train_dataset = make_pair_dataset(
+            data['features'], data['means'], data['stds'],
+            data['pairs'], data['weights'], batch_size, shuffle=True
+        )
+    batches = iter(train_dataset.repeat())
+    model = build_embedding_model(feature_dim, data['embedding_size'])
+    optimizer = tf.keras.optimizers.Adam(learning_rate=data['learning_rate'])
+    
+    profiler = MemoryProfiler(trace_allocations=False)
+    with profiler.stage(f'autotune_batch_{batch_size}'):
+        for _ in range(AUTOTUNE_WARMUP_STEPS):
+            train_step(model, optimizer, *next(batches), objective=data['objective'],
+                       temperature=data['temperature'])
+        start_time = time.perf_counter()
+        for _ in range(steps):
+            loss = train_step(model, optimizer, *next(batches), objective=data['objective'],
+                              temperature=data['temperature'])
+        loss.numpy()
+        seconds = time.perf_counter() - start_time
+    
+    return {
+        'batch_size': batch_size,
+        'samples_per_second': steps * batch_size / seconds,
+        'peak_memory_mb': round(profiler.stages[-1]['peak_rss_mb'], 1)
+    }
+
+def autotune_training(args, features=None, similar_pairs=None, pair_weights=None, stats=None,
+                      tfrecord_dir=None):
+    """
+    Pick batch size and thread count by probing, then scale the learning rate
+    
+    TensorFlow thread pools cannot change once the runtime has started, so every
+    thread count is probed in its own spawned process. Each process runs a few
+    steps at increasing batch sizes on a sample of the training pairs.
+    
+    Updates args.batch_size, args.learning_rate and args.warmup_epochs in place and
+    sets this process' intra-op thread count.
+    
+    Returns:
+        Dictionary with the chosen settings and all probe results
+    """
+    steps = args.autotune_steps
+    batch_sizes = geometric_range(args.batch_size, args.autotune_max_batch_size)
+    memory_budget = args.autotune_memory_mb or (total_memory_mb() or 0) * 0.8 or None
+    
+    data = {
+        'tfrecord_dir': tfrecord_dir,
+        'embedding_size': args.embedding_size,
+        'learning_rate': args.learning_rate,
+        'objective': getattr(args, 'loss', 'cosine'),
+        'temperature': getattr(args, 'temperature', 0.1)
+    }
+    if not tfrecord_dir:
+        # A sample large enough for the biggest probe keeps the processes small
+        sample_size = min(len(similar_pairs), batch_sizes[-1] * (steps + AUTOTUNE_WARMUP_STEPS))
+        sample = np.random.default_rng(0).choice(len(similar_pairs), sample_size, replace=False)
+        weights = pair_weights if pair_weights is not None else np.ones(len(similar_pairs))
+        data.update({
+            'features': np.asarray(features, dtype=np.float32),
+            'means': stats.mean,
+            'stds': stats.safe_std(),
+            'pairs': np.asarray(similar_pairs, dtype=np.int64).reshape(-1, 2)[sample],
+            'weights': np.asarray(weights, dtype=np.float32)[sample]
+        })
+    
+    def probe(threads, sizes):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_probe_worker, initargs=(threads, data)) as executor:
+            for batch_size in sizes:
+                try:
+                    yield executor.submit(_probe_batch_size, batch_size, steps).result()
+                except BrokenProcessPool:
+                    yield {'batch_size': batch_size, 'error': 'probe process died (out of memory)'}
+                    return
+                except Exception as e:
+                    if not is_out_of_memory(e):
+                        raise
+                    yield {'batch_size': batch_size, 'error': f'out of memory: {type(e).__name__}'}
+                    return
+    
+    print(f"Autotuning batch sizes {batch_sizes} x threads {default_thread_counts()}")
+    result = autotune(probe, batch_sizes, default_thread_counts(), memory_budget_mb=memory_budget)
+    
+    base_batch_size, base_learning_rate = args.batch_size, args.learning_rate
+    args.batch_size = result['batch_size']
+    args.learning_rate = scale_learning_rate(
+        base_learning_rate, base_batch_size, args.batch_size, args.lr_scaling
+    )
+    if args.warmup_epochs is None:
+        args.warmup_epochs = 1.0
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(result['threads'])
+    except RuntimeError as e:
+        print(f"Warning: could not set the thread count ({e})")
     
-    anchor_features = np.array(anchor_features)
-    positive_features = np.array(positive_features)
+    result.update({
+        'base_batch_size': base_batch_size,
+        'base_learning_rate': base_learning_rate,
+        'learning_rate': args.learning_rate,
+        'lr_scaling': args.lr_scaling,
+        'warmup_epochs': args.warmup_epochs
+    })
+    print(f"Autotuned batch_size={args.batch_size}, threads={result['threads']}, "
+          f"learning_rate={args.learning_rate:.6g} ({result['samples_per_second']:.0f} samples/s)")
+    return result
+
+def scale_for_accumulation(args):
+    """Scale args.learning_rate from one batch to the accumulated batch (args.lr_scaling rule)"""
+    if args.accumulation_steps <= 1:
+        return
+    base_lr = args.learning_rate
+    args.learning_rate = scale_learning_rate(
+        base_lr, args.batch_size, args.batch_size * args.accumulation_steps, args.lr_scaling
+    )
+    print(f"Scaled learning rate {base_lr:g} -> {args.learning_rate:g} ({args.lr_scaling} rule) "
+          f"for {args.accumulation_steps} accumulated batches")
+
+def train_model(features, similar_pairs, args, stats=None, pair_weights=None, profiler=None,
+                tfrecord_dir=None, track_counts=None):
+    """
+    Train the content-based model using a custom training approach
     
-    print(f"Training with {len(anchor_features)} pairs")
+    Args:
+        features: Raw (unstandardized) feature matrix, array or memmap; batches
+            are gathered from it directly, without a tensor copy
+        similar_pairs: Array of (anchor, positive) track index pairs
+        args: Parsed command line arguments
+        stats: Optional precomputed RunningStats for the features
+        pair_weights: Optional per-pair loss weights (e.g. co-occurrence counts)
+        profiler: Optional MemoryProfiler recording dataset build and epoch stages
+        tfrecord_dir: Optional TFRecord export to stream pairs from; features,
+            similar_pairs and stats are then ignored
+        track_counts: Optional interactions per track for the negative sampler
+            (defaults to each track's number of pairs)
+    
+    With args.loss == 'infonce' the other positives of a batch are negatives, and
+    args.num_negatives extra negatives per step are drawn from popularity^alpha.
+    
+    With args.snapshot_every > 0 the full training state is saved to
+    args.snapshot_dir every that many steps and after every epoch; with
+    args.resume training continues exactly from the newest snapshot.
+    
+    With args.accumulation_steps = k > 1 every optimizer step sums the gradients
+    of k batches (the last step of an epoch may take fewer), weighted by their
+    total pair weight. args.optimizer selects Adam, LAMB or LARS. Steps, warmup
+    and snapshots count optimizer steps.
+    """
+    profiler = profiler or NULL_PROFILER
+    seed = getattr(args, 'seed', 42)
+    snapshot_every = getattr(args, 'snapshot_every', 0) or 0
+    snapshot_dir = getattr(args, 'snapshot_dir', None)
+    resume = getattr(args, 'resume', False)
+    
+    # Exact resume needs a reproducible run: deterministic kernels and data order
+    exact = bool(snapshot_every or resume)
+    if exact:
+        tf.keras.utils.set_random_seed(seed)
+        tf.config.experimental.enable_op_determinism()
+    
+    snapshot = None
+    if resume:
+        snapshot_path = latest_snapshot(snapshot_dir)
+        if snapshot_path is None:
+            print(f"No training state in {snapshot_dir}, starting from scratch")
+        else:
+            snapshot = load_array_snapshot(snapshot_path)
+            meta = snapshot[1]
+            # The cursor counts batches, so the run continues with the snapshot's settings
+            args.batch_size = meta['batch_size']
+            args.learning_rate = meta['learning_rate']
+            args.warmup_epochs = meta['warmup_epochs']
+            args.accumulation_steps = meta.get('accumulation_steps', 1)
+            args.optimizer = meta.get('optimizer', 'adam')
+            args.weight_decay = meta.get('weight_decay', 0.0)
+            seed = meta['seed']
+            print(f"Resuming from {snapshot_path} (epoch {meta['epoch'] + 1}, batch {meta['cursor']}, "
+                  f"step {meta['step']})")
+    
+    if tfrecord_dir:
+        with profiler.stage('dataset_build'):
+            _, val_dataset, manifest = load_tfrecord_datasets(tfrecord_dir, args.batch_size)
+        feature_dim = manifest['feature_dim']
+        means = np.array(manifest['means'])
+        stds = np.array(manifest['stds'])
+        num_pairs = sum(split['pairs'] for split in manifest['splits'].values())
+        train_pairs = manifest['splits']['train']['pairs']
+    else:
+        feature_dim = features.shape[1]
+        
+        # Compute standardization parameters; standardization happens lazily in the pipeline
+        if stats is None:
+            with profiler.stage('standardization'):
+                stats = compute_feature_stats(features)
+        means = stats.mean
+        stds = stats.safe_std()
+        
+        similar_pairs = np.asarray(similar_pairs, dtype=np.int64).reshape(-1, 2)
+        if pair_weights is None:
+            pair_weights = np.ones(len(similar_pairs), dtype=np.float32)
+        pair_weights = np.asarray(pair_weights, dtype=np.float32)
+        
+        # Aggregated pairs arrive sorted by track index; shuffle before the validation split
+        order = np.random.default_rng(seed).permutation(len(similar_pairs))
+        similar_pairs, pair_weights = similar_pairs[order], pair_weights[order]
+        num_pairs = len(similar_pairs)
+        
+        # Create TensorFlow datasets
+        with profiler.stage('dataset_build'):
+            train_size = int(len(similar_pairs) * (1 - args.validation_split))
+            train_pairs = train_size
+            val_dataset = make_pair_dataset(
+                features, means, stds, similar_pairs[train_size:], pair_weights[train_size:],
+                args.batch_size
+            )
+    
+    # Contrastive objective and popularity negative sampler
+    objective = getattr(args, 'loss', 'cosine')
+    temperature = getattr(args, 'temperature', 0.1)
+    num_negatives = getattr(args, 'num_negatives', 0) if objective == 'infonce' else 0
+    sampler = None
+    if num_negatives and tfrecord_dir:
+        print("Sampled negatives need the feature matrix; TFRecord training uses in-batch negatives only")
+        num_negatives = 0
+    if num_negatives:
+        if track_counts is None:
+            track_counts = np.bincount(similar_pairs.ravel(), minlength=len(features))
+        sampler = popularity_sampler(track_counts, getattr(args, 'negative_alpha', DEFAULT_ALPHA))
+        print(f"Sampling {num_negatives} negatives per step from popularity^"
+              f"{getattr(args, 'negative_alpha', DEFAULT_ALPHA)}")
+    
+    def sample_negatives(batch_index):
+        """Standardized features and log(M * q) of a batch's sampled negatives"""
+        if sampler is None:
+            return None, None
+        # Seeded by batch, so a resumed run draws the same negatives
+        indices = sampler.sample(num_negatives, np.random.default_rng([seed, batch_index]))
+        negatives = gather_standardized(features, indices, means.astype(np.float32), stds.astype(np.float32))
+        log_q = (np.log(num_negatives) + sampler.log_q(indices)).astype(np.float32)
+        return negatives, tf.constant(log_q[None, :])
+    
+    def epoch_dataset(epoch, skip_batches=0):
+        """Training batches of an epoch in a fixed order, starting after skip_batches"""
+        if tfrecord_dir:
+            train_dataset, _, _ = load_tfrecord_datasets(
+                tfrecord_dir, args.batch_size, seed=seed + epoch, deterministic=exact or None
+            )
+            return train_dataset.skip(skip_batches)
+        order = epoch_order(seed, epoch, train_pairs)[skip_batches * args.batch_size:]
+        return make_pair_dataset(
+            features, means, stds, similar_pairs[order], pair_weights[order], args.batch_size
+        )
+    
+    print(f"Training with {num_pairs} pairs")
     print(f"Feature dimension: {feature_dim}")
     print(f"Embedding dimension: {args.embedding_size}")
     
     # Create a simpler model for embedding
     print("Building model...")
-    model = tf.keras.Sequential([
-        tf.keras.layers.InputLayer(input_shape=(feature_dim,)),
-        tf.keras.layers.BatchNormalization(),
-        tf.keras.layers.Dense(args.embedding_size * 2, activation='relu',
-                             kernel_regularizer=tf.keras.regularizers.l2(0.01)),
-        tf.keras.layers.Dropout(0.2),
-        tf.keras.layers.Dense(args.embedding_size, activation='relu',
-                             kernel_regularizer=tf.keras.regularizers.l2(0.01)),
-        tf.keras.layers.Dropout(0.2),
-        tf.keras.layers.Dense(args.embedding_size, activation='tanh')
-    ])
+    model = build_embedding_model(feature_dim, args.embedding_size)
     
-    # Compile model
-    optimizer = tf.keras.optimizers.Adam(learning_rate=args.learning_rate)
+    # Large-batch mode: accumulated gradients and an optional layer-wise adaptive optimizer
+    accumulation_steps = getattr(args, 'accumulation_steps', 1) or 1
+    optimizer_name = getattr(args, 'optimizer', 'adam') or 'adam'
+    weight_decay = getattr(args, 'weight_decay', 0.0) or 0.0
+    optimizer = build_optimizer(optimizer_name, args.learning_rate, weight_decay)
+    accumulator = GradientAccumulator()
+    if accumulation_steps > 1 or optimizer_name != 'adam':
+        print(f"Optimizer {optimizer_name}, effective batch size {args.batch_size * accumulation_steps} "
+              f"({accumulation_steps} x {args.batch_size})")
     
     # Print model summary
     model.summary()
@@ -348,20 +825,6 @@ def train_model(features, similar_pairs, args):
     checkpoint_dir = Path('../data/models/checkpoints')
     checkpoint_dir.mkdir(parents=True, exist_ok=True)
     
-    # Create dataset
-    train_size = int(len(anchor_features) * (1 - args.validation_split))
-    train_anchor = anchor_features[:train_size]
-    train_positive = positive_features[:train_size]
-    val_anchor = anchor_features[train_size:]
-    val_positive = positive_features[train_size:]
-    
-    # Create TensorFlow datasets
-    train_dataset = tf.data.Dataset.from_tensor_slices((train_anchor, train_positive))
-    train_dataset = train_dataset.shuffle(buffer_size=1000).batch(args.batch_size)
-    
-    val_dataset = tf.data.Dataset.from_tensor_slices((val_anchor, val_positive))
-    val_dataset = val_dataset.batch(args.batch_size)
-    
     # Custom training loop
     print("\nStarting model training...")
     
@@ -371,67 +834,136 @@ def train_model(features, similar_pairs, args):
         'val_loss': []
     }
     
-    # Cosine similarity loss function
-    def cosine_distance(y_true, y_pred):
-        y_true = tf.nn.l2_normalize(y_true, axis=-1)
-        y_pred = tf.nn.l2_normalize(y_pred, axis=-1)
-        return -tf.reduce_sum(y_true * y_pred, axis=-1)
+    # Linear learning rate warmup (used with autotuned, scaled learning rates)
+    warmup_steps = math.ceil(
+        (getattr(args, 'warmup_epochs', None) or 0) * train_pairs / (args.batch_size * accumulation_steps)
+    )
+    if warmup_steps:
+        print(f"Warming up the learning rate over {warmup_steps} steps")
     
-    # Training loop
+    step = 0
+    batch_index = 0
+    start_epoch = 0
+    cursor = 0
+    epoch_loss = 0
+    num_batches = 0
     best_val_loss = float('inf')
-    for epoch in range(args.epochs):
-        print(f"Epoch {epoch+1}/{args.epochs}")
-        
-        # Training
-        epoch_loss = 0
-        num_batches = 0
-        
-        for anchor_batch, positive_batch in train_dataset:
-            with tf.GradientTape() as tape:
-                # Get embeddings
-                anchor_embedding = model(anchor_batch, training=True)
-                positive_embedding = model(positive_batch, training=True)
+    
+    if snapshot is not None:
+        groups, meta = snapshot
+        optimizer.build(model.trainable_variables)
+        for variable, value in zip(model.variables, groups.get('model', [])):
+            variable.assign(value)
+        for variable, value in zip(optimizer.variables, groups.get('optimizer', [])):
+            variable.assign(value)
+        restore_rng_state(meta['rng'])
+        history = meta['history']
+        best_val_loss = meta['best_val_loss']
+        step, start_epoch, cursor = meta['step'], meta['epoch'], meta['cursor']
+        epoch_loss, num_batches = meta['epoch_loss'], meta['num_batches']
+        batch_index = meta.get('batch_index', step)
+    
+    def save_snapshot(epoch, cursor):
+        """Save everything needed to continue after `step` steps"""
+        path = save_array_snapshot(
+            snapshot_dir, step,
+            {
+                'model': [variable.numpy() for variable in model.variables],
+                'optimizer': [variable.numpy() for variable in optimizer.variables]
+            },
+            {
+                'step': step, 'batch_index': batch_index, 'epoch': epoch, 'cursor': cursor,
+                'epoch_loss': epoch_loss, 'num_batches': num_batches,
+                'history': history, 'best_val_loss': float(best_val_loss),
+                'batch_size': args.batch_size, 'learning_rate': args.learning_rate,
+                'warmup_epochs': getattr(args, 'warmup_epochs', None), 'seed': seed,
+                'accumulation_steps': accumulation_steps, 'optimizer': optimizer_name,
+                'weight_decay': weight_decay,
+                'rng': capture_rng_state()
+            }
+        )
+        return path
+    
+    def apply_step(gradients, step):
+        """One optimizer step with warmup; returns the new step count"""
+        if warmup_steps:
+            optimizer.learning_rate.assign(args.learning_rate * warmup_factor(step, warmup_steps))
+        optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+        return step + 1
+    
+    # Training loop
+    for epoch in range(start_epoch, args.epochs):
+        with profiler.stage(f'epoch_{epoch+1}'):
+            print(f"Epoch {epoch+1}/{args.epochs}")
+            
+            # Training (a resumed epoch continues its running loss sums)
+            if epoch != start_epoch or not cursor:
+                epoch_loss = 0
+                num_batches = 0
+            
+            # Snapshots are taken between optimizer steps, so a window never spans a resume
+            for anchor_batch, positive_batch, weight_batch in epoch_dataset(epoch, num_batches):
+                negative_batch, negative_log_q = sample_negatives(batch_index)
+                loss, gradients = pair_gradients(model, anchor_batch, positive_batch, weight_batch,
+                                                 objective, temperature, negative_batch, negative_log_q)
+                batch_index += 1
+            
+                epoch_loss += float(loss.numpy())
+                num_batches += 1
+                profiler.check()
                 
-                # Calculate loss
-                loss = tf.reduce_mean(cosine_distance(anchor_embedding, positive_embedding))
+                if accumulation_steps > 1:
+                    accumulator.add(gradients, tf.reduce_sum(weight_batch))
+                    if accumulator.count < accumulation_steps:
+                        continue
+                    gradients = accumulator.mean()
+                    accumulator.reset()
+                step = apply_step(gradients, step)
                 
-            # Apply gradients
-            gradients = tape.gradient(loss, model.trainable_variables)
-            optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+                if snapshot_every and step % snapshot_every == 0:
+                    save_snapshot(epoch, num_batches)
             
-            epoch_loss += loss.numpy()
-            num_batches += 1
-        
-        avg_train_loss = epoch_loss / num_batches if num_batches > 0 else 0
-        
-        # Validation
-        val_loss = 0
-        num_val_batches = 0
-        
-        for anchor_batch, positive_batch in val_dataset:
-            # Get embeddings
-            anchor_embedding = model(anchor_batch, training=False)
-            positive_embedding = model(positive_batch, training=False)
+            # A partial window at the end of the epoch still makes a step
+            if accumulator.count:
+                step = apply_step(accumulator.mean(), step)
+                accumulator.reset()
             
-            # Calculate loss
-            batch_val_loss = tf.reduce_mean(cosine_distance(anchor_embedding, positive_embedding))
-            val_loss += batch_val_loss.numpy()
-            num_val_batches += 1
-        
-        avg_val_loss = val_loss / num_val_batches if num_val_batches > 0 else 0
-        
-        # Save history
-        history['loss'].append(float(avg_train_loss))
-        history['val_loss'].append(float(avg_val_loss))
-        
-        print(f"  loss: {avg_train_loss:.4f} - val_loss: {avg_val_loss:.4f}")
-        
-        # Save checkpoint if validation loss improved
-        if avg_val_loss < best_val_loss:
-            best_val_loss = avg_val_loss
-            checkpoint_path = checkpoint_dir / f'content_model_{epoch+1:02d}_{avg_val_loss:.4f}.keras'
-            model.save(str(checkpoint_path))
-            print(f"  Saved checkpoint to {checkpoint_path}")
+            avg_train_loss = epoch_loss / num_batches if num_batches > 0 else 0
+            
+            # Validation
+            val_loss = 0
+            num_val_batches = 0
+            
+            for anchor_batch, positive_batch, weight_batch in val_dataset:
+                # Get embeddings
+                anchor_embedding = model(anchor_batch, training=False)
+                positive_embedding = model(positive_batch, training=False)
+            
+                # Calculate loss
+                batch_val_loss = pair_loss(anchor_embedding, positive_embedding, weight_batch,
+                                           objective, temperature)
+                val_loss += batch_val_loss.numpy()
+                num_val_batches += 1
+            
+            avg_val_loss = val_loss / num_val_batches if num_val_batches > 0 else 0
+            
+            # Save history
+            history['loss'].append(float(avg_train_loss))
+            history['val_loss'].append(float(avg_val_loss))
+            
+            print(f"  loss: {avg_train_loss:.4f} - val_loss: {avg_val_loss:.4f}")
+            
+            # Save checkpoint if validation loss improved
+            if avg_val_loss < best_val_loss:
+                best_val_loss = avg_val_loss
+                checkpoint_path = checkpoint_dir / f'content_model_{epoch+1:02d}_{avg_val_loss:.4f}.keras'
+                model.save(str(checkpoint_path))
+                print(f"  Saved checkpoint to {checkpoint_path}")
+            
+            if snapshot_every:
+                epoch_loss = 0
+                num_batches = 0
+                print(f"  Saved training state to {save_snapshot(epoch + 1, 0)}")
     
     # Save model
     model_dir = Path('../data/models')
@@ -491,16 +1023,28 @@ def create_model(input_dim, embedding_size, learning_rate=0.001):
     
     return model
 
-def save_model_and_metadata(model, history, track_ids, means, stds):
+def save_model_and_metadata(model, history, track_ids, means, stds, autotune_result=None,
+                            student=None, distillation=None, features=None):
     """
     Save the trained model and associated metadata
     
     Args:
         model: Trained TensorFlow model
         history: Training history object
-        track_ids: List of track IDs corresponding to the training data
+        track_ids: List of track IDs corresponding to the training data (stored in the artifact bundle)
         means: Mean values used for feature standardization
         stds: Standard deviation values used for feature standardization
+        autotune_result: Optional settings chosen by --autotune, recorded in the metadata
+        student: Optional distilled serving model, saved next to the model and
+            exported for NumPy inference
+        distillation: Optional distillation report, recorded in the metadata
+        features: Raw feature matrix in track_ids order (array or memmap); the
+            catalog embeddings computed from it are stored in the artifact bundle
+    
+    Raises:
+        ModelSaveError: If the model or the student could not be saved or the
+            embeddings could not be computed; raised after the bundle and
+            metadata are written
     """
     if tf is None:
         raise ImportError("TensorFlow is required to save the model")
@@ -509,27 +1053,80 @@ def save_model_and_metadata(model, history, track_ids, means, stds):
     model_dir = os.path.join(os.path.dirname(__file__), "../src/aiml/models/saved")
     os.makedirs(model_dir, exist_ok=True)
     
-    # Save the model
-    model_path = os.path.join(model_dir, "content_model")
-    model.save(model_path)
-    print(f"Model saved to {model_path}")
+    # Save the model (Keras 3 requires the .keras extension). The artifact bundle and
+    # metadata do not depend on it, so failures are collected and raised at the end.
+    failures = []
+    model_path = os.path.join(model_dir, "content_model.keras")
+    try:
+        model.save(model_path)
+        print(f"Model saved to {model_path}")
+    except Exception as e:
+        print(f"Error saving model to {model_path}: {e}", file=sys.stderr)
+        failures.append((model_path, e))
+
+    if student is not None:
+        # Saved independently of the teacher, so a failed teacher save keeps the student
+        student_path = os.path.join(model_dir, "content_model_student.keras")
+        student_npz_path = os.path.join(model_dir, "content_model_student.npz")
+        try:
+            student.save(student_path)
+            print(f"Distilled student saved to {student_path}")
+        except Exception as e:
+            print(f"Error saving distilled student to {student_path}: {e}", file=sys.stderr)
+            failures.append((student_path, e))
+        try:
+            export_numpy_model(student, student_npz_path, means, stds)
+            print(f"Distilled student exported to {student_npz_path}")
+        except Exception as e:
+            print(f"Error exporting distilled student to {student_npz_path}: {e}", file=sys.stderr)
+            failures.append((student_npz_path, e))
+    
+    # Catalog embeddings for the serving tools, computed without TensorFlow's per-call overhead
+    embeddings = None
+    if features is None:
+        print("No track features available; the artifact bundle has no embeddings", file=sys.stderr)
+    else:
+        try:
+            embeddings = to_numpy_model(model, means, stds).embed(features)
+            print(f"Computed {embeddings.shape[0]} catalog embeddings")
+        except Exception as e:
+            print(f"Error computing catalog embeddings: {e}", file=sys.stderr)
+            failures.append(('catalog embeddings', e))
+    
+    # Save track ids, normalization and embeddings as a new version of the artifact bundle
+    history_dict = getattr(history, 'history', history)
+    artifact_dir = os.path.join(model_dir, "artifact")
+    manifest = publish_artifact(artifact_dir, track_ids, means, stds, embeddings=embeddings,
+                                history=history_dict)
+    print(f"Artifact bundle {manifest['model_version']} published to {artifact_dir}")
     
     # Save metadata
     metadata = {
-        "track_ids": track_ids,
+        "artifact_dir": "artifact",
+        "model_version": manifest["model_version"],
+        "num_tracks": manifest["num_tracks"],
         "means": means.tolist() if hasattr(means, "tolist") else means,
         "stds": stds.tolist() if hasattr(stds, "tolist") else stds,
-        "training_loss": history.history["loss"][-1] if history.history["loss"] else None,
-        "val_loss": history.history["val_loss"][-1] if "val_loss" in history.history and history.history["val_loss"] else None,
-        "embedding_size": model.layers[-1].output_shape[-1],
-        "date_trained": datetime.datetime.now().isoformat()
+        "training_loss": history_dict["loss"][-1] if history_dict["loss"] else None,
+        "val_loss": history_dict["val_loss"][-1] if "val_loss" in history_dict and history_dict["val_loss"] else None,
+        "embedding_size": model.output_shape[-1],
+        "date_trained": datetime.now().isoformat()
     }
+    if autotune_result is not None:
+        metadata["autotune"] = autotune_result
+    if distillation is not None:
+        metadata["distillation"] = distillation
     
     metadata_path = os.path.join(model_dir, "metadata.json")
     with open(metadata_path, "w") as f:
         json.dump(metadata, f, indent=2)
     
     print(f"Metadata saved to {metadata_path}")
+    
+    if failures:
+        raise ModelSaveError(
+            "Could not save " + "; ".join(f"{name} ({e})" for name, e in failures)
+        ) from failures[0][1]
 
 def main():
     """Main function to train the content-based model"""
@@ -545,47 +1142,213 @@ def main():
     parser.add_argument('--validation-split', type=float, default=0.2, help='Validation data split ratio')
     parser.add_argument('--learning-rate', type=float, default=0.001, help='Learning rate')
     parser.add_argument('--embedding-size', type=int, default=64, help='Size of track embeddings')
+    parser.add_argument('--raw-pairs', action='store_true',
+                        help='Train on one pair per user instead of weighted unique co-occurrence pairs')
+    parser.add_argument('--min-cooccurrence', type=int, default=1,
+                        help='Drop track pairs shared by fewer users than this')
+    parser.add_argument('--pair-weighting', choices=WEIGHTING_SCHEMES, default='count',
+                        help='Weighting scheme for co-occurrence pairs')
+    parser.add_argument('--profile-memory', nargs='?', const='../data/models/memory_profile.json',
+                        default=None, metavar='REPORT_PATH',
+                        help='Record peak RSS and top allocators per stage and write a JSON report')
+    parser.add_argument('--memory-budget', action='append', default=[], metavar='STAGE=MB',
+                        help='Abort when a stage (prefix match, e.g. epoch=6000 or default=8000) exceeds MB of RSS')
+    parser.add_argument('--tfrecord-dir', type=str,
+                        help='Train from a TFRecord export instead of the database (its split is used)')
+    parser.add_argument('--export-tfrecords', type=str, metavar='EXPORT_DIR',
+                        help='Export the fetched pairs to TFRecord shards and train from them')
+    parser.add_argument('--num-shards', type=int, default=16, help='Shards per split for --export-tfrecords')
+    parser.add_argument('--offline-db', type=str, metavar='SQLITE_PATH',
+                        help='Read training data from an offline SQLite database instead of Postgres')
+    parser.add_argument('--autotune', action='store_true',
+                        help='Probe batch sizes and thread counts and train with the fastest configuration')
+    parser.add_argument('--autotune-max-batch-size', type=int, default=8192,
+                        help='Largest batch size --autotune probes (starting from --batch-size)')
+    parser.add_argument('--autotune-steps', type=int, default=20, help='Timed steps per autotune probe')
+    parser.add_argument('--autotune-memory-mb', type=float,
+                        help='Peak memory budget for --autotune (default: 80%% of physical memory)')
+    parser.add_argument('--lr-scaling', choices=LR_SCALING_RULES, default='sqrt',
+                        help='How --autotune and --accumulation-steps scale --learning-rate with the batch size')
+    parser.add_argument('--warmup-epochs', type=float, default=None,
+                        help='Linear learning rate warmup (default: 1 with --autotune or large-batch mode, else none)')
+    parser.add_argument('--accumulation-steps', type=int, default=1, metavar='K',
+                        help='Sum the gradients of K batches per optimizer step (effective batch K * --batch-size)')
+    parser.add_argument('--optimizer', choices=OPTIMIZERS, default='adam',
+                        help='lamb and lars scale each layer\'s step by its weight norm for large batches')
+    parser.add_argument('--weight-decay', type=float, default=0.0,
+                        help='Decoupled weight decay of weight matrices for --optimizer lamb/lars')
+    parser.add_argument('--loss', choices=LOSSES, default='cosine',
+                        help='cosine pulls positives together; infonce also pushes in-batch negatives apart')
+    parser.add_argument('--temperature', type=float, default=0.1, help='InfoNCE softmax temperature')
+    parser.add_argument('--num-negatives', type=int, default=0,
+                        help='Extra popularity-sampled negatives per step for --loss infonce')
+    parser.add_argument('--negative-alpha', type=float, default=DEFAULT_ALPHA,
+                        help='Popularity exponent of the negative sampler (0 = uniform)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the validation split and data order')
+    parser.add_argument('--snapshot-every', type=int, default=0, metavar='STEPS',
+                        help='Save the full training state every STEPS steps and after every epoch')
+    parser.add_argument('--snapshot-dir', type=str, default='../data/models/training_state',
+                        help='Directory of training state snapshots')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue exactly from the newest snapshot in --snapshot-dir')
+    parser.add_argument('--distill-size', type=int, default=0, metavar='DIM',
+                        help='After training, distill a compact serving model with this embedding size (e.g. 16-32)')
+    parser.add_argument('--distill-hidden', type=int,
+                        help='Hidden width of the distilled model (default: 2 * --distill-size)')
+    parser.add_argument('--distill-epochs', type=int, default=100, help='Distillation passes over the catalog')
+    parser.add_argument('--distill-loss', choices=DISTILLATION_LOSSES, default='listwise',
+                        help='listwise preserves neighbor order; similarity matches cosine similarities')
     args = parser.parse_args()
     
+    if args.accumulation_steps < 1:
+        parser.error('--accumulation-steps must be at least 1')
+    if args.distill_size and args.tfrecord_dir:
+        parser.error('--distill-size needs the track features; run distill_model.py on the exported model instead')
+    
+    try:
+        budgets = parse_budgets(args.memory_budget)
+    except ValueError as e:
+        parser.error(str(e))
+    profiler = MemoryProfiler(
+        enabled=bool(args.profile_memory or budgets),
+        budgets=budgets,
+        trace_allocations=bool(args.profile_memory)
+    )
+    
     print(f"Training with parameters: epochs={args.epochs}, batch_size={args.batch_size}, "
           f"validation_split={args.validation_split}, learning_rate={args.learning_rate}, "
           f"embedding_size={args.embedding_size}")
     
-    # Load environment variables
-    env_vars = load_env_variables()
+    # A resumed run keeps the batch size and learning rate of its snapshot
+    resuming = args.resume and latest_snapshot(args.snapshot_dir) is not None
+    large_batch = args.accumulation_steps > 1 or args.optimizer != 'adam'
+    if large_batch and args.warmup_epochs is None:
+        args.warmup_epochs = 1.0
     
-    # Connect to database
-    conn = connect_to_database(env_vars)
-    if not conn:
-        print("Failed to connect to database. Exiting.")
-        sys.exit(1)
+    if args.tfrecord_dir:
+        # Track ids and normalization come from the export, so the database is not needed
+        manifest = load_tfrecord_manifest(args.tfrecord_dir)
+        if 'artifact_dir' not in manifest:
+            print(f"TFRecord export {args.tfrecord_dir} has no track ids. Exiting.")
+            sys.exit(1)
+        artifact = load_artifact(Path(args.tfrecord_dir) / manifest['artifact_dir'])
+        track_ids = artifact.track_ids()
+        means, stds = artifact.means, artifact.stds
+        features = artifact.features if artifact.has('features') else None
+        
+        autotune_result = None
+        if args.autotune and not resuming:
+            autotune_result = autotune_training(args, tfrecord_dir=args.tfrecord_dir)
+        if not resuming:
+            scale_for_accumulation(args)
+        
+        try:
+            model, history = train_model(None, None, args, profiler=profiler, tfrecord_dir=args.tfrecord_dir)
+        except MemoryBudgetExceeded as e:
+            print(f"Aborting training: {e}")
+            if args.profile_memory:
+                profiler.write_report(args.profile_memory)
+            sys.exit(1)
+        
+        try:
+            save_model_and_metadata(model, history, track_ids, means, stds, autotune_result, features=features)
+        except ModelSaveError as e:
+            print(f"Training finished, but the outputs are incomplete: {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            if args.profile_memory:
+                profiler.write_report(args.profile_memory)
+        print("Training completed successfully!")
+        return
     
-    # Fetch training data
-    features, similar_pairs, track_ids = fetch_training_data(conn)
-    conn.close()
+    if args.offline_db:
+        conn = SQLiteDataSource(args.offline_db)
+    else:
+        # Load environment variables
+        env_vars = load_env_variables()
+        
+        # Connect to database
+        conn = connect_to_database(env_vars)
+        if not conn:
+            print("Failed to connect to database. Exiting.")
+            sys.exit(1)
     
-    if features is None or similar_pairs is None or track_ids is None:
-        print("Failed to fetch training data. Exiting.")
+    try:
+        # Fetch training data
+        features, similar_pairs, track_ids, pair_weights, track_counts, stats = fetch_training_data(
+            conn,
+            aggregate_pairs=not args.raw_pairs,
+            min_cooccurrence=args.min_cooccurrence,
+            pair_weighting=args.pair_weighting,
+            profiler=profiler,
+            return_counts=True,
+            return_stats=True
+        )
+        conn.close()
+        
+        if features is None or similar_pairs is None or track_ids is None:
+            print("Failed to fetch training data. Exiting.")
+            sys.exit(1)
+        
+        # Statistics were accumulated during ingest; train_model standardizes lazily
+        means, stds = stats.mean, stats.safe_std()
+        
+        # Probe before the export so the thread count is set before TensorFlow starts
+        autotune_result = None
+        if args.autotune and not resuming:
+            autotune_result = autotune_training(args, features, similar_pairs, pair_weights, stats)
+        if not resuming:
+            scale_for_accumulation(args)
+        
+        if args.export_tfrecords:
+            with profiler.stage('tfrecord_export'):
+                export_tfrecords(
+                    args.export_tfrecords, features, similar_pairs,
+                    pair_weights=pair_weights, stats=stats, track_ids=track_ids,
+                    num_shards=args.num_shards, validation_split=args.validation_split
+                )
+            # Release the in-memory pairs and stream from the shards instead; the
+            # features stay for the catalog embeddings
+            similar_pairs = pair_weights = None
+        
+        # Train the model
+        model, history = train_model(
+            features, similar_pairs, args,
+            stats=stats, pair_weights=pair_weights, profiler=profiler,
+            tfrecord_dir=args.export_tfrecords, track_counts=track_counts
+        )
+        
+        # Distill a compact serving model that keeps the trained model's neighbors
+        student = distillation = None
+        if args.distill_size:
+            with profiler.stage('distillation'):
+                student, distillation = distill_and_report(
+                    to_numpy_model(model, means, stds), features, means, stds,
+                    embedding_size=args.distill_size,
+                    hidden_units=args.distill_hidden,
+                    epochs=args.distill_epochs,
+                    objective=args.distill_loss,
+                    seed=args.seed
+                )
+            print(f"Distilled {distillation['teacher_dim']} -> {distillation['student_dim']} dims: "
+                  f"overlap@10 {distillation['overlap@10']:.3f}, "
+                  f"inference {distillation['inference_speedup']:.1f}x, search {distillation['search_speedup']:.1f}x")
+    except MemoryBudgetExceeded as e:
+        print(f"Aborting training: {e}")
+        if args.profile_memory:
+            profiler.write_report(args.profile_memory)
         sys.exit(1)
     
-    # Standardize features
-    standardized_features, means, stds = standardize_features(features)
-    
-    # Create and train the model
-    model = create_model(standardized_features.shape[1], args.embedding_size, args.learning_rate)
-    
-    # Train the model
-    history = train_model(
-        model, 
-        standardized_features, 
-        similar_pairs, 
-        args.epochs, 
-        args.batch_size, 
-        args.validation_split
-    )
-    
     # Save the model and metadata
-    save_model_and_metadata(model, history, track_ids, means, stds)
+    try:
+        save_model_and_metadata(model, history, track_ids, means, stds, autotune_result, student, distillation,
+                                features)
+    except ModelSaveError as e:
+        print(f"Training finished, but the outputs are incomplete: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if args.profile_memory:
+            profiler.write_report(args.profile_memory)
     
     print("Training completed successfully!")
 
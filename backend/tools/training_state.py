@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Crash-Safe Training State Snapshots
+
+This module writes and finds full training-state snapshots, so a preempted or
+OOM-killed run can continue exactly where it stopped. A snapshot holds
+everything that determines the rest of the run:
+
+- model variables (including BatchNorm statistics and dropout seed state)
+- optimizer slots (Adam moments and iteration counter)
+- global step, epoch and the batch cursor inside the epoch
+- RNG state and the running loss sums of the unfinished epoch
+- history and the best val_loss so far
+
+Snapshots are written to a temporary file, fsynced and renamed over the final
+name, so a crash mid-write never leaves a truncated snapshot behind. Only the
+newest `keep` snapshots are kept. The data order of each epoch is a pure function
+of (seed, epoch), so resuming needs only the cursor, not the consumed data.
+
+Usage:
+python training_state.py ../data/models/training_state
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import numpy as np
+from pathlib import Path
+
+SNAPSHOT_PREFIX = 'state-'
+
+# Snapshots kept per directory
+DEFAULT_KEEP = 2
+
+def snapshot_path(state_dir, step, extension='.npz'):
+    """Path of the snapshot taken after `step` optimizer steps"""
+    return Path(state_dir) / f'{SNAPSHOT_PREFIX}{step:012d}{extension}'
+
+def write_atomically(path, write):
+    """
+    Write a file via a temporary file, fsync and rename
+
+    Args:
+        path: Final path
+        write: Callable receiving the open binary file
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    try:
+        # Persist the rename itself
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+def list_snapshots(state_dir):
+    """Complete snapshots in a directory, oldest first"""
+    state_dir = Path(state_dir)
+    if not state_dir.is_dir():
+        return []
+    return sorted(path for path in state_dir.glob(f'{SNAPSHOT_PREFIX}*') if not path.name.endswith('.tmp'))
+
+def latest_snapshot(state_dir):
+    """Newest complete snapshot, or None"""
+    snapshots = list_snapshots(state_dir)
+    return snapshots[-1] if snapshots else None
+
+def prune_snapshots(state_dir, keep=DEFAULT_KEEP):
+    """Delete all but the newest `keep` snapshots"""
+    for path in list_snapshots(state_dir)[:-keep]:
+        path.unlink()
+
+def save_array_snapshot(state_dir, step, groups, meta, keep=DEFAULT_KEEP):
+    """
+    Save lists of arrays and a JSON-serializable metadata dictionary
+
+    Args:
+        state_dir: Snapshot directory
+        step: Global step (orders the snapshots)
+        groups: {"model": [arrays], "optimizer": [arrays], ...}
+        meta: Dictionary of scalars, lists and nested dictionaries
+
+    Returns:
+        Path of the snapshot
+    """
+    arrays = {'meta': np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)}
+    for group, values in groups.items():
+        for i, value in enumerate(values):
+            arrays[f'{group}_{i:05d}'] = np.asarray(value)
+
+    path = snapshot_path(state_dir, step)
+    write_atomically(path, lambda f: np.savez(f, **arrays))
+    prune_snapshots(state_dir, keep)
+    return path
+
+def load_array_snapshot(path):
+    """
+    Load a snapshot written by save_array_snapshot
+
+    Returns:
+        Tuple of (groups, meta)
+    """
+    groups = {}
+    with np.load(path) as data:
+        meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+        for name in sorted(data.files):
+            if name == 'meta':
+                continue
+            group, _, _ = name.rpartition('_')
+            groups.setdefault(group, []).append(data[name])
+    return groups, meta
+
+def epoch_order(seed, epoch, size):
+    """Data order of an epoch; the same (seed, epoch) always gives the same permutation"""
+    return np.random.default_rng([seed, epoch]).permutation(size)
+
+def capture_rng_state():
+    """Python and NumPy global RNG state as a JSON-serializable dictionary"""
+    version, internal, gauss_next = random.getstate()
+    name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    return {
+        'python': [version, list(internal), gauss_next],
+        'numpy': [name, keys.tolist(), int(position), int(has_gauss), float(cached_gaussian)]
+    }
+
+def restore_rng_state(state):
+    """Restore the state returned by capture_rng_state"""
+    version, internal, gauss_next = state['python']
+    random.setstate((version, tuple(internal), gauss_next))
+    name, keys, position, has_gauss, cached_gaussian = state['numpy']
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), position, has_gauss, cached_gaussian))
+
+def main():
+    """Describe the snapshots in a state directory"""
+    parser = argparse.ArgumentParser(description='Inspect training state snapshots')
+    parser.add_argument('state_dir', type=str, help='Snapshot directory')
+    args = parser.parse_args()
+
+    snapshots = list_snapshots(args.state_dir)
+    if not snapshots:
+        print(f"No snapshots in {args.state_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    summary = []
+    for path in snapshots:
+        entry = {'path': str(path), 'size_mb': round(path.stat().st_size / (1024 * 1024), 2)}
+        if path.suffix == '.npz':
+            _, meta = load_array_snapshot(path)
+            entry.update({key: meta.get(key) for key in ['step', 'epoch', 'cursor', 'best_val_loss']})
+        summary.append(entry)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()